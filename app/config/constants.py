@@ -23,6 +23,46 @@ OUTPUT_FIGS = OUTPUT_DIR / FIGS
 OUTPUT_JSONS = OUTPUT_DIR / JSONS
 OUTPUT_DEEPSCOPES = OUTPUT_DIR / DEEPSCOPE
 
+# Persistent embedding store shared by all workers (kept out of the mounted output dirs)
+EMBEDDING_STORE_DIR = Path(os.environ.get("EMBEDDING_STORE_DIR", BASE_DIR / "cache" / "embeddings"))
+EMBEDDING_STORE_SHARD_ROWS = int(os.environ.get("EMBEDDING_STORE_SHARD_ROWS", 65536))
+
+# Exported (and quantized) ONNX graphs of the ONNX Runtime embedding models
+ONNX_MODEL_DIR = Path(os.environ.get("ONNX_MODEL_DIR", BASE_DIR / "cache" / "onnx"))
+
+# CSV uploads are spooled here in chunks before being scanned, instead of held in memory
+UPLOAD_SPOOL_DIR = Path(os.environ.get("UPLOAD_SPOOL_DIR", BASE_DIR / "cache" / "uploads"))
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_BYTES", 1024 * 1024))
+
+# Default in-memory embedding cache budget per model (bytes)
+EMBEDDING_CACHE_BYTES = int(os.environ.get("EMBEDDING_CACHE_BYTES", 256 * 1024 * 1024))
+
+# Default storage precision of cached embeddings and cosine kernels: float32, float16 or int8
+EMBEDDING_PRECISION = os.environ.get("EMBEDDING_PRECISION", "float32")
+
+# Seconds an embedding model may stay unused before it is unloaded (unset keeps models loaded)
+EMBEDDING_MODEL_IDLE_TTL = float(os.environ["EMBEDDING_MODEL_IDLE_TTL"]) if "EMBEDDING_MODEL_IDLE_TTL" in os.environ else None
+
+# Executors keeping embedding inference and distance kernels off the event loop
+EMBEDDING_EXECUTOR_WORKERS = int(os.environ.get("EMBEDDING_EXECUTOR_WORKERS", 1))
+DISTANCE_EXECUTOR_WORKERS = int(os.environ.get("DISTANCE_EXECUTOR_WORKERS", os.cpu_count() or 1))
+EXECUTOR_QUEUE_SIZE = int(os.environ.get("EXECUTOR_QUEUE_SIZE", 32))
+
+# Long-lived worker processes for use_worker requests (0 disables them), and pairs per task
+WORKER_POOL_PROCESSES = int(os.environ.get("WORKER_POOL_PROCESSES", os.cpu_count() or 1))
+WORKER_CHUNK_PAIRS = int(os.environ.get("WORKER_CHUNK_PAIRS", 65536))
+
+# Blocks of a blocked CSV run processed at once, and the estimated pairs they may hold in flight together
+BLOCK_CONCURRENCY = int(os.environ.get("BLOCK_CONCURRENCY", os.cpu_count() or 1))
+BLOCK_COST_BUDGET = int(os.environ.get("BLOCK_COST_BUDGET", 50_000_000))
+
+# Cross-request micro-batching of embedding inference
+EMBEDDING_BATCH_WAIT_MS = float(os.environ.get("EMBEDDING_BATCH_WAIT_MS", 5))
+EMBEDDING_BATCH_MAX_TEXTS = int(os.environ.get("EMBEDDING_BATCH_MAX_TEXTS", 512))
+
+# Padded-token budget of one HuggingFace encode batch; 0 falls back to fixed-size batches
+EMBEDDING_MAX_BATCH_TOKENS = int(os.environ.get("EMBEDDING_MAX_BATCH_TOKENS", 16384)) or None
+
 # URL prefixes
 STATIC_URL = f"/{STATIC}"
 OUTPUT_FIGS_URL = f"/{FIGS}"
@@ -42,7 +42,7 @@ class DistanceInput(BaseModel):
     )
     tokenization: Optional[str] = Field(
         default="words",
-        description="Tokenization method for token-based distances"
+        description="Deprecated and ignored: token distance types carry their tokenization (e.g. jaccard_ngrams)"
     )
     use_worker: bool = False
     batch_size: int = 32
@@ -82,6 +82,10 @@ class CSVDistanceInput(BaseModel):
         default=" ",
         description="Separator for concatenating field values."
     )
+    preserved_columns: Optional[List[str]] = Field(
+        default=None,
+        description="Columns to carry with each string. When given together with fields, only the fields, blocking keys and these columns are read from the CSV; by default every column is read and kept."
+    )
 
     # Distance configuration
     distance_types: List[DistanceType] = Field(
@@ -94,13 +98,17 @@ class CSVDistanceInput(BaseModel):
     )
     tokenization: str = Field(
         default="words",
-        description="Tokenization method for token-based distances."
+        description="Deprecated and ignored: token distance types carry their tokenization (e.g. jaccard_ngrams)."
     )
 
     # Processing options
-    compare_mode: Literal["all_pairs", "consecutive"] = Field(
+    compare_mode: Literal["all_pairs", "consecutive", "knn"] = Field(
         default="all_pairs",
-        description="How to compare rows."
+        description="How to compare rows. knn only compares each row with its nearest candidates."
+    )
+    knn_neighbors: int = Field(
+        default=15,
+        description="Candidates per row in knn compare mode."
     )
     batch_size: int = Field(
         default=32,
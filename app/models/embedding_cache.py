@@ -0,0 +1,99 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .embedding_precision import check_precision, quantize_rows, dequantize_rows
+
+
+class EmbeddingCache:
+    """In-memory embedding cache with a byte budget and LRU eviction.
+
+    Resident bytes count the embedding buffers plus the text keys. When an
+    insert pushes the cache over `max_bytes`, least recently used entries are
+    evicted until it fits again. A `max_bytes` of None disables the budget.
+
+    Entries are kept at `precision` ("float32", "float16" or "int8" with a
+    per-vector scale) and decoded back to float32 by `get`, so the same budget
+    holds two or four times as many embeddings at the reduced precisions.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, precision: str = "float32"):
+        self.max_bytes = max_bytes
+        self.precision = check_precision(precision)
+        self._entries: OrderedDict[str, Tuple[np.ndarray, Optional[np.ndarray]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_bytes(text: str, entry: Tuple[np.ndarray, Optional[np.ndarray]]) -> int:
+        values, scale = entry
+        return values.nbytes + (scale.nbytes if scale is not None else 0) + sys.getsizeof(text)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, text: str) -> bool:
+        return text in self._entries
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for `text`, marking it as recently used."""
+        with self._lock:
+            entry = self._entries.get(text)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(text)
+            self.hits += 1
+        return dequantize_rows(*entry)
+
+    def put(self, text: str, embedding: np.ndarray) -> None:
+        """Insert an embedding, evicting least recently used entries beyond the budget."""
+        entry = quantize_rows(embedding, self.precision)
+        # A row view would pin its whole batch array and hide it from the budget
+        if entry[0].base is not None:
+            entry = (entry[0].copy(), entry[1])
+
+        size = self._entry_bytes(text, entry)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(text, None)
+            if previous is not None:
+                self.resident_bytes -= self._entry_bytes(text, previous)
+
+            self._entries[text] = entry
+            self.resident_bytes += size
+
+            while self.max_bytes is not None and self.resident_bytes > self.max_bytes:
+                evicted_text, evicted = self._entries.popitem(last=False)
+                self.resident_bytes -= self._entry_bytes(evicted_text, evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every entry; counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self.resident_bytes = 0
+
+    def stats(self) -> Dict:
+        """Hit-rate and size metrics for sizing the budget."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "resident_bytes": self.resident_bytes,
+            "max_bytes": self.max_bytes,
+            "precision": self.precision,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions
+        }
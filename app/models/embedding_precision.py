@@ -0,0 +1,95 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "int8")
+
+# Symmetric int8 range; -128 is left unused so the scale maps max |x| to 127
+_INT8_MAX = 127
+
+
+def check_precision(precision: str) -> str:
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unsupported embedding precision {precision!r}, expected one of {PRECISIONS}")
+    return precision
+
+
+def quantize_rows(embeddings: np.ndarray, precision: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Convert float embedding rows to the storage precision.
+
+    Returns:
+        Tuple of (values in the storage dtype, float32 per-row scales for int8
+        or None for float precisions)
+    """
+    check_precision(precision)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if precision == "float32":
+        return embeddings, None
+    if precision == "float16":
+        return embeddings.astype(np.float16), None
+
+    scales = np.abs(embeddings).max(axis=-1, keepdims=True) / _INT8_MAX
+    scales[scales == 0] = 1.0
+    values = np.rint(embeddings / scales).astype(np.int8)
+    return values, scales[..., 0].astype(np.float32)
+
+
+def dequantize_rows(values: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    """Recover float32 rows from `quantize_rows` output."""
+    if scales is None:
+        return values if values.dtype == np.float32 else values.astype(np.float32)
+    return values.astype(np.float32) * np.asarray(scales, dtype=np.float32)[..., None]
+
+
+class QuantizedEmbeddings:
+    """Embedding matrix held at float32, float16 or int8 precision.
+
+    int8 rows carry one float32 scale each (max |x| / 127), so a row is read
+    back as values * scale. Rows are only decoded to float32 when a kernel
+    reads them, a tile at a time, so the resident matrix stays at 1/2 (float16)
+    or about 1/4 (int8) of its float32 size.
+    """
+
+    def __init__(self, values: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.values = values
+        self.scales = scales
+
+    @classmethod
+    def quantize(cls, embeddings: np.ndarray, precision: str = "float32") -> 'QuantizedEmbeddings':
+        return cls(*quantize_rows(embeddings, precision))
+
+    @classmethod
+    def wrap(cls, embeddings) -> 'QuantizedEmbeddings':
+        """Accept either a QuantizedEmbeddings or a plain float array."""
+        if isinstance(embeddings, cls):
+            return embeddings
+        return cls.quantize(embeddings, "float32")
+
+    @property
+    def precision(self) -> str:
+        return "int8" if self.scales is not None else self.values.dtype.name
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.values.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def rows(self, start: int, stop: int) -> np.ndarray:
+        """Decode a contiguous block of rows to float32."""
+        scales = self.scales[start:stop] if self.scales is not None else None
+        return dequantize_rows(self.values[start:stop], scales)
+
+    def take(self, indices: Sequence[int]) -> np.ndarray:
+        """Decode the rows at `indices` to float32."""
+        scales = self.scales[indices] if self.scales is not None else None
+        return dequantize_rows(self.values[indices], scales)
+
+    def decode(self) -> np.ndarray:
+        return dequantize_rows(self.values, self.scales)
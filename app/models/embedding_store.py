@@ -0,0 +1,164 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import uuid
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from ..config.constants import EMBEDDING_STORE_DIR, EMBEDDING_STORE_SHARD_ROWS
+from ..config.loggers import get_and_set_logger
+
+logger = get_and_set_logger(__name__)
+
+# SQLite caps the number of bound parameters per statement
+_LOOKUP_CHUNK = 500
+
+
+def text_key(text: str) -> str:
+    """Stable key of a text inside the store."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """Persistent embedding store shared by every worker process.
+
+    Embeddings live in append-only float32 shard files that are read through
+    `np.memmap`, and an SQLite index maps sha1(text) to (shard, row). Each
+    process appends to its own shard, so workers never write to the same
+    file, and a row only becomes visible in the index after its bytes are
+    written. Stores are namespaced by (model_id, revision).
+    """
+
+    def __init__(
+            self,
+            model_id: str,
+            revision: str = "main",
+            root: Path = EMBEDDING_STORE_DIR,
+            shard_rows: int = EMBEDDING_STORE_SHARD_ROWS
+    ):
+        self.model_id = model_id
+        self.revision = revision
+        self.path = Path(root) / model_id / revision
+        self.shard_rows = shard_rows
+        self.dim: Optional[int] = None
+
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._shard: Optional[str] = None
+        self._shard_size = 0
+        self._maps: Dict[str, np.memmap] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the index for the current process (connections do not survive a fork)."""
+        if self._conn is None or self._pid != os.getpid():
+            self.path.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path / "index.sqlite", timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, shard TEXT NOT NULL, row INTEGER NOT NULL)"
+            )
+            conn.commit()
+
+            self._conn = conn
+            self._pid = os.getpid()
+            self._shard = None
+            self._maps = {}
+
+            row = conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+            self.dim = int(row[0]) if row else None
+        return self._conn
+
+    def _rows(self, shard: str, needed: int) -> np.ndarray:
+        """Memory-map a shard, remapping when it has grown past the cached view."""
+        mapped = self._maps.get(shard)
+        if mapped is None or mapped.shape[0] <= needed:
+            mapped = np.memmap(self.path / shard, dtype=np.float32, mode="r")
+            mapped = mapped.reshape(-1, self.dim)
+            self._maps[shard] = mapped
+        return mapped
+
+    def get_many(self, texts: List[str]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Look up stored embeddings for `texts`.
+
+        Returns:
+            Tuple of (boolean mask of texts found, float32 array with one row per
+            found text in input order, or None if nothing was found)
+        """
+        with self._lock:
+            conn = self._connect()
+            keys = [text_key(text) for text in texts]
+
+            locations = {}
+            for start in range(0, len(keys), _LOOKUP_CHUNK):
+                chunk = keys[start:start + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                for key, shard, row in conn.execute(
+                        f"SELECT key, shard, row FROM embeddings WHERE key IN ({placeholders})", chunk
+                ):
+                    locations[key] = (shard, row)
+
+            found = np.fromiter((key in locations for key in keys), dtype=bool, count=len(keys))
+            if not locations:
+                return found, None
+
+            if self.dim is None:
+                self.dim = int(conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()[0])
+
+            embeddings = np.empty((int(found.sum()), self.dim), dtype=np.float32)
+            positions = [locations[key] for key in keys if key in locations]
+            by_shard: Dict[str, List[int]] = {}
+            for out_idx, (shard, _) in enumerate(positions):
+                by_shard.setdefault(shard, []).append(out_idx)
+
+            for shard, out_indices in by_shard.items():
+                rows = np.asarray([positions[k][1] for k in out_indices], dtype=np.int64)
+                embeddings[out_indices] = self._rows(shard, int(rows.max()))[rows]
+
+            return found, embeddings
+
+    def put_many(self, texts: List[str], embeddings: np.ndarray) -> None:
+        """Append embeddings for `texts` to this process's shard and index them."""
+        if len(texts) == 0:
+            return
+
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        with self._lock:
+            conn = self._connect()
+
+            if self.dim is None:
+                conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('dim', ?)", (str(embeddings.shape[1]),))
+                conn.commit()
+                self.dim = int(conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()[0])
+            if embeddings.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dimension {embeddings.shape[1]} does not match store dimension {self.dim}"
+                )
+
+            entries = []
+            start = 0
+            while start < len(texts):
+                if self._shard is None or self._shard_size >= self.shard_rows:
+                    self._shard = f"{os.getpid()}_{uuid.uuid4().hex[:8]}.f32"
+                    self._shard_size = 0
+
+                count = min(self.shard_rows - self._shard_size, len(texts) - start)
+                with open(self.path / self._shard, "ab") as f:
+                    f.write(embeddings[start:start + count].tobytes())
+
+                entries.extend(
+                    (text_key(text), self._shard, self._shard_size + offset)
+                    for offset, text in enumerate(texts[start:start + count])
+                )
+                self._shard_size += count
+                start += count
+
+            conn.executemany("INSERT OR IGNORE INTO embeddings (key, shard, row) VALUES (?, ?, ?)", entries)
+            conn.commit()
+
+        logger.info(f"Stored {len(texts)} embeddings for {self.model_id}@{self.revision}")
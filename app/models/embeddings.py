@@ -1,38 +1,257 @@
-import torch
-from typing import List, Dict, Optional
+import gc
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Dict, Optional
+
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, AutoModel
+
+from .embedding_cache import EmbeddingCache
+from .embedding_precision import check_precision
+from .embedding_store import EmbeddingStore
+from ..config.constants import EMBEDDING_CACHE_BYTES, EMBEDDING_MODEL_IDLE_TTL, EMBEDDING_MAX_BATCH_TOKENS, ONNX_MODEL_DIR, EMBEDDING_PRECISION
+from ..config.loggers import get_and_set_logger
+
+# torch, sentence_transformers, transformers and onnxruntime are imported inside the model
+# classes, so workers only pay for them once a model is actually loaded
+
+logger = get_and_set_logger(__name__)
+
+class _RegisteredModel:
+    """Registry entry: how to build a model, its settings, and the loaded instance if any"""
+
+    def __init__(
+            self,
+            factory: Callable[[], 'BaseEmbeddingModel'],
+            persist: bool,
+            cache_bytes: Optional[int],
+            idle_ttl: Optional[float],
+            precision: str
+    ):
+        self.factory = factory
+        self.persist = persist
+        self.idle_ttl = idle_ttl
+        self.precision = precision
+        self.cache = EmbeddingCache(cache_bytes, precision)
+        self.model: Optional[BaseEmbeddingModel] = None
+        self.last_used = 0.0
+        self.lock = threading.Lock()
 
 class EmbeddingModelRegistry:
-    """Registry to manage multiple embedding models"""
+    """Registry to manage multiple embedding models
 
-    def __init__(self):
-        self._models: Dict[str, BaseEmbeddingModel] = {}
+    Models are registered as factories and only built on first use. Models
+    registered with an `idle_ttl` are unloaded again once they have not been
+    used for that many seconds, and rebuilt on the next request.
+    """
 
-    def register_model(self, model_id: str, model: 'BaseEmbeddingModel'):
-        """Register a new embedding model"""
-        self._models[model_id] = model
+    def __init__(self):
+        self._models: Dict[str, _RegisteredModel] = {}
+        self._reaper: Optional[threading.Thread] = None
+
+    def register_factory(
+            self,
+            model_id: str,
+            factory: Callable[[], 'BaseEmbeddingModel'],
+            persist: bool = True,
+            cache_bytes: Optional[int] = EMBEDDING_CACHE_BYTES,
+            idle_ttl: Optional[float] = EMBEDDING_MODEL_IDLE_TTL,
+            precision: str = EMBEDDING_PRECISION
+    ):
+        """Register a model factory, loaded lazily on first use
+
+        The model gets an LRU memory cache capped at `cache_bytes` (None for no cap),
+        is backed by the on-disk store unless `persist` is False, and is unloaded
+        after `idle_ttl` idle seconds (None keeps it loaded). `precision` sets how
+        its embeddings are held in the memory cache and the cosine kernels.
+        """
+        check_precision(precision)
+        self._models[model_id] = _RegisteredModel(factory, persist, cache_bytes, idle_ttl, precision)
+
+    def register_model(
+            self,
+            model_id: str,
+            model: 'BaseEmbeddingModel',
+            persist: bool = True,
+            cache_bytes: Optional[int] = EMBEDDING_CACHE_BYTES,
+            precision: str = EMBEDDING_PRECISION
+    ):
+        """Register an already built embedding model (never unloaded)"""
+        self.register_factory(model_id, lambda: model, persist, cache_bytes, idle_ttl=None, precision=precision)
 
     def get_model(self, model_id: str) -> 'BaseEmbeddingModel':
-        """Get a registered model by ID"""
+        """Get a registered model by ID, loading it if needed"""
         if model_id not in self._models:
             raise KeyError(f"Model {model_id} not registered")
-        return self._models[model_id]
+
+        entry = self._models[model_id]
+        with entry.lock:
+            if entry.model is None:
+                entry.model = self._load(model_id, entry)
+            entry.last_used = time.monotonic()
+            return entry.model
+
+    def _load(self, model_id: str, entry: _RegisteredModel) -> 'BaseEmbeddingModel':
+        logger.info(f"Loading embedding model {model_id}")
+        start_time = time.monotonic()
+
+        model = entry.factory()
+        model.model_id = model_id
+        model.cache = entry.cache
+        model.precision = entry.precision
+        if entry.persist:
+            model.store = EmbeddingStore(model_id, model.revision)
+
+        logger.info(f"Loaded embedding model {model_id} in {time.monotonic() - start_time:.2f}s")
+        if entry.idle_ttl is not None:
+            self._start_reaper()
+        return model
+
+    def unload_idle_models(self) -> List[str]:
+        """Unload models that have been idle longer than their TTL; returns their IDs"""
+        now = time.monotonic()
+        unloaded = []
+
+        for model_id, entry in self._models.items():
+            if entry.idle_ttl is None or entry.model is None:
+                continue
+            with entry.lock:
+                if entry.model is not None and now - entry.last_used > entry.idle_ttl:
+                    # Requests still holding the instance keep it alive until they finish. The
+                    # memory cache belongs to the entry and is kept for the reloaded model.
+                    entry.model = None
+                    unloaded.append(model_id)
+
+        if unloaded:
+            gc.collect()
+            logger.info(f"Unloaded idle embedding models: {unloaded}")
+        return unloaded
+
+    def _start_reaper(self):
+        """Start the background thread that unloads idle models"""
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+
+        ttls = [entry.idle_ttl for entry in self._models.values() if entry.idle_ttl is not None]
+        interval = max(min(ttls) / 2, 1.0)
+
+        def reap():
+            while True:
+                time.sleep(interval)
+                self.unload_idle_models()
+
+        self._reaper = threading.Thread(target=reap, name="embedding-model-reaper", daemon=True)
+        self._reaper.start()
+
+    def get_precision(self, model_id: Optional[str]) -> str:
+        """Storage precision of a registered model, without loading it"""
+        if model_id not in self._models:
+            return "float32"
+        return self._models[model_id].precision
 
     def list_models(self) -> List[str]:
         """List all registered model IDs"""
         return list(self._models.keys())
 
+    def cache_stats(self) -> Dict[str, Dict]:
+        """Memory cache metrics of every registered model"""
+        return {model_id: entry.cache.stats() for model_id, entry in self._models.items()}
+
+    def clear_caches(self, detach_stores: bool = False) -> None:
+        """Clear the memory cache of every registered model without loading any
+
+        With `detach_stores`, loaded models also stop using their on-disk store,
+        and models loaded later are built without one.
+        """
+        for entry in self._models.values():
+            with entry.lock:
+                entry.cache.clear()
+                if detach_stores:
+                    entry.persist = False
+                    if entry.model is not None:
+                        entry.model.store = None
+
 class BaseEmbeddingModel:
     """Base class for embedding models"""
 
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, revision: str = "main"):
         self.model_name = model_name
-        self.cache = {}
+        self.revision = revision
+        self.model_id: Optional[str] = None
+        self.precision = "float32"
+        self.cache = EmbeddingCache()
+        self.store: Optional[EmbeddingStore] = None
 
     def get_embeddings(self, texts: List[str], batch_size: int) -> np.ndarray:
-        """Get embeddings for a list of texts"""
+        """Get embeddings for a list of texts, encoding only those not in the memory cache or the store"""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        # Map every position to its distinct text so each text is looked up once
+        text_to_unique: Dict[str, int] = {}
+        inverse = np.fromiter(
+            (text_to_unique.setdefault(text, len(text_to_unique)) for text in texts),
+            dtype=np.int64,
+            count=len(texts)
+        )
+        unique_texts = list(text_to_unique)
+
+        cached_positions = []
+        cached_embeddings = []
+        missing_positions = []
+        for position, text in enumerate(unique_texts):
+            embedding = self.cache.get(text)
+            if embedding is not None:
+                cached_positions.append(position)
+                cached_embeddings.append(embedding)
+            else:
+                missing_positions.append(position)
+
+        new_embeddings = None
+        if missing_positions:
+            texts_to_encode = [unique_texts[position] for position in missing_positions]
+            new_embeddings = self._resolve_uncached(texts_to_encode, batch_size)
+
+            for text, embedding in zip(texts_to_encode, new_embeddings):
+                self.cache.put(text, embedding)
+
+        dim = new_embeddings.shape[1] if new_embeddings is not None else cached_embeddings[0].shape[0]
+        unique_embeddings = np.empty((len(unique_texts), dim), dtype=np.float32)
+
+        # Scatter both groups into the preallocated array in one step each
+        if cached_embeddings:
+            unique_embeddings[cached_positions] = np.stack(cached_embeddings)
+        if new_embeddings is not None:
+            unique_embeddings[missing_positions] = new_embeddings
+
+        if len(unique_texts) == len(texts):
+            return unique_embeddings
+        return unique_embeddings[inverse]
+
+    def _resolve_uncached(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Read texts missing from the memory cache from the store, encoding (and storing) the rest"""
+        if self.store is None:
+            return self._encode(texts, batch_size)
+
+        found, stored = self.store.get_many(texts)
+        if found.all():
+            return stored
+
+        to_encode = [text for text, is_found in zip(texts, found) if not is_found]
+        encoded = np.asarray(self._encode(to_encode, batch_size), dtype=np.float32)
+        self.store.put_many(to_encode, encoded)
+
+        if stored is None:
+            return encoded
+
+        embeddings = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+        embeddings[found] = stored
+        embeddings[~found] = encoded
+        return embeddings
+
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Encode texts that are not cached anywhere"""
         raise NotImplementedError
 
     def _process_batch(self, batch: List[str]) -> np.ndarray:
@@ -42,103 +261,131 @@ class BaseEmbeddingModel:
 class SentenceTransformerModel(BaseEmbeddingModel):
     """Wrapper for SentenceTransformer models"""
 
-    def __init__(self, model_name: str):
-        super().__init__(model_name)
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name: str, revision: str = "main"):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        super().__init__(model_name, revision)
+        self.model = SentenceTransformer(model_name, revision=revision)
         if torch.cuda.is_available():
             self.model = self.model.to(torch.device('cuda'))
 
-    def get_embeddings(self, texts: List[str], batch_size: int) -> np.ndarray:
-        cached_embeddings = []
-        texts_to_encode = []
-        text_positions = []
-
-        for i, text in enumerate(texts):
-            if text in self.cache:
-                cached_embeddings.append(self.cache[text])
-            else:
-                texts_to_encode.append(text)
-                text_positions.append(i)
-
-        if texts_to_encode:
-            new_embeddings = self.model.encode(
-                texts_to_encode,
-                batch_size=batch_size,
-                show_progress_bar=False,
-                convert_to_numpy=True
-            )
-
-            for text, embedding in zip(texts_to_encode, new_embeddings):
-                self.cache[text] = embedding
-
-            all_embeddings = np.zeros(
-                (len(texts), new_embeddings.shape[1]),
-                dtype=np.float32
-            )
-
-            cached_positions = [i for i in range(len(texts)) if i not in text_positions]
-            for pos, emb in zip(cached_positions, cached_embeddings):
-                all_embeddings[pos] = emb
-
-            for pos, emb in zip(text_positions, new_embeddings):
-                all_embeddings[pos] = emb
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True
+        )
 
-            return all_embeddings
+def build_token_budget_batches(lengths: np.ndarray, max_batch_tokens: int) -> List[np.ndarray]:
+    """
+    Group texts into batches of similar tokenized length.
+
+    Positions are sorted by decreasing length and a batch is closed as soon as
+    its padded size (members x longest member) would exceed `max_batch_tokens`.
+    A text longer than the budget gets a batch of its own.
+
+    Returns:
+        List of position arrays into `lengths`, one per batch
+    """
+    batches = []
+    current: List[int] = []
+    current_width = 0
+
+    for position in np.argsort(-np.asarray(lengths), kind="stable").tolist():
+        # Lengths are decreasing, so the first member sets the padded width
+        width = current_width or int(lengths[position])
+        if current and width * (len(current) + 1) > max_batch_tokens:
+            batches.append(np.asarray(current, dtype=np.int64))
+            current = []
+            width = int(lengths[position])
+        current.append(position)
+        current_width = width
+
+    if current:
+        batches.append(np.asarray(current, dtype=np.int64))
+    return batches
+
+
+def encode_in_token_budget_batches(
+        tokenizer,
+        texts: List[str],
+        forward: Callable,
+        max_batch_tokens: int,
+        max_length: int,
+        return_tensors: str = "pt"
+) -> np.ndarray:
+    """
+    Encode texts in length-sorted batches under a padded-token budget.
+
+    Texts are tokenized once without padding, each batch is padded to its own
+    longest member and passed to `forward`, and the pooled rows are scattered
+    back to input order.
+    """
+    encoded = tokenizer(texts, truncation=True, max_length=max_length)
+    keys = list(encoded.keys())
+    lengths = np.fromiter((len(ids) for ids in encoded["input_ids"]), dtype=np.int64, count=len(texts))
+
+    embeddings = None
+    for positions in build_token_budget_batches(lengths, max_batch_tokens):
+        features = [{key: encoded[key][p] for key in keys} for p in positions.tolist()]
+        batch_embeddings = forward(tokenizer.pad(features, return_tensors=return_tensors))
+
+        if embeddings is None:
+            embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=batch_embeddings.dtype)
+        # Scatter back to input order
+        embeddings[positions] = batch_embeddings
+
+    return embeddings
 
-        return np.stack(cached_embeddings)
 
 class HuggingFaceModel(BaseEmbeddingModel):
-    """Wrapper for HuggingFace models"""
-
-    def __init__(self, model_name: str):
-        super().__init__(model_name)
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModel.from_pretrained(model_name)
+    """Wrapper for HuggingFace models
+
+    With `max_batch_tokens` set (the default), texts are tokenized once, sorted
+    by length and encoded in batches of at most that many padded tokens, so
+    short strings are not padded up to the longest text of the upload. Passing
+    None restores fixed `batch_size` batches in input order.
+    """
+
+    def __init__(
+            self,
+            model_name: str,
+            revision: str = "main",
+            max_batch_tokens: Optional[int] = EMBEDDING_MAX_BATCH_TOKENS,
+            max_length: int = 512
+    ):
+        import torch
+        from transformers import AutoTokenizer, AutoModel
+
+        super().__init__(model_name, revision)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, revision=revision)
+        self.model = AutoModel.from_pretrained(model_name, revision=revision)
         if torch.cuda.is_available():
             self.model = self.model.to(torch.device('cuda'))
 
-    def get_embeddings(self, texts: List[str], batch_size: int) -> np.ndarray:
-        cached_embeddings = []
-        texts_to_encode = []
-        text_positions = []
-
-        for i, text in enumerate(texts):
-            if text in self.cache:
-                cached_embeddings.append(self.cache[text])
-            else:
-                texts_to_encode.append(text)
-                text_positions.append(i)
-
-        if texts_to_encode:
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        if self.max_batch_tokens is None:
             # Process in batches
-            batches = [texts_to_encode[i:i + batch_size]
-                       for i in range(0, len(texts_to_encode), batch_size)]
+            batches = [texts[i:i + batch_size]
+                       for i in range(0, len(texts), batch_size)]
             new_embeddings = []
 
             for batch in batches:
                 batch_embeddings = self._process_batch(batch)
                 new_embeddings.extend(batch_embeddings)
 
-            new_embeddings = np.array(new_embeddings)
-
-            for text, embedding in zip(texts_to_encode, new_embeddings):
-                self.cache[text] = embedding
+            return np.array(new_embeddings)
 
-            all_embeddings = np.zeros(
-                (len(texts), new_embeddings.shape[1]),
-                dtype=np.float32
-            )
+        return self._encode_token_budget(texts)
 
-            cached_positions = [i for i in range(len(texts)) if i not in text_positions]
-            for pos, emb in zip(cached_positions, cached_embeddings):
-                all_embeddings[pos] = emb
-
-            for pos, emb in zip(text_positions, new_embeddings):
-                all_embeddings[pos] = emb
-
-            return all_embeddings
-
-        return np.stack(cached_embeddings)
+    def _encode_token_budget(self, texts: List[str]) -> np.ndarray:
+        return encode_in_token_budget_batches(
+            self.tokenizer, texts, self._forward, self.max_batch_tokens, self.max_length, return_tensors="pt"
+        )
 
     def _process_batch(self, batch: List[str]) -> np.ndarray:
         # Tokenize and get model outputs
@@ -147,8 +394,12 @@ class HuggingFaceModel(BaseEmbeddingModel):
             padding=True,
             truncation=True,
             return_tensors="pt",
-            max_length=512
+            max_length=self.max_length
         )
+        return self._forward(inputs)
+
+    def _forward(self, inputs) -> np.ndarray:
+        import torch
 
         if torch.cuda.is_available():
             inputs = {k: v.cuda() for k, v in inputs.items()}
@@ -164,23 +415,141 @@ class HuggingFaceModel(BaseEmbeddingModel):
 
         return embeddings.cpu().numpy()
 
+class ONNXEmbeddingModel(BaseEmbeddingModel):
+    """Wrapper running a Hugging Face encoder through ONNX Runtime on CPU
+
+    On first use the model is exported to ONNX under `ONNX_MODEL_DIR` and, with
+    `quantize=True`, converted with int8 dynamic quantization; later builds
+    load the exported graph directly. Outputs are mean pooled like
+    `HuggingFaceModel`, and L2 normalized when `normalize` is set to match
+    sentence-transformers models that end with a Normalize layer.
+    """
+
+    def __init__(
+            self,
+            model_name: str,
+            revision: str = "main",
+            quantize: bool = True,
+            normalize: bool = True,
+            max_batch_tokens: Optional[int] = EMBEDDING_MAX_BATCH_TOKENS,
+            max_length: int = 512,
+            export_dir: Path = ONNX_MODEL_DIR
+    ):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        super().__init__(model_name, revision)
+        self.quantize = quantize
+        self.normalize = normalize
+        self.max_batch_tokens = max_batch_tokens
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, revision=revision)
+
+        path = self._exported_path(Path(export_dir) / model_name / revision)
+        self.session = ort.InferenceSession(str(path), providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _exported_path(self, directory: Path) -> Path:
+        """Export (and quantize) the model unless a previous build already did"""
+        fp32_path = directory / "model.onnx"
+        int8_path = directory / "model.int8.onnx"
+        target = int8_path if self.quantize else fp32_path
+        if target.exists():
+            return target
+
+        directory.mkdir(parents=True, exist_ok=True)
+        if not fp32_path.exists():
+            self._export(fp32_path)
+
+        if self.quantize:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+
+            logger.info(f"Quantizing {fp32_path} to int8")
+            tmp_path = int8_path.with_suffix(f".{os.getpid()}.tmp")
+            quantize_dynamic(str(fp32_path), str(tmp_path), weight_type=QuantType.QInt8)
+            os.replace(tmp_path, int8_path)
+
+        return target
+
+    def _export(self, path: Path) -> None:
+        import torch
+        from transformers import AutoModel
+
+        logger.info(f"Exporting {self.model_name}@{self.revision} to {path}")
+        model = AutoModel.from_pretrained(self.model_name, revision=self.revision).eval()
+
+        class LastHiddenState(torch.nn.Module):
+            def __init__(self, encoder):
+                super().__init__()
+                self.encoder = encoder
+
+            def forward(self, input_ids, attention_mask, token_type_ids=None):
+                return self.encoder(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    token_type_ids=token_type_ids
+                ).last_hidden_state
+
+        sample = self.tokenizer(["export sample"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+
+        # Write under a temporary name so concurrent workers never load a partial graph
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with torch.no_grad():
+            torch.onnx.export(
+                LastHiddenState(model),
+                tuple(sample[name] for name in input_names),
+                str(tmp_path),
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=17,
+                do_constant_folding=True
+            )
+        os.replace(tmp_path, path)
+
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        max_batch_tokens = self.max_batch_tokens or batch_size * self.max_length
+        return encode_in_token_budget_batches(
+            self.tokenizer, texts, self._forward, max_batch_tokens, self.max_length, return_tensors="np"
+        )
+
+    def _forward(self, inputs) -> np.ndarray:
+        feed = {name: np.asarray(inputs[name], dtype=np.int64) for name in self.input_names}
+        token_embeddings = self.session.run(None, feed)[0]
+
+        # Mean pooling over the attention mask
+        mask = feed["attention_mask"][..., None].astype(np.float32)
+        embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.normalize:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.astype(np.float32)
+
 # Initialize the model registry
 model_registry = EmbeddingModelRegistry()
 
-# Register default models
-# model_registry.register_model(
+# Register default models (built on first use)
+# model_registry.register_factory(
 #     "mpnet",
-#     SentenceTransformerModel("sentence-transformers/all-mpnet-base-v2")
+#     lambda: SentenceTransformerModel("sentence-transformers/all-mpnet-base-v2")
 # )
 
-model_registry.register_model(
+model_registry.register_factory(
     "minilm",
-    SentenceTransformerModel("sentence-transformers/all-MiniLM-L6-v2")
+    lambda: SentenceTransformerModel("sentence-transformers/all-MiniLM-L6-v2")
+)
+
+# Same weights through ONNX Runtime with int8 weights, for CPU-only nodes
+model_registry.register_factory(
+    "minilm-onnx",
+    lambda: ONNXEmbeddingModel("sentence-transformers/all-MiniLM-L6-v2", quantize=True)
 )
 
-# model_registry.register_model(
+# model_registry.register_factory(
 #     "bert",
-#     HuggingFaceModel("bert-base-uncased")
+#     lambda: HuggingFaceModel("bert-base-uncased")
 # )
 
 def get_model(model_id: Optional[str] = None) -> BaseEmbeddingModel:
@@ -3,7 +3,7 @@ from datetime import datetime
 from typing import List, Dict
 
 import numpy as np
-from matplotlib import pyplot as plt
+from matplotlib.figure import Figure
 from scipy.cluster import hierarchy
 from sklearn.neighbors import NearestNeighbors
 
@@ -11,31 +11,36 @@ from app.config.constants import OUTPUT_FIGS
 
 
 def save_dendrogram(Z: np.ndarray, labels: List[str], block_id: str) -> str:
-    """Save dendrogram visualization to the figures directory."""
+    """Save dendrogram visualization to the figures directory.
+
+    Draws on its own Figure rather than the pyplot state, so blocks can be
+    clustered in several threads at once.
+    """
     label_height = 0.3
     min_height = 8
     calculated_height = max(min_height, len(labels) * label_height)
 
-    plt.figure(figsize=(12, calculated_height))
+    fig = Figure(figsize=(12, calculated_height))
+    ax = fig.subplots()
     dendrogram = hierarchy.dendrogram(
         Z,
         labels=labels,
         orientation='left',
         leaf_font_size=10,
         leaf_rotation=0,
-        distance_sort='ascending'
+        distance_sort='ascending',
+        ax=ax
     )
 
-    plt.margins(x=0.1)
-    plt.tight_layout(pad=1.5)
+    ax.margins(x=0.1)
+    fig.tight_layout(pad=1.5)
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"dendrogram_{block_id}_{timestamp}.png"
     filename = "".join(c for c in filename if c.isalnum() or c in "._-")
     filepath = OUTPUT_FIGS / filename
 
-    plt.savefig(filepath, format='png', dpi=300, bbox_inches='tight')
-    plt.close()
+    fig.savefig(filepath, format='png', dpi=300, bbox_inches='tight')
 
     return str(filepath)
 
@@ -1,38 +1,95 @@
 import numpy as np
+import polars as pl
 from scipy.stats import zscore
 from sklearn.ensemble import IsolationForest
 from sklearn.neighbors import LocalOutlierFactor
 from sklearn.cluster import DBSCAN
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Union
+
+from ..distances.block import BlockDistances
+from ..distances.knn import KNNGraph
+
+def detect_graph_outliers(knn_graph: KNNGraph, method: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Outlier scores from a sparse kNN distance graph instead of a full matrix.
+
+    Each method only looks at the neighbours stored in the graph: z-scores of the
+    mean neighbour distance, an Isolation Forest over the sorted neighbour
+    distances, LOF and DBSCAN on the precomputed sparse graph.
+
+    Returns:
+        Tuple of (scores, boolean outlier mask)
+    """
+    n_points = knn_graph.n
+
+    if method == "zscore":
+        scores = np.abs(zscore(knn_graph.mean_distances()))
+        is_outlier = scores > 2.5
+
+    elif method == "isolation_forest":
+        _, features = knn_graph.neighbor_table(knn_graph.k)
+        features[~np.isfinite(features)] = knn_graph.graph.data.max() if knn_graph.graph.nnz else 0.0
+        clf = IsolationForest(contamination=0.05, random_state=42)
+        scores = -clf.fit(features).score_samples(features)
+        is_outlier = clf.predict(features) == -1
+
+    elif method == "lof":
+        # sklearn needs one more stored neighbour than n_neighbors when scoring the fitted points
+        n_neighbors = max(1, min(20, n_points // 2, int(knn_graph.degrees().min()) - 1))
+        clf = LocalOutlierFactor(n_neighbors=n_neighbors, contamination=0.05, metric="precomputed")
+        is_outlier = clf.fit_predict(knn_graph.graph) == -1
+        scores = clf.negative_outlier_factor_ * -1
+
+    elif method == "dbscan":
+        labels = DBSCAN(eps=0.3, min_samples=10, metric="precomputed").fit_predict(knn_graph.symmetric())
+        is_outlier = labels == -1
+
+        # Distance to the nearest stored neighbour that is not an outlier
+        graph = knn_graph.graph
+        scores = np.zeros(n_points)
+        max_distance = graph.data.max() if graph.nnz else 0.0
+        for i in np.flatnonzero(is_outlier):
+            row = slice(graph.indptr[i], graph.indptr[i + 1])
+            inliers = ~is_outlier[graph.indices[row]]
+            scores[i] = graph.data[row][inliers].min() if inliers.any() else max_distance
+
+    else:
+        raise ValueError(f"Unknown outlier detection method: {method}")
+
+    return scores, is_outlier
 
 def detect_outliers(
-        distances: np.ndarray,
+        distances: Union[np.ndarray, BlockDistances, None],
         texts: List[str],
-        preserved_fields: Dict[str, List],
-        method: str = "zscore"
+        preserved_fields: pl.DataFrame,
+        method: str = "zscore",
+        knn_graph: Optional[KNNGraph] = None,
+        square: Optional[np.ndarray] = None
 ) -> Dict[str, List]:
     """
     Detect outliers in the distance data using various methods.
 
     Args:
-        distances: Condensed distance matrix
+        distances: Condensed distance matrix, or the block's `BlockDistances` (which then
+            supplies the kNN graph and square matrix)
         texts: List of strings corresponding to points
-        preserved_fields: Dictionary of preserved field values
+        preserved_fields: Preserved field values, one row per point
         method: Outlier detection method ("zscore", "isolation_forest", "lof", "dbscan")
+        knn_graph: Sparse kNN distance graph of a block compared in `knn` mode
+        square: Square form of `distances` already built for the block, reused as is
 
     Returns:
         Dictionary with outlier information
     """
     n_points = len(texts)
+    block = BlockDistances.wrap(distances, n_points, knn_graph, square)
 
-    # Create full distance matrix from condensed form
-    dist_matrix = np.zeros((n_points, n_points))
-    idx = 0
-    for i in range(n_points):
-        for j in range(i + 1, n_points):
-            dist_matrix[i, j] = distances[idx]
-            dist_matrix[j, i] = distances[idx]
-            idx += 1
+    if block.is_graph:
+        scores, is_outlier = detect_graph_outliers(block.knn_graph, method)
+        return summarize_outliers(scores, is_outlier, texts, preserved_fields, method)
+
+    # Full distance matrix, shared with the other consumers of the block
+    dist_matrix = block.square
 
     # Calculate outlier scores based on specified method
     if method == "zscore":
@@ -77,9 +134,22 @@ def detect_outliers(
     else:
         raise ValueError(f"Unknown outlier detection method: {method}")
 
+    return summarize_outliers(scores, is_outlier, texts, preserved_fields, method)
+
+def summarize_outliers(
+        scores: np.ndarray,
+        is_outlier: np.ndarray,
+        texts: List[str],
+        preserved_fields: pl.DataFrame,
+        method: str
+) -> Dict[str, List]:
+    """Build the outlier report from per-point scores and outlier flags."""
+    n_points = len(texts)
+
     # Create results
     outliers = []
-    field_names = list(preserved_fields.keys())
+    field_names = preserved_fields.columns
+    field_rows = preserved_fields.to_dicts()
 
     for i in range(n_points):
         # if is_outlier[i]:
@@ -87,7 +157,7 @@ def detect_outliers(
                 "text": texts[i],
                 "score": float(scores[i]),
                 "index": i,
-                "fields": {field: preserved_fields[field][i] for field in field_names},
+                "fields": field_rows[i],
                 "is_outlier": True if is_outlier[i] else False
             }
             outliers.append(outlier_info)
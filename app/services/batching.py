@@ -0,0 +1,103 @@
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .executors import embedding_executor
+from ..config.constants import EMBEDDING_BATCH_WAIT_MS, EMBEDDING_BATCH_MAX_TEXTS
+from ..config.loggers import get_and_set_logger
+from ..models.embeddings import get_model
+
+logger = get_and_set_logger(__name__)
+
+
+class EmbeddingBatcher:
+    """Dynamic micro-batching in front of one embedding model.
+
+    Small requests arriving within `max_wait` seconds of each other are merged
+    into a single `get_embeddings` call, so concurrent clients share one large
+    encode instead of each running a tiny batch. Requests of at least
+    `max_texts` texts are already large enough and go straight to the model.
+    """
+
+    def __init__(
+            self,
+            model_id: Optional[str],
+            max_wait: float = EMBEDDING_BATCH_WAIT_MS / 1000,
+            max_texts: int = EMBEDDING_BATCH_MAX_TEXTS
+    ):
+        self.model_id = model_id
+        self.max_wait = max_wait
+        self.max_texts = max_texts
+
+        self._pending: List[Tuple[List[str], int, asyncio.Future]] = []
+        self._pending_texts = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Running flushes; the event loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        model = await embedding_executor.run(get_model, self.model_id)
+        return await embedding_executor.run(model.get_embeddings, texts, batch_size)
+
+    async def embed(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Get embeddings for `texts`, possibly sharing the encode call with concurrent requests."""
+        if len(texts) >= self.max_texts:
+            return await self._encode(texts, batch_size)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((texts, batch_size, future))
+        self._pending_texts += len(texts)
+
+        if self._pending_texts >= self.max_texts:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending, self._pending_texts = self._pending, [], 0
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[List[str], int, asyncio.Future]]) -> None:
+        try:
+            # Encode every distinct text of the merged requests once
+            text_to_row: Dict[str, int] = {}
+            rows = [
+                np.fromiter((text_to_row.setdefault(text, len(text_to_row)) for text in texts), dtype=np.int64, count=len(texts))
+                for texts, _, _ in batch
+            ]
+            batch_size = max(size for _, size, _ in batch)
+
+            embeddings = await self._encode(list(text_to_row), batch_size)
+        except Exception as e:
+            # Every waiting request gets the error instead of it being lost with the task
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        logger.debug(f"Micro-batch for {self.model_id}: {len(batch)} requests, {len(text_to_row)} texts")
+        for request_rows, (_, _, future) in zip(rows, batch):
+            if not future.done():
+                future.set_result(embeddings[request_rows])
+
+
+_batchers: Dict[Optional[str], EmbeddingBatcher] = {}
+
+
+def get_batcher(model_id: Optional[str]) -> EmbeddingBatcher:
+    """Get the micro-batcher of a registered model, creating it on first use."""
+    batcher = _batchers.get(model_id)
+    if batcher is None:
+        batcher = _batchers[model_id] = EmbeddingBatcher(model_id)
+    return batcher
@@ -1,7 +1,7 @@
 import json
 import traceback
 from datetime import datetime
-from typing import Optional, List, Dict, Tuple
+from typing import Optional, List, Dict, Iterable, Iterator, Tuple
 
 import numpy as np
 import polars as pl
@@ -12,41 +12,63 @@ from .analytics.outliers import detect_outliers
 from .tsnes.grid import process_unified_map
 from ..config.constants import OUTPUT_DEEPSCOPES
 from ..config.loggers import get_and_set_logger
-from ..models.distances import StringPair, CSVDistanceInput, ModelConfig
+from ..models.distances import CSVDistanceInput, ModelConfig
 from ..services.analytics.charts import save_dendrogram
 from ..services.distances.base import calculate_all_distances, calculate_cluster_metrics
+from ..services.distances.embeddings import normalize_embeddings
+from ..services.distances.block import BlockDistances, SharedBlockDistances
+from ..services.distances.tokens import check_tokenization
+from ..services.distances.pairs import PairTile, count_pairs, iter_pair_tiles, iter_index_tiles
+from ..services.distances.knn import KNNGraph, find_cosine_neighbors, knn_pair_indices, ngram_vectors
+from ..services.distances.results import DistanceResults, build_field_table
+from ..services.batching import get_batcher
+from ..services.executors import distance_executor, worker_pool
+from ..services.scheduler import BlockScheduler, estimate_block_cost
+from ..services.shared_arrays import SharedArray, run_attached
 from ..services.tsnes.core import process_block_dimred
 
 logger = get_and_set_logger(__name__)
 
 
-def generate_string_pairs(texts: List[str], compare_mode: str = "all_pairs") -> List[StringPair]:
-    """Generate pairs efficiently."""
-    if compare_mode == "all_pairs":
-        # Pre-allocate the list for better performance
-        n = len(texts)
-        num_pairs = (n * (n - 1)) // 2
-        pairs = []
-        pairs.extend(
-            StringPair(string1=texts[i], string2=texts[j])
-            for i in range(n-1)
-            for j in range(i + 1, n)
-        )
-        return pairs
-    else:  # consecutive mode
-        # One-shot list creation for consecutive pairs
-        return [
-            StringPair(string1=texts[i], string2=texts[i+1])
-            for i in range(len(texts) - 1)
-        ]
+def generate_pair_tiles(texts: List[str], compare_mode: str = "all_pairs") -> Iterator[PairTile]:
+    """Lazily enumerate the pairs of `texts` as index tiles, never as a full list."""
+    return iter_pair_tiles(len(texts), compare_mode)
+
+async def generate_knn_pairs(
+        texts: List[str],
+        input_data: CSVDistanceInput,
+        embeddings: Optional[np.ndarray] = None
+) -> PairTile:
+    """Pair every string with its nearest candidates instead of with every other string.
+
+    Candidates come from the block's embeddings (first embedding model) when
+    cosine is requested, and from character trigram vectors otherwise; the
+    requested distances are then computed exactly for these pairs only.
+    """
+    if embeddings is not None:
+        vectors = await distance_executor.run(normalize_embeddings, embeddings)
+    else:
+        vectors = await distance_executor.run(ngram_vectors, texts)
+
+    neighbors, _ = await distance_executor.run(find_cosine_neighbors, vectors, input_data.knn_neighbors)
+    idx1, idx2 = knn_pair_indices(neighbors)
+    logger.info(f"knn mode: {len(idx1)} candidate pairs for {len(texts)} strings")
+
+    return idx1, idx2
 
 def process_csv_for_distances(
         df: pl.DataFrame,
         fields: Optional[List[str]] = None,
         separator: str = " "
-) -> Tuple[List[str], Dict[str, List], Dict[str, int]]:
+) -> Tuple[List[str], pl.DataFrame, np.ndarray]:
     """Process CSV fields and return strings with preserved field values and counts.
 
+    Deduplication, counting and field extraction run as one Polars `group_by`
+    over the concatenated text, so the cost is a single pass over the rows.
+    The preserved fields stay a Polars frame until the response is built;
+    the strings are converted to a list once, since rapidfuzz, the token
+    matrix and the embedding models all take Python strings.
+
     Args:
         df: Input DataFrame
         fields: Fields to use for text generation (if None, uses all fields)
@@ -54,64 +76,28 @@ def process_csv_for_distances(
 
     Returns:
         Tuple containing:
-        - List of unique concatenated strings
-        - Dictionary mapping field names to their values
-        - Dictionary mapping each unique string to its count in original data
+        - List of unique concatenated strings, in order of first appearance
+        - DataFrame of every column's value at the first row of each string
+        - Array of the occurrence count of each unique string in the original data
     """
     if fields is None:
         fields = df.columns
 
     try:
-        # Process the dataframe efficiently with Polars
-        df_subset = df.select(fields).fill_null("")
-        df_subset = df_subset.with_columns([
-            pl.col(col).cast(pl.Utf8).fill_null("") for col in df_subset.columns
-        ])
-
-        # Create concatenated strings from selected fields
-        df = df.with_columns([
-            pl.concat_str(pl.col(fields), separator=separator).alias("_concat_text")
-        ])
-
-        # Create a unique identifier using all fields to properly identify duplicates
-        all_fields_concat = pl.concat_str(
-            [pl.col(col) for col in df.columns if col != "_concat_text"],
-            separator="||"
-        ).alias("_all_fields_key")
-
-        df = df.with_columns([all_fields_concat])
-
-        # Get unique rows based on all fields
-        unique_rows = df.unique(subset=["_all_fields_key"])
-
-        # Create dictionaries for text counts and preserved fields
-        text_counts = {}  # Track counts of each text based on concatenated selected fields
-        preserved_fields = {field: [] for field in df.columns if field not in ["_concat_text", "_all_fields_key"]}
-        unique_texts = []
-        text_to_idx = {}
-
-        # Process each unique row
-        for row in unique_rows.iter_rows(named=True):
-            text = row["_concat_text"]
-            if text:
-                # Count occurrences in original dataframe
-                count = df.filter(pl.col("_concat_text") == text).height
-
-                if text not in text_to_idx:
-                    text_to_idx[text] = len(unique_texts)
-                    unique_texts.append(text)
-                    text_counts[text] = count
-
-                    # Store values for all fields from the row
-                    for field in preserved_fields:
-                        preserved_fields[field].append(row[field])
-
-        # Clean up temporary columns from DataFrame
-        df = df.drop(["_concat_text", "_all_fields_key"])
+        grouped = (
+            df.lazy()
+            .with_columns(pl.concat_str(pl.col(fields), separator=separator).alias("_concat_text"))
+            .filter(pl.col("_concat_text").is_not_null() & (pl.col("_concat_text") != ""))
+            .group_by("_concat_text", maintain_order=True)
+            .agg([pl.len().alias("_count"), *[pl.col(field).first() for field in df.columns]])
+            .collect()
+        )
+
+        unique_texts = grouped["_concat_text"].to_list()
+        preserved_fields = grouped.select(df.columns)
+        text_counts = grouped["_count"].to_numpy()
 
         logger.info(f"Processed {df.height} rows into {len(unique_texts)} unique strings")
-        logger.debug(f"Generated text_counts: {text_counts}")
-        logger.debug(f"Unique texts: {unique_texts}")
 
         return unique_texts, preserved_fields, text_counts
 
@@ -148,75 +134,125 @@ def get_block_id(block_df: pl.DataFrame, block_idx: int, blocking_keys: Optional
     return block_id, block_values
 
 async def process_distances(
-        pairs: List[StringPair],
+        pair_tiles: Iterable[PairTile],
+        num_pairs: int,
+        texts: List[str],
         input_data: CSVDistanceInput,
-        block_info: Optional[Dict] = None
-) -> List[Dict]:
-    """Calculate distances for pairs with specified configuration."""
+        block_info: Optional[Dict] = None,
+        embeddings: Optional[np.ndarray] = None
+) -> Optional[DistanceResults]:
+    """Calculate distances for tiles of `num_pairs` index pairs into `texts` with specified configuration.
+
+    `embeddings`, the block's vectors of the first embedding model, are reused
+    by its cosine kernel instead of embedding the texts again.
+    """
     results = await calculate_all_distances(
-        pairs=pairs,
+        pairs=None,
+        pair_tiles=pair_tiles,
+        num_pairs=num_pairs,
         distance_types=input_data.distance_types,
         embedding_models=input_data.embedding_models,
         use_worker=input_data.use_worker,
         batch_size=input_data.batch_size,
-        tokenization=input_data.tokenization
+        tokenization=input_data.tokenization,
+        texts=texts,
+        embeddings={input_data.embedding_models[0].model_id: embeddings} if embeddings is not None else None
     )
 
-    if block_info:
-        for result in results:
-            result['block'] = block_info
+    if results is not None and block_info:
+        results.block = block_info
 
     return results
 
-def create_distance_matrix(
-        results: List[Dict],
-        texts: List[str],
+def embedding_model_prefix(embedding_models: Optional[List[ModelConfig]]) -> Optional[str]:
+    """Distance prefix of the first embedding model, if any."""
+    if not embedding_models:
+        return None
+    model_config = embedding_models[0]
+    return model_config.distance_prefix or f"{model_config.model_id}_cosine"
+
+def select_clustering_prefix(
+        results: DistanceResults,
         embedding_models: Optional[List[ModelConfig]]
-) -> np.ndarray:
-    """Create distance matrix from results."""
+) -> Optional[str]:
+    """Distance column clustering runs on: the first embedding model's, else plain cosine."""
+    # Use the first available embedding model's distance
+    first_model_prefix = embedding_model_prefix(embedding_models)
+    if first_model_prefix and first_model_prefix in results.distances:
+        return first_model_prefix
+    if "cosine" in results.distances:
+        return "cosine"
+    return None
+
+def create_knn_graph(
+        results: DistanceResults,
+        texts: List[str],
+        input_data: CSVDistanceInput,
+        prefix: Optional[str]
+) -> KNNGraph:
+    """kNN distance graph of a knn-mode block, on the clustering distance (or the first computed one)."""
+    distances = results.distances[prefix] if prefix else next(iter(results.distances.values()))
+    return KNNGraph.from_pairs(len(texts), results.idx1, results.idx2, distances, input_data.knn_neighbors)
+
+async def create_block_embeddings(
+        texts: List[str],
+        input_data: CSVDistanceInput
+) -> Optional[np.ndarray]:
+    """Embeddings of the first model when cosine is requested, else None.
+
+    Computed once per block and shared by kNN candidate search, the cosine
+    kernel and the reduction of large blocks.
+    """
+    if "cosine" not in input_data.distance_types or not input_data.embedding_models:
+        return None
+    return await get_batcher(input_data.embedding_models[0].model_id).embed(texts, input_data.batch_size)
+
+async def create_block_distances(
+        results: DistanceResults,
+        texts: List[str],
+        input_data: CSVDistanceInput
+) -> BlockDistances:
+    """Build the block's clustering distances once, for linkage, outliers and reduction.
+
+    `knn` blocks get their sparse graph. All-pairs results are already in
+    condensed (`pdist`) order, so their clustering column is the condensed
+    vector; any other block scatters its per-pair column into one.
+    """
     n = len(texts)
-    distance_matrix = np.zeros((n, n))
-    string_to_idx = {s: i for i, s in enumerate(texts)}
+    prefix = select_clustering_prefix(results, input_data.embedding_models)
 
-    # Use the first available embedding model's distance
-    first_model_prefix = None
-    if embedding_models:
-        model_config = embedding_models[0]
-        first_model_prefix = model_config.distance_prefix or f"{model_config.model_id}_cosine"
-
-    for result in results:
-        i = string_to_idx[result["string1"]]
-        j = string_to_idx[result["string2"]]
-        if first_model_prefix and first_model_prefix in result["distances"]:
-            distance = float(result["distances"][first_model_prefix])
-        else:
-            distance = float(result["distances"].get("cosine", 0.0))
-        distance_matrix[i, j] = distance
-        distance_matrix[j, i] = distance
+    if input_data.compare_mode == "knn":
+        knn_graph = await distance_executor.run(create_knn_graph, results, texts, input_data, prefix)
+        return BlockDistances(n, knn_graph=knn_graph, source=prefix)
+
+    if input_data.compare_mode == "all_pairs" and prefix:
+        return BlockDistances(n, condensed=results.distances[prefix].astype(np.float32), source=prefix)
+
+    distances = results.distances[prefix] if prefix else None
+    return await distance_executor.run(BlockDistances.from_pairs, n, results.idx1, results.idx2, distances, prefix)
 
-    return distance_matrix
 def add_field_information(
-        results: List[Dict],
-        texts: List[str],
-        preserved_fields: Dict[str, List]
+        results: DistanceResults,
+        preserved_fields: pl.DataFrame
 ) -> None:
-    """Add preserved field information to results."""
-    for result in results:
-        str1_idx = texts.index(result["string1"])
-        str2_idx = texts.index(result["string2"])
-        result["fields1"] = {f: preserved_fields[f][str1_idx] for f in preserved_fields}
-        result["fields2"] = {f: preserved_fields[f][str2_idx] for f in preserved_fields}
+    """Attach preserved field columns to results; pairs reference them by row in the response's field table."""
+    results.fields = preserved_fields
 
 def create_response(
-        all_results: List[Dict],
+        all_results: List[DistanceResults],
         df: pl.DataFrame,
         input_data: CSVDistanceInput,
         all_cluster_results: List[Dict],
         unified_map_blocks: Optional[List[Dict]]
 ) -> Dict:
-    """Create final response with all results."""
+    """Create final response with all results.
+
+    Preserved field values are returned once, in the columnar `field_table`;
+    every pair points at its two strings' rows with `row1` / `row2`.
+    """
+    field_table, row_offsets = build_field_table(all_results)
     response = {
-        "total_pairs": len(all_results),
+        "total_pairs": sum(len(results) for results in all_results),
         "used_fields": [str(f) for f in df.columns],
         "blocking_keys": input_data.blocking_keys,
         "distance_types": input_data.distance_types,
@@ -227,7 +263,12 @@ def create_response(
             }
             for model in (input_data.embedding_models or [])
         ],
-        "distances": all_results
+        "distances": [
+            record
+            for results, offset in zip(all_results, row_offsets)
+            for record in results.to_dicts(row_offset=offset)
+        ],
+        "field_table": field_table
     }
 
     if input_data.clustering:
@@ -249,26 +290,47 @@ def create_response(
 
 def process_clustering(
         texts: List[str],
-        results: List[Dict],
+        results: Optional[DistanceResults],
         input_data: CSVDistanceInput,
         block_id: str,
         block_values: Optional[List[str]],
-        string_counts: Dict[str, int],
-        preserved_fields: Dict[str, List],
-        unified_map_blocks: Optional[List[Dict]] = None
+        string_counts: np.ndarray,
+        preserved_fields: pl.DataFrame,
+        unified_map_blocks: Optional[List[Dict]] = None,
+        block_distances: Optional[BlockDistances] = None,
+        embeddings: Optional[np.ndarray] = None
 ) -> Optional[Dict]:
-    """Process clustering and visualization for a block."""
+    """Process clustering and visualization for a block.
+
+    `block_distances` is computed once per block and read by linkage, outlier
+    detection and reduction alike; without it, it is built from `results`
+    (only needed in that case).
+    Blocks compared in `knn` mode carry a kNN graph; they are clustered by
+    single linkage over the graph and never expanded to a dense matrix. The
+    block's `embeddings`, when given, let the reduction of large blocks work
+    from the vectors instead of the distance matrix.
+    """
     try:
-        n = len(texts)
-        distance_matrix = create_distance_matrix(results, texts, input_data.embedding_models)
-        condensed_dist = distance_matrix[np.triu_indices(n, k=1)]
-
-        # Calculate linkage
-        Z = linkage(condensed_dist, method=input_data.linkage_method)
-        metrics = calculate_cluster_metrics(condensed_dist, Z)
+        if block_distances is None:
+            prefix = select_clustering_prefix(results, input_data.embedding_models)
+            block_distances = BlockDistances.from_pairs(
+                len(texts), results.idx1, results.idx2, results.distances[prefix] if prefix else None, prefix
+            )
+        logger.debug(f"Block {block_id} distances: {block_distances.metadata()}")
+
+        if block_distances.is_graph:
+            knn_graph = block_distances.knn_graph
+            if input_data.linkage_method != "single":
+                logger.info(f"knn mode clusters block {block_id} with single linkage over the kNN graph")
+            Z = knn_graph.single_linkage()
+            metrics = calculate_cluster_metrics(knn_graph.graph.data, Z)
+        else:
+            # Calculate linkage
+            Z = linkage(block_distances.condensed, method=input_data.linkage_method)
+            metrics = calculate_cluster_metrics(block_distances.condensed, Z)
 
         outlier_results = detect_outliers(
-            distances=condensed_dist,
+            distances=block_distances,
             texts=texts,
             preserved_fields=preserved_fields,
             method=input_data.outlier_detection_method
@@ -288,7 +350,7 @@ def process_clustering(
         # Generate TSNE visualization
         tsne_results = process_block_dimred(
             strings=texts,
-            distances=condensed_dist,
+            distances=block_distances,
             block_id=",".join(block_values) if block_values else block_id,
             string_counts=string_counts,
             preserved_fields=preserved_fields,
@@ -298,7 +360,8 @@ def process_clustering(
             reduction_perplexity = input_data.reduction_perplexity,
             reduction_n_neighbors = input_data.reduction_n_neighbors,
             reduction_min_dist = input_data.reduction_min_dist,
-            unified_blocks=unified_map_blocks
+            unified_blocks=unified_map_blocks,
+            embeddings=embeddings
         )
 
         if tsne_results and tsne_results.get("tsne_coordinates"):
@@ -311,12 +374,168 @@ def process_clustering(
         logger.error(traceback.format_exc())
         return None
 
+def cluster_block(
+        texts: List[str],
+        input_data: CSVDistanceInput,
+        block_id: str,
+        block_values: Optional[List[str]],
+        string_counts: np.ndarray,
+        preserved_fields: pl.DataFrame,
+        block_distances: BlockDistances,
+        embeddings: Optional[np.ndarray] = None
+) -> Tuple[Optional[Dict], List[Dict]]:
+    """
+    Cluster one block and collect its unified map entries locally.
+
+    Picklable entry point of `process_clustering`, so a block can be clustered
+    in a worker process: the block's unified map entries are returned instead
+    of being appended to a list shared with the other blocks.
+
+    Returns:
+        Tuple of (cluster result or None, unified map entries of the block)
+    """
+    unified_map_blocks = [] if input_data.unified_map else None
+    cluster_result = process_clustering(
+        texts=texts,
+        results=None,
+        input_data=input_data,
+        block_id=block_id,
+        block_values=block_values,
+        string_counts=string_counts,
+        preserved_fields=preserved_fields,
+        unified_map_blocks=unified_map_blocks,
+        block_distances=block_distances,
+        embeddings=embeddings
+    )
+    return cluster_result, unified_map_blocks or []
+
+def cluster_shared_block(
+        condensed: Optional[np.ndarray],
+        graph_data: Optional[np.ndarray],
+        graph_indices: Optional[np.ndarray],
+        graph_indptr: Optional[np.ndarray],
+        embeddings: Optional[np.ndarray],
+        n: int,
+        k: Optional[int],
+        source: Optional[str],
+        *args
+) -> Tuple[Optional[Dict], List[Dict]]:
+    """Worker side of `run_block_clustering`: `cluster_block` over the block's attached shared arrays."""
+    block_distances = SharedBlockDistances.attach(condensed, graph_data, graph_indices, graph_indptr, n, k, source)
+    return cluster_block(*args, block_distances, embeddings)
+
+async def run_block_clustering(
+        texts: List[str],
+        input_data: CSVDistanceInput,
+        block_id: str,
+        block_values: Optional[List[str]],
+        string_counts: np.ndarray,
+        preserved_fields: pl.DataFrame,
+        block_distances: BlockDistances,
+        embeddings: Optional[np.ndarray] = None,
+        use_worker: bool = False
+) -> Tuple[Optional[Dict], List[Dict]]:
+    """Run `cluster_block` in a worker process with `use_worker`, otherwise on the distance executor.
+
+    The worker attaches to the distances and embeddings in shared memory
+    rather than receiving them pickled; the segments are unlinked once the
+    block is clustered.
+    """
+    args = (texts, input_data, block_id, block_values, string_counts, preserved_fields)
+    if use_worker and worker_pool.available:
+        shared_distances = SharedBlockDistances(block_distances)
+        shared_embeddings = SharedArray.from_array(embeddings) if embeddings is not None else None
+        try:
+            return await worker_pool.run(
+                run_attached,
+                cluster_shared_block,
+                (*shared_distances.handles, shared_embeddings.handle if shared_embeddings is not None else None),
+                *shared_distances.args,
+                *args
+            )
+        except Exception as e:
+            logger.error(f"Block clustering in the worker pool failed: {str(e)}")
+            logger.info("Falling back to the distance executor")
+        finally:
+            shared_distances.close()
+            if shared_embeddings is not None:
+                shared_embeddings.close()
+
+    # Linkage, outliers and reduction are CPU-bound, keep them off the event loop
+    return await distance_executor.run(cluster_block, *args, block_distances, embeddings)
+
+async def process_block(
+        block_idx: int,
+        block_df: pl.DataFrame,
+        input_data: CSVDistanceInput
+) -> Optional[Tuple[DistanceResults, Optional[Dict], List[Dict]]]:
+    """
+    Compute the distances, and the clustering if requested, of one block.
+
+    Returns:
+        Tuple of (results, cluster result or None, unified map entries), or
+        None when the block is skipped or fails
+    """
+    try:
+        # Process block data
+        block_id, block_values = get_block_id(block_df, block_idx, input_data.blocking_keys)
+        texts, preserved_fields, string_counts = process_csv_for_distances(
+            block_df, input_data.fields, input_data.separator
+        )
+
+        if len(texts) < 2:
+            return None
+
+        # Embed once for kNN candidates, the cosine kernel and the reduction
+        embeddings = await create_block_embeddings(texts, input_data)
+
+        # Enumerate pairs lazily, tile by tile
+        if input_data.compare_mode == "knn":
+            idx1, idx2 = await generate_knn_pairs(texts, input_data, embeddings)
+            pair_tiles, num_pairs = iter_index_tiles(idx1, idx2), len(idx1)
+        else:
+            pair_tiles = generate_pair_tiles(texts, input_data.compare_mode)
+            num_pairs = count_pairs(len(texts), input_data.compare_mode)
+
+        # Calculate distances
+        block_info = dict(zip(input_data.blocking_keys, block_values)) if input_data.blocking_keys else None
+        results = await process_distances(pair_tiles, num_pairs, texts, input_data, block_info, embeddings)
+
+        if not results:
+            return None
+
+        # Handle clustering if requested
+        cluster_result, block_map_entries = None, []
+        if input_data.clustering and len(results) > 1:
+            block_distances = await create_block_distances(results, texts, input_data)
+            cluster_result, block_map_entries = await run_block_clustering(
+                texts,
+                input_data,
+                block_id,
+                block_values,
+                string_counts,
+                preserved_fields,
+                block_distances,
+                embeddings,
+                use_worker=input_data.use_worker
+            )
+
+        # Add field information
+        add_field_information(results, preserved_fields)
+        return results, cluster_result, block_map_entries
+
+    except Exception as e:
+        logger.error(f"Error processing block {block_idx}: {str(e)}")
+        logger.error(traceback.format_exc())
+        return None
+
 async def process_csv_distances(
         df: pl.DataFrame,
         input_data: CSVDistanceInput
 ) -> Dict:
     """Process CSV for distances with preserved field values."""
     logger.info("Starting process_csv_distances")
+    check_tokenization(input_data.distance_types, input_data.tokenization)
 
     if df is None or df.height == 0:
         return {
@@ -328,61 +547,35 @@ async def process_csv_distances(
 
     try:
         # Setup blocks and results containers
-        blocks = setup_blocks(df, input_data.blocking_keys)
+        blocks = [
+            (block_idx, block_df)
+            for block_idx, block_df in enumerate(setup_blocks(df, input_data.blocking_keys))
+            if block_df.height >= 2
+        ]
         all_results = []
         all_cluster_results = []
         unified_map_blocks = [] if input_data.unified_map else None
 
-        # Process each block
-        for block_idx, block_df in enumerate(blocks):
-            if block_df.height < 2:
-                continue
+        # Process blocks concurrently, largest first, and merge them back in block order
+        costs = [
+            estimate_block_cost(block_df.height, input_data.compare_mode, input_data.knn_neighbors)
+            for _, block_df in blocks
+        ]
+        outcomes = await BlockScheduler().run(
+            lambda block: process_block(block[0], block[1], input_data),
+            blocks,
+            costs
+        )
 
-            try:
-                # Process block data
-                block_id, block_values = get_block_id(block_df, block_idx, input_data.blocking_keys)
-                texts, preserved_fields, string_counts = process_csv_for_distances(
-                    block_df, input_data.fields, input_data.separator
-                )
-
-                if len(texts) < 2:
-                    continue
-
-                # Generate and process pairs
-                pairs = generate_string_pairs(texts, input_data.compare_mode)
-                if not pairs:
-                    continue
-
-                # Calculate distances
-                block_info = dict(zip(input_data.blocking_keys, block_values)) if input_data.blocking_keys else None
-                results = await process_distances(pairs, input_data, block_info)
-
-                if not results:
-                    continue
-
-                # Handle clustering if requested
-                if input_data.clustering and len(pairs) > 1:
-                    cluster_result = process_clustering(
-                        texts=texts,
-                        results=results,
-                        input_data=input_data,
-                        block_id=block_id,
-                        block_values=block_values,
-                        string_counts=string_counts,
-                        preserved_fields=preserved_fields,
-                        unified_map_blocks=unified_map_blocks
-                    )
-                    if cluster_result:
-                        all_cluster_results.append(cluster_result)
-
-                # Add field information and collect results
-                add_field_information(results, texts, preserved_fields)
-                all_results.extend(results)
-
-            except Exception as e:
-                logger.error(f"Error processing block {block_idx}: {str(e)}")
-                logger.error(traceback.format_exc())
+        for outcome in outcomes:
+            if outcome is None:
                 continue
+            results, cluster_result, block_map_entries = outcome
+            if cluster_result:
+                all_cluster_results.append(cluster_result)
+            if unified_map_blocks is not None:
+                unified_map_blocks.extend(block_map_entries)
+            all_results.append(results)
 
         # Create response
         response = create_response(all_results, df, input_data, all_cluster_results, unified_map_blocks)
@@ -1,255 +1,346 @@
 
 import asyncio
-import multiprocessing
+import functools
 import traceback
-from typing import Optional, List, Dict
+from contextlib import ExitStack
+from typing import Callable, Optional, List, Dict, Iterable
 
 import numpy as np
 from rapidfuzz.distance import Levenshtein
 from scipy.stats import kurtosis, skew
 
-from .embeddings import calculate_cosine_distance
-from .levenshtein import calculate_levenshtein_distance
-from .tokens import calculate_token_distance
-from ...models.embeddings import get_model
+from .embeddings import calculate_cosine_for_indices, prepare_cosine_embeddings
+from .levenshtein import calculate_levenshtein_for_indices
+from .pairs import PairTile, upper_triangle_rows
+from .results import DistanceResults
+from .tiles import is_dense_pair_set
+from .tokens import TokenMatrix, check_tokenization, parse_token_distance_type
+from ..batching import get_batcher
+from .parallel import (
+    SharedEmbeddings,
+    SharedTokenMatrix,
+    parallel_cosine_distances,
+    parallel_cosine_rows,
+    parallel_token_distances
+)
+from ..executors import distance_executor, worker_pool
 from ...config.loggers import get_and_set_logger
 from ...models.distances import StringPair, DistanceType, ModelConfig
+from ...models.embedding_precision import QuantizedEmbeddings
+from ...models.embeddings import model_registry
 
 logger = get_and_set_logger(__name__)
 
-def calc_cosine_for_pair(args):
-    pair_idx, pair, string_to_idx, normalized_embeddings, prefix = args
-    i = string_to_idx[pair.string1]
-    j = string_to_idx[pair.string2]
-    similarity = np.dot(normalized_embeddings[i], normalized_embeddings[j])
-    distance = max(float(1 - similarity), 0)
+# Only use multiprocessing if explicitly requested and a tile has enough pairs
+PARALLEL_MIN_PAIRS = 1000
+
+# A distance type prepared for a block: maps a tile of pair indices to its distance columns
+DistanceKernel = Callable[[np.ndarray, np.ndarray], Dict[str, np.ndarray]]
+
+def levenshtein_columns(texts: List[str], idx1: np.ndarray, idx2: np.ndarray) -> Dict[str, np.ndarray]:
+    # rapidfuzz batches the pairs in C++ across all cores, no process pool needed
+    normalized, raw = calculate_levenshtein_for_indices(texts, idx1, idx2)
     return {
-        "string1": pair.string1,
-        "string2": pair.string2,
-        "distances": {prefix: distance}
+        "levenshtein": normalized,
+        "levenshtein_raw": raw
     }
 
-async def calculate_distances(
-        pairs: List[StringPair],
+def cosine_columns(
+        prefix: str,
+        embeddings: QuantizedEmbeddings,
+        shared_embeddings: Optional[SharedEmbeddings],
+        idx1: np.ndarray,
+        idx2: np.ndarray
+) -> Dict[str, np.ndarray]:
+    n = len(embeddings)
+    if shared_embeddings is not None and len(idx1) > PARALLEL_MIN_PAIRS:
+        row_range = upper_triangle_rows(n, idx1, idx2)
+        # Any other dense pair set is cheaper as the sequential tiled product than as per-pair gathers
+        if row_range is not None or not is_dense_pair_set(n, idx1, idx2):
+            try:
+                # Workers read the embeddings from shared memory, nothing large is pickled
+                if row_range is not None:
+                    # Whole upper-triangle rows (all-pairs tiles): row-range matrix products
+                    distances = parallel_cosine_rows(shared_embeddings, *row_range)
+                else:
+                    distances = parallel_cosine_distances(shared_embeddings, idx1, idx2)
+                logger.debug(f"Cosine multiprocessing completed with {len(distances)} results")
+                return {prefix: distances}
+            except Exception as e:
+                logger.error(f"Cosine multiprocessing failed: {e}")
+                logger.info("Falling back to sequential processing")
+
+    # Sequential path: row-tile matrix products for dense pair sets, row-wise dot products otherwise
+    return {prefix: calculate_cosine_for_indices(embeddings, idx1, idx2)}
+
+def token_columns(
+        distance_type: str,
+        token_matrix: TokenMatrix,
+        shared_token_matrix: Optional[SharedTokenMatrix],
+        idx1: np.ndarray,
+        idx2: np.ndarray
+) -> Dict[str, np.ndarray]:
+    if shared_token_matrix is not None and len(idx1) > PARALLEL_MIN_PAIRS:
+        try:
+            # Module-level chunk tasks over pair ranges, reading the token matrix from shared memory
+            distances = parallel_token_distances(shared_token_matrix, idx1, idx2)
+            logger.debug(f"Token multiprocessing completed with {len(distances)} results")
+            return {distance_type: distances}
+        except Exception as e:
+            logger.error(f"Token multiprocessing failed: {e}")
+            logger.info("Falling back to sequential processing")
+
+    # Sequential path: sparse matrix products over the texts tokenized once
+    return {distance_type: token_matrix.distances(idx1, idx2)}
+
+async def prepare_distance_kernel(
+        texts: List[str],
         distance_type: DistanceType,
         model_id: Optional[str] = None,
         distance_prefix: Optional[str] = None,
         tokenization: str = "words",
         use_worker: bool = False,
-        batch_size: int = 32
-) -> List[Dict]:
-    """Calculate distances between pairs of strings using various methods with parallel processing."""
-    logger.info(f"Starting distance calculation: {distance_type}, model: {model_id}, prefix: {distance_prefix}")
-
-    # Only use multiprocessing if explicitly requested and we have enough pairs
-    use_parallel = use_worker and len(pairs) > 1000
+        batch_size: int = 32,
+        embeddings: Optional[np.ndarray] = None,
+        resources: Optional[ExitStack] = None
+) -> DistanceKernel:
+    """
+    Prepare one distance type for the strings of a block.
+
+    Per-string work (embeddings, tokenization) is done once here; the returned
+    kernel then computes the distance columns of any tile of index pairs into
+    `texts`, so pairs can be streamed through it without being materialized.
+    Cosine kernels use `embeddings` of `texts` when the caller already has them.
+    Token distance types carry their tokenization (e.g. `jaccard_ngrams`);
+    the deprecated `tokenization` option is ignored.
+
+    With `use_worker`, the block's embeddings or token matrix are copied into
+    shared memory for the worker pool. The segments are registered on
+    `resources`, which the caller closes after the last tile; without it the
+    kernel stays sequential.
+    """
+    logger.info(f"Preparing distance calculation: {distance_type}, model: {model_id}, prefix: {distance_prefix}")
 
     if distance_type == "levenshtein":
-        pair_inputs = [(pair.string1, pair.string2) for pair in pairs]
-
-        if use_parallel:
-            try:
-                with multiprocessing.Pool() as pool:
-                    results = pool.map(calculate_levenshtein_distance, pair_inputs)
-                    logger.info(f"Multiprocessing completed with {len(results)} results")
-                return results
-            except Exception as e:
-                logger.error(f"Multiprocessing failed: {e}")
-                logger.info("Falling back to sequential processing")
-
-        results = [calculate_levenshtein_distance(pair) for pair in pair_inputs]
-        logger.info(f"Sequential processing completed with {len(results)} results")
-        return results
+        return functools.partial(levenshtein_columns, texts)
 
     elif distance_type == "cosine":
-        # Get the embedding model
-        model = get_model(model_id)
         prefix = distance_prefix or f"{model_id}_cosine"
 
-        # For cosine, we need to get embeddings first, which is I/O bound
-        # So we get embeddings in batches, then can parallelize the distance calculations
-
-        # Get unique strings and create mapping
-        unique_strings = list({pair.string1 for pair in pairs} | {pair.string2 for pair in pairs})
-        string_to_idx = {s: i for i, s in enumerate(unique_strings)}
-
-        # Get embeddings (this is more efficient done in batches)
-        embeddings = model.get_embeddings(unique_strings, batch_size)
-        normalized_embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
-
-        # Now we can parallelize the distance calculations
-        if use_parallel:
-            try:
-                args_list = [(idx, pair, string_to_idx, normalized_embeddings, prefix)
-                             for idx, pair in enumerate(pairs)]
-                with multiprocessing.Pool() as pool:
-                    results = pool.map(calc_cosine_for_pair, args_list)
-                    logger.info(f"Cosine multiprocessing completed with {len(results)} results")
-                return results
-            except Exception as e:
-                logger.error(f"Cosine multiprocessing failed: {e}")
-                logger.info("Falling back to sequential processing")
-
-        # Sequential fallback
-        results = []
-        for pair in pairs:
-            i = string_to_idx[pair.string1]
-            j = string_to_idx[pair.string2]
-            similarity = np.dot(normalized_embeddings[i], normalized_embeddings[j])
-            distance = max(float(1 - similarity), 0)
-            results.append({
-                "string1": pair.string1,
-                "string2": pair.string2,
-                "distances": {prefix: distance}
-            })
-
-        logger.info(f"Sequential cosine completed with {len(results)} results")
-        return results
+        # For cosine, we need to get embeddings first; small requests are micro-batched
+        # with concurrent ones
+        if embeddings is None:
+            embeddings = await get_batcher(model_id).embed(texts, batch_size)
+        normalized_embeddings = await distance_executor.run(
+            prepare_cosine_embeddings, embeddings, model_registry.get_precision(model_id)
+        )
+
+        # Copied into shared memory once per block, unlinked when the caller closes `resources`
+        shared_embeddings = None
+        if use_worker and worker_pool.available and resources is not None:
+            shared_embeddings = await distance_executor.run(SharedEmbeddings, normalized_embeddings)
+            resources.callback(shared_embeddings.close)
+        return functools.partial(cosine_columns, prefix, normalized_embeddings, shared_embeddings)
 
     elif distance_type.startswith(("jaccard_", "cosine_token_")):
-        # For token-based distances, we can directly parallelize
-        if use_parallel:
-            try:
-                # Create a function for pool.map
-                def calc_token_for_pair(pair):
-                    result = calculate_token_distance(
-                        pair.string1,
-                        pair.string2,
-                        distance_type.split("_")[0],
-                        tokenization
-                    )
-                    return {
-                        "string1": result["string1"],
-                        "string2": result["string2"],
-                        "distances": {
-                            f"{distance_type}": result["distance"]
-                        }
-                    }
-
-                with multiprocessing.Pool() as pool:
-                    results = pool.map(calc_token_for_pair, pairs)
-                    logger.info(f"Token multiprocessing completed with {len(results)} results")
-                return results
-            except Exception as e:
-                logger.error(f"Token multiprocessing failed: {e}")
-                logger.info("Falling back to sequential processing")
+        # The distance type carries both the metric and the tokenization, e.g. cosine_token_ngrams
+        metric, tokenization = parse_token_distance_type(distance_type)
+        token_matrix = await distance_executor.run(TokenMatrix.build, texts, metric, tokenization)
 
-        # Sequential fallback
-        results = []
-        for pair in pairs:
-            result = calculate_token_distance(
-                pair.string1,
-                pair.string2,
-                distance_type.split("_")[0],
-                tokenization
-            )
-            results.append({
-                "string1": result["string1"],
-                "string2": result["string2"],
-                "distances": {
-                    f"{distance_type}": result["distance"]
-                }
-            })
-
-        logger.info(f"Sequential token completed with {len(results)} results")
-        return results
+        shared_token_matrix = None
+        if use_worker and worker_pool.available and resources is not None:
+            shared_token_matrix = await distance_executor.run(SharedTokenMatrix, token_matrix)
+            resources.callback(shared_token_matrix.close)
+        return functools.partial(token_columns, distance_type, token_matrix, shared_token_matrix)
 
     else:
         raise ValueError(f"Unknown distance type: {distance_type}")
 
+async def calculate_distance_columns(
+        results: DistanceResults,
+        distance_type: DistanceType,
+        model_id: Optional[str] = None,
+        distance_prefix: Optional[str] = None,
+        tokenization: str = "words",
+        use_worker: bool = False,
+        batch_size: int = 32
+) -> Dict[str, np.ndarray]:
+    """Calculate one distance type for every pair in `results`, returning one array per metric prefix."""
+    with ExitStack() as resources:
+        kernel = await prepare_distance_kernel(
+            results.texts,
+            distance_type,
+            model_id=model_id,
+            distance_prefix=distance_prefix,
+            tokenization=tokenization,
+            use_worker=use_worker,
+            batch_size=batch_size,
+            resources=resources
+        )
+        columns = await distance_executor.run(kernel, results.idx1, results.idx2)
+    logger.info(f"{distance_type} completed with {len(results)} results")
+    return columns
 
-async def calculate_all_distances(
+async def calculate_distances(
         pairs: List[StringPair],
+        distance_type: DistanceType,
+        model_id: Optional[str] = None,
+        distance_prefix: Optional[str] = None,
+        tokenization: str = "words",
+        use_worker: bool = False,
+        batch_size: int = 32
+) -> List[Dict]:
+    """Calculate distances between pairs of strings using various methods with parallel processing."""
+    check_tokenization([distance_type], tokenization)
+    return await calculate_result_distances(
+        DistanceResults.from_pairs(pairs),
+        distance_type,
+        model_id=model_id,
+        distance_prefix=distance_prefix,
+        tokenization=tokenization,
+        use_worker=use_worker,
+        batch_size=batch_size
+    )
+
+async def calculate_result_distances(
+        results: DistanceResults,
+        distance_type: DistanceType,
+        model_id: Optional[str] = None,
+        distance_prefix: Optional[str] = None,
+        tokenization: str = "words",
+        use_worker: bool = False,
+        batch_size: int = 32
+) -> List[Dict]:
+    """Like `calculate_distances`, for pairs already given as index arrays (no StringPair models)."""
+    results.update(await calculate_distance_columns(
+        results,
+        distance_type,
+        model_id=model_id,
+        distance_prefix=distance_prefix,
+        tokenization=tokenization,
+        use_worker=use_worker,
+        batch_size=batch_size
+    ))
+    return results.to_dicts()
+
+
+async def calculate_all_distances(
+        pairs: Optional[List[StringPair]],
         distance_types: List[DistanceType],
         embedding_models: Optional[List[ModelConfig]] = None,
         use_worker: bool = False,
         batch_size: int = 32,
-        tokenization: str = "words"
-) -> List[Dict]:
-    """Calculate distances using multiple models with proper prefixing."""
-    logger.info(f"Starting calculate_all_distances with {len(pairs)} pairs")
+        tokenization: str = "words",
+        texts: Optional[List[str]] = None,
+        pair_tiles: Optional[Iterable[PairTile]] = None,
+        num_pairs: Optional[int] = None,
+        embeddings: Optional[Dict[str, np.ndarray]] = None
+) -> Optional[DistanceResults]:
+    """Calculate distances using multiple models with proper prefixing.
+
+    Pairs are given either as `pairs`, or (with `pairs=None`) as `pair_tiles`, an iterable (typically
+    the lazy `iter_pair_tiles` generator) of index arrays into `texts`, holding
+    `num_pairs` pairs in total. Every distance type is prepared once, then the
+    tiles flow through all of them one at a time and are written into columns
+    allocated once, so only one tile of indices and intermediates is alive at
+    once next to the result.
+    `embeddings` maps model ids to vectors of `texts` already computed by the caller.
+
+    Returns a columnar DistanceResults indexing into `texts` (or the unique strings
+    of `pairs` when not given), or None if nothing could be calculated.
+    """
     logger.info(f"Calculating distance types: {distance_types}")
 
     try:
-        distance_tasks = []
-
-        for dist_type in distance_types:
-            if dist_type == "levenshtein":
-                distance_tasks.append(
-                    calculate_distances(
-                        pairs, "levenshtein",
-                        distance_prefix="levenshtein",
-                        use_worker=use_worker,
-                        batch_size=batch_size
+        if pair_tiles is None:
+            single = DistanceResults.from_pairs(pairs, texts)
+            texts = single.texts
+            pair_tiles = [(single.idx1, single.idx2)]
+            num_pairs = len(single)
+        elif texts is None or num_pairs is None:
+            raise ValueError("pair_tiles need the texts they index into and their num_pairs")
+
+        # Shared memory set up for the worker pool is owned here and unlinked after the last tile
+        with ExitStack() as resources:
+            kernel_tasks = []
+
+            for dist_type in distance_types:
+                if dist_type == "levenshtein":
+                    kernel_tasks.append(
+                        prepare_distance_kernel(
+                            texts, "levenshtein",
+                            distance_prefix="levenshtein",
+                            use_worker=use_worker,
+                            batch_size=batch_size,
+                            resources=resources
+                        )
                     )
-                )
-            elif dist_type == "cosine":
-                # Handle multiple embedding models for cosine distance
-                if embedding_models:
-                    for model_config in embedding_models:
-                        distance_tasks.append(
-                            calculate_distances(
-                                pairs,
-                                "cosine",
-                                model_id=model_config.model_id,
-                                distance_prefix=model_config.distance_prefix or f"{model_config.model_id}_cosine",
-                                use_worker=use_worker,
-                                batch_size=batch_size
+                elif dist_type == "cosine":
+                    # Handle multiple embedding models for cosine distance
+                    if embedding_models:
+                        for model_config in embedding_models:
+                            kernel_tasks.append(
+                                prepare_distance_kernel(
+                                    texts,
+                                    "cosine",
+                                    model_id=model_config.model_id,
+                                    distance_prefix=model_config.distance_prefix or f"{model_config.model_id}_cosine",
+                                    use_worker=use_worker,
+                                    batch_size=batch_size,
+                                    embeddings=(embeddings or {}).get(model_config.model_id),
+                                    resources=resources
+                                )
                             )
-                        )
+                    else:
+                        logger.warning("Cosine distance requested but no embedding models provided")
                 else:
-                    logger.warning("Cosine distance requested but no embedding models provided")
-            else:
-                # Handle token-based distances with proper prefix
-                distance_tasks.append(
-                    calculate_distances(
-                        pairs,
-                        dist_type,
-                        distance_prefix=dist_type,
-                        tokenization=tokenization,
-                        use_worker=use_worker,
-                        batch_size=batch_size
+                    # Handle token-based distances with proper prefix
+                    kernel_tasks.append(
+                        prepare_distance_kernel(
+                            texts,
+                            dist_type,
+                            distance_prefix=dist_type,
+                            tokenization=tokenization,
+                            use_worker=use_worker,
+                            batch_size=batch_size,
+                            resources=resources
+                        )
                     )
-                )
-
-        if not distance_tasks:
-            logger.error("No valid distance calculations to perform")
-            return []
-
-        # Run all distance calculations concurrently
-        all_results = await asyncio.gather(*distance_tasks)
-
-        # Combine results for each pair
-        combined_results = []
-        for pair_idx in range(len(pairs)):
-            combined_distances = {}
-            pair_info = None
-
-            for result_set in all_results:
-                if result_set and len(result_set) > pair_idx:
-                    result = result_set[pair_idx]
-                    if not pair_info:
-                        pair_info = {
-                            "string1": result["string1"],
-                            "string2": result["string2"]
-                        }
-
-                    # Merge distances dictionaries
-                    if "distances" in result:
-                        combined_distances.update(result["distances"])
-
-            if combined_distances and pair_info:
-                combined_results.append({
-                    **pair_info,
-                    "distances": combined_distances
-                })
-
-        return combined_results
+
+            if not kernel_tasks:
+                logger.error("No valid distance calculations to perform")
+                return None
+
+            # Let every preparation finish, so no shared segment is created after the stack is closed
+            kernels = await asyncio.gather(*kernel_tasks, return_exceptions=True)
+            for kernel in kernels:
+                if isinstance(kernel, BaseException):
+                    raise kernel
+
+            # Stream the tiles through every kernel, running the kernels of a tile concurrently,
+            # and write each tile into its slice of the result columns
+            results = DistanceResults.allocate(texts, num_pairs)
+            position = 0
+            num_tiles = 0
+            for idx1, idx2 in pair_tiles:
+                idx1 = np.asarray(idx1, dtype=np.int32)
+                idx2 = np.asarray(idx2, dtype=np.int32)
+                columns = {}
+                for kernel_columns in await asyncio.gather(*(distance_executor.run(kernel, idx1, idx2) for kernel in kernels)):
+                    columns.update(kernel_columns)
+                position = results.write(position, idx1, idx2, columns)
+                num_tiles += 1
+
+            if position != num_pairs:
+                raise ValueError(f"Pair tiles held {position} pairs, expected {num_pairs}")
+
+            logger.info(f"Calculated {len(results)} pairs in {num_tiles} tiles")
+            return results
 
     except Exception as e:
         logger.error(f"Error in calculate_all_distances: {str(e)}")
         logger.error(traceback.format_exc())
-        return []
+        return None
 
 def calculate_cluster_metrics(distances: np.ndarray, Z: np.ndarray) -> Dict:
     c_distances = Z[:, 2]
@@ -0,0 +1,148 @@
+from typing import Dict, Optional
+
+import numpy as np
+from scipy import sparse
+
+from .condensed import condensed_size, condensed_positions, condensed_to_square
+from .knn import KNNGraph
+from ..shared_arrays import SharedArray
+
+
+class BlockDistances:
+    """Clustering distances of one block, computed once and shared by every consumer.
+
+    Holds the condensed vector (or the kNN graph of a `knn` mode block) along
+    with the column it came from. The square matrix is only built the first
+    time a consumer asks for it and is then kept, so linkage, outlier
+    detection and dimensionality reduction all read the same arrays instead
+    of each expanding the condensed vector again.
+    """
+
+    def __init__(
+            self,
+            n: int,
+            condensed: Optional[np.ndarray] = None,
+            knn_graph: Optional[KNNGraph] = None,
+            square: Optional[np.ndarray] = None,
+            source: Optional[str] = None
+    ):
+        if condensed is None and knn_graph is None:
+            raise ValueError("BlockDistances needs a condensed vector or a kNN graph")
+        self.n = n
+        self.condensed = condensed
+        self.knn_graph = knn_graph
+        self.source = source
+        self._square = square
+
+    @classmethod
+    def from_pairs(
+            cls,
+            n: int,
+            idx1: np.ndarray,
+            idx2: np.ndarray,
+            distances: Optional[np.ndarray],
+            source: Optional[str] = None
+    ) -> 'BlockDistances':
+        """Scatter per-pair distances into a condensed vector; pairs that were not compared stay at 0."""
+        condensed = np.zeros(condensed_size(n), dtype=np.float32)
+        if distances is not None and len(distances):
+            low, high = np.minimum(idx1, idx2), np.maximum(idx1, idx2)
+            condensed[condensed_positions(low, high, n)] = distances
+        return cls(n, condensed=condensed, source=source)
+
+    @classmethod
+    def wrap(
+            cls,
+            distances,
+            n: int,
+            knn_graph: Optional[KNNGraph] = None,
+            square: Optional[np.ndarray] = None
+    ) -> 'BlockDistances':
+        """Accept either a BlockDistances or the separate condensed / graph / square arguments."""
+        if isinstance(distances, cls):
+            return distances
+        return cls(n, condensed=distances, knn_graph=knn_graph, square=square)
+
+    @property
+    def is_graph(self) -> bool:
+        return self.knn_graph is not None
+
+    @property
+    def square(self) -> np.ndarray:
+        """Square matrix of the condensed vector, built on first access."""
+        if self._square is None:
+            if self.condensed is None:
+                raise ValueError("A kNN graph block has no dense square matrix")
+            self._square = condensed_to_square(self.condensed, self.n)
+        return self._square
+
+    @property
+    def nbytes(self) -> int:
+        total = 0
+        if self.condensed is not None:
+            total += self.condensed.nbytes
+        if self._square is not None:
+            total += self._square.nbytes
+        if self.knn_graph is not None:
+            graph = self.knn_graph.graph
+            total += graph.data.nbytes + graph.indices.nbytes + graph.indptr.nbytes
+        return total
+
+    def metadata(self) -> Dict:
+        return {
+            "points": self.n,
+            "kind": "knn_graph" if self.is_graph else "condensed",
+            "source": self.source,
+            "nbytes": self.nbytes
+        }
+
+
+class SharedBlockDistances:
+    """A block's clustering distances copied once into shared memory for the worker pool.
+
+    `handles` are the condensed vector and the kNN graph's CSR arrays (None
+    for the kind the block does not have); a worker rebuilds the
+    BlockDistances from the attached arrays with `attach`.
+    """
+
+    def __init__(self, block_distances: BlockDistances):
+        if block_distances.is_graph:
+            graph = block_distances.knn_graph.graph
+            arrays = [None, graph.data, graph.indices, graph.indptr]
+            self.k = block_distances.knn_graph.k
+        else:
+            arrays = [block_distances.condensed, None, None, None]
+            self.k = None
+        self.arrays = [SharedArray.from_array(array) if array is not None else None for array in arrays]
+        self.n = block_distances.n
+        self.source = block_distances.source
+
+    @property
+    def handles(self):
+        return tuple(array.handle if array is not None else None for array in self.arrays)
+
+    @property
+    def args(self):
+        """What `attach` needs besides the arrays."""
+        return self.n, self.k, self.source
+
+    @staticmethod
+    def attach(
+            condensed: Optional[np.ndarray],
+            data: Optional[np.ndarray],
+            indices: Optional[np.ndarray],
+            indptr: Optional[np.ndarray],
+            n: int,
+            k: Optional[int],
+            source: Optional[str]
+    ) -> BlockDistances:
+        """Worker side: BlockDistances over the attached arrays, without copying them."""
+        if condensed is not None:
+            return BlockDistances(n, condensed=condensed, source=source)
+        graph = sparse.csr_matrix((data, indices, indptr), shape=(n, n), copy=False)
+        return BlockDistances(n, knn_graph=KNNGraph(graph, k), source=source)
+
+    def close(self) -> None:
+        for array in self.arrays:
+            if array is not None:
+                array.close()
@@ -0,0 +1,55 @@
+from typing import Optional
+
+import numpy as np
+
+
+def condensed_size(n: int) -> int:
+    """Length of the condensed distance vector of n points."""
+    return n * (n - 1) // 2
+
+
+def condensed_positions(low: np.ndarray, high: np.ndarray, n: int) -> np.ndarray:
+    """Positions of pairs (low, high), low < high, in a condensed vector (scipy `pdist` order)."""
+    low = np.asarray(low, dtype=np.int64)
+    high = np.asarray(high, dtype=np.int64)
+    return n * low - low * (low + 1) // 2 + high - low - 1
+
+
+def condensed_to_square(
+        condensed: np.ndarray,
+        n: Optional[int] = None,
+        dtype=np.float32
+) -> np.ndarray:
+    """
+    Expand a condensed distance vector into a symmetric square matrix.
+
+    Equivalent to `scipy.spatial.distance.squareform`, but fills one row
+    segment (and its mirrored column) per step in the requested dtype,
+    without a float64 intermediate.
+
+    Args:
+        condensed: Distances in `pdist` order
+        n: Number of points; inferred from the vector length when omitted
+        dtype: Dtype of the matrix (float32 halves the memory of float64)
+
+    Returns:
+        The (n, n) distance matrix with a zero diagonal
+    """
+    condensed = np.asarray(condensed)
+    if n is None:
+        n = int(round((1 + np.sqrt(1 + 8 * condensed.size)) / 2))
+    if condensed.size != condensed_size(n):
+        raise ValueError(f"Condensed vector has {condensed.size} values, expected {condensed_size(n)} for {n} points")
+
+    square = np.empty((n, n), dtype=dtype)
+
+    start = 0
+    for i in range(n - 1):
+        segment = condensed[start:start + n - i - 1]
+        square[i, i + 1:] = segment
+        square[i + 1:, i] = segment
+        start += n - i - 1
+    np.fill_diagonal(square, 0)
+
+    return square
+
@@ -4,13 +4,69 @@ from typing import Optional, List, Dict
 import numpy as np
 from rapidfuzz.distance import Levenshtein
 
+from .tiles import is_dense_pair_set, gather_upper_tiles
 from .tokens import calculate_token_distance
 from ...models.embeddings import get_model
+from ...models.embedding_precision import QuantizedEmbeddings
 from ...config.loggers import get_and_set_logger
 from ...models.distances import StringPair, DistanceType
 
 logger = get_and_set_logger(__name__)
 
+COSINE_TILE_SIZE = 1024
+
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalize embedding rows as float32, leaving zero vectors untouched."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+def prepare_cosine_embeddings(embeddings: np.ndarray, precision: str = "float32") -> QuantizedEmbeddings:
+    """Normalize embeddings and hold them at the model's storage precision for the cosine kernels."""
+    return QuantizedEmbeddings.quantize(normalize_embeddings(embeddings), precision)
+
+def calculate_cosine_for_indices(
+        normalized_embeddings,
+        idx1: np.ndarray,
+        idx2: np.ndarray,
+        tile_size: int = COSINE_TILE_SIZE
+) -> np.ndarray:
+    """
+    Calculate cosine distances for index pairs into normalized embeddings.
+
+    Dense pair sets (e.g. all pairs of a block) are computed as one matrix
+    product per row tile of the upper triangle, `E[start:stop] @ E[start:].T`,
+    and gathered, so peak memory is bounded by tile_size * n. Reduced-precision
+    embeddings are decoded to float32 once per tile, since NumPy has no fast
+    float16 or int8 matrix product on CPU. Sparse pair sets (e.g. consecutive
+    rows or kNN candidates) take a row-wise dot product of just the requested
+    pairs.
+
+    Args:
+        normalized_embeddings: L2-normalized embeddings, one row per string, as an
+            array or QuantizedEmbeddings
+        idx1: First index of every pair
+        idx2: Second index of every pair
+        tile_size: Number of rows per tile
+
+    Returns:
+        Float32 distances aligned with the indices
+    """
+    normalized_embeddings = QuantizedEmbeddings.wrap(normalized_embeddings)
+    n = len(normalized_embeddings)
+
+    if not is_dense_pair_set(n, idx1, idx2):
+        similarities = np.einsum("ij,ij->i", normalized_embeddings.take(idx1), normalized_embeddings.take(idx2))
+        return np.maximum(1 - similarities, 0)
+
+    def compute_tile(start, stop):
+        similarities = normalized_embeddings.rows(start, stop) @ normalized_embeddings.rows(start, n).T
+        return (np.maximum(1 - similarities, 0),)
+
+    (distances,) = gather_upper_tiles(n, idx1, idx2, compute_tile, tile_size, (np.float32,))
+    return distances
+
 def calculate_cosine_distance(pairs: List[StringPair], model, batch_size: int, distance_prefix: str = "cosine") -> List[Dict]:
     """Calculate cosine distance using embeddings with proper prefix."""
     # Get unique strings and create mapping
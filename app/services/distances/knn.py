@@ -0,0 +1,303 @@
+from typing import List, Tuple, Union
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import minimum_spanning_tree, connected_components
+
+from .condensed import condensed_positions
+from .tokens import build_token_matrix
+from ...config.loggers import get_and_set_logger
+
+logger = get_and_set_logger(__name__)
+
+# Below this many rows the exact neighbours are cheaper than building an index
+KNN_EXACT_MAX_ROWS = 5000
+KNN_TILE_SIZE = 1024
+
+# Stand-in for zero distances, which sparse graph routines would drop as missing edges
+_MIN_EDGE = 1e-12
+
+
+def ngram_vectors(texts: List[str]) -> sparse.csr_matrix:
+    """Character trigram counts used as candidate vectors for string metrics.
+
+    Texts are padded with a space on each side so strings shorter than three
+    characters still get trigrams.
+    """
+    return build_token_matrix([f" {text} " for text in texts], "ngrams")
+
+
+def _normalize_rows(vectors: Union[np.ndarray, sparse.csr_matrix]) -> Union[np.ndarray, sparse.csr_matrix]:
+    if sparse.issparse(vectors):
+        norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.diags(1 / norms).dot(vectors).tocsr().astype(np.float32)
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _exact_cosine_neighbors(vectors, k: int, tile_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    normalized = _normalize_rows(vectors)
+    n = normalized.shape[0]
+    neighbors = np.empty((n, k), dtype=np.int32)
+    distances = np.empty((n, k), dtype=np.float32)
+
+    for start in range(0, n, tile_size):
+        stop = min(start + tile_size, n)
+        similarities = normalized[start:stop] @ normalized.T
+        if sparse.issparse(similarities):
+            similarities = similarities.toarray()
+        similarities = np.asarray(similarities, dtype=np.float32)
+        # Never return a row as its own neighbour
+        similarities[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top_similarities = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_similarities, axis=1)
+        neighbors[start:stop] = np.take_along_axis(top, order, axis=1)
+        distances[start:stop] = 1 - np.take_along_axis(top_similarities, order, axis=1)
+
+    return neighbors, np.maximum(distances, 0)
+
+
+def find_cosine_neighbors(
+        vectors: Union[np.ndarray, sparse.csr_matrix],
+        k: int,
+        tile_size: int = KNN_TILE_SIZE
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the k nearest rows of every row by cosine distance, excluding the row itself.
+
+    Up to `KNN_EXACT_MAX_ROWS` rows the search is exact, with tiled products.
+    Larger inputs go through a pynndescent index (the ANN library UMAP already
+    depends on), which accepts both dense embeddings and sparse n-gram counts.
+
+    Args:
+        vectors: Dense embeddings or a sparse document-token matrix, one row per string
+        k: Number of neighbours per row
+        tile_size: Rows multiplied per step of the exact search
+
+    Returns:
+        Tuple of (neighbour indices, cosine distances), both of shape (n, k); -1 marks a
+        slot the index could not fill
+    """
+    n = vectors.shape[0]
+    k = min(k, n - 1)
+    if n <= KNN_EXACT_MAX_ROWS:
+        return _exact_cosine_neighbors(vectors, k, tile_size)
+
+    from pynndescent import NNDescent
+
+    if sparse.issparse(vectors):
+        vectors = vectors.astype(np.float32)
+    else:
+        vectors = np.asarray(vectors, dtype=np.float32)
+
+    index = NNDescent(vectors, metric="cosine", n_neighbors=k + 1, random_state=42, low_memory=True)
+    neighbors, distances = index.neighbor_graph
+
+    # Drop each row itself (usually, but not always, the first column)
+    is_self = neighbors == np.arange(n)[:, None]
+    order = np.argsort(is_self, axis=1, kind="stable")[:, :k]
+    neighbors = np.take_along_axis(neighbors, order, axis=1).astype(np.int32)
+    distances = np.take_along_axis(distances, order, axis=1).astype(np.float32)
+
+    logger.info(f"Approximate {k}-NN search over {n} rows")
+    return neighbors, distances
+
+
+def knn_pair_indices(neighbors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Unique undirected pairs (i < j) of a neighbour table, sorted by (i, j)."""
+    n, k = neighbors.shape
+    rows = np.repeat(np.arange(n, dtype=np.int64), k)
+    cols = neighbors.ravel().astype(np.int64)
+
+    valid = (cols >= 0) & (cols != rows)
+    keys = np.unique(np.minimum(rows, cols)[valid] * n + np.maximum(rows, cols)[valid])
+    return (keys // n).astype(np.int32), (keys % n).astype(np.int32)
+
+
+class KNNGraph:
+    """Sparse k-nearest-neighbour distance graph of a block.
+
+    Row i of `graph` holds the exact distances from string i to its (at most)
+    k nearest strings among the compared pairs, in ascending order. It is what
+    clustering, outlier detection and UMAP use in `knn` compare mode in place
+    of a condensed distance vector.
+    """
+
+    def __init__(self, graph: sparse.csr_matrix, k: int):
+        self.graph = graph
+        self.k = k
+
+    @classmethod
+    def from_pairs(
+            cls,
+            n: int,
+            idx1: np.ndarray,
+            idx2: np.ndarray,
+            distances: np.ndarray,
+            k: int
+    ) -> 'KNNGraph':
+        """Keep the k nearest of every string's compared pairs."""
+        rows = np.concatenate([idx1, idx2]).astype(np.int64)
+        cols = np.concatenate([idx2, idx1]).astype(np.int32)
+        values = np.concatenate([distances, distances]).astype(np.float32)
+        return cls._from_edges(n, rows, cols, values, k)
+
+    @classmethod
+    def from_neighbors(cls, neighbors: np.ndarray, distances: np.ndarray) -> 'KNNGraph':
+        """Graph of a neighbour table as returned by `find_cosine_neighbors` (-1 slots are skipped)."""
+        n, k = neighbors.shape
+        rows = np.repeat(np.arange(n, dtype=np.int64), k)
+        cols = neighbors.ravel()
+        valid = cols >= 0
+        return cls._from_edges(n, rows[valid], cols[valid].astype(np.int32), distances.ravel()[valid], k)
+
+    @classmethod
+    def from_condensed(
+            cls,
+            condensed: np.ndarray,
+            n: int,
+            k: int,
+            tile_size: int = 256
+    ) -> 'KNNGraph':
+        """
+        Exact kNN graph of a condensed distance vector, without building the square matrix.
+
+        Rows are read `tile_size` at a time by indexing the condensed vector,
+        so memory stays at a few tile_size * n arrays.
+        """
+        k = min(k, n - 1)
+        neighbors = np.empty((n, k), dtype=np.int32)
+        distances = np.empty((n, k), dtype=np.float32)
+        cols = np.arange(n, dtype=np.int64)
+
+        for start in range(0, n, tile_size):
+            stop = min(start + tile_size, n)
+            rows = np.arange(start, stop, dtype=np.int64)[:, None]
+            low, high = np.minimum(rows, cols), np.maximum(rows, cols)
+            positions = condensed_positions(low, high, n)
+
+            tile = condensed[np.where(low == high, 0, positions)].astype(np.float32)
+            tile[low == high] = np.inf
+
+            top = np.argpartition(tile, k - 1, axis=1)[:, :k]
+            top_distances = np.take_along_axis(tile, top, axis=1)
+            order = np.argsort(top_distances, axis=1)
+            neighbors[start:stop] = np.take_along_axis(top, order, axis=1)
+            distances[start:stop] = np.take_along_axis(top_distances, order, axis=1)
+
+        return cls.from_neighbors(neighbors, distances)
+
+    @classmethod
+    def _from_edges(
+            cls,
+            n: int,
+            rows: np.ndarray,
+            cols: np.ndarray,
+            values: np.ndarray,
+            k: int
+    ) -> 'KNNGraph':
+        values = values.astype(np.float32)
+
+        # Sort by row, then distance, and keep the first k entries of every row
+        order = np.lexsort((values, rows))
+        rows, cols, values = rows[order], cols[order], values[order]
+        row_starts = np.searchsorted(rows, np.arange(n))
+        keep = np.arange(len(rows)) - row_starts[rows] < k
+        rows, cols, values = rows[keep], cols[keep], values[keep]
+
+        indptr = np.searchsorted(rows, np.arange(n + 1))
+        return cls(sparse.csr_matrix((values, cols, indptr), shape=(n, n)), k)
+
+    @property
+    def n(self) -> int:
+        return self.graph.shape[0]
+
+    def degrees(self) -> np.ndarray:
+        return np.diff(self.graph.indptr)
+
+    def symmetric(self) -> sparse.csr_matrix:
+        """Undirected version of the graph (an edge in either direction is kept).
+
+        Zero distances are raised to a tiny positive value so they survive as edges.
+        """
+        graph = self.graph.copy()
+        graph.data = np.maximum(graph.data, _MIN_EDGE)
+        return graph.maximum(graph.T).tocsr()
+
+    def mean_distances(self) -> np.ndarray:
+        """Mean distance of every string to its neighbours."""
+        degrees = self.degrees()
+        sums = np.bincount(np.repeat(np.arange(self.n), degrees), weights=self.graph.data, minlength=self.n)
+        return np.where(degrees > 0, sums / np.maximum(degrees, 1), 0.0)
+
+    def neighbor_table(self, k: int, include_self: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Fixed-width neighbour arrays, padded with index -1 and infinite distance.
+
+        Returns:
+            Tuple of (indices, distances) of shape (n, k), with each row itself
+            in column 0 when `include_self` is set
+        """
+        offset = 1 if include_self else 0
+        indices = np.full((self.n, k), -1, dtype=np.int32)
+        distances = np.full((self.n, k), np.inf, dtype=np.float32)
+        if include_self:
+            indices[:, 0] = np.arange(self.n)
+            distances[:, 0] = 0
+
+        degrees = self.degrees()
+        rows = np.repeat(np.arange(self.n), degrees)
+        ranks = np.arange(self.graph.nnz) - np.repeat(self.graph.indptr[:-1], degrees) + offset
+        keep = ranks < k
+        indices[rows[keep], ranks[keep]] = self.graph.indices[keep]
+        distances[rows[keep], ranks[keep]] = self.graph.data[keep]
+        return indices, distances
+
+    def single_linkage(self) -> np.ndarray:
+        """
+        Single-linkage hierarchy of the graph, in scipy linkage format.
+
+        Built from the minimum spanning tree of the graph, so only kNN edges are
+        ever merged. Disconnected components are joined last, above the largest
+        edge distance.
+        """
+        n = self.n
+        tree = minimum_spanning_tree(self.symmetric()).tocoo()
+        u, v, w = tree.row, tree.col, tree.data
+
+        n_components, labels = connected_components(tree, directed=False)
+        if n_components > 1:
+            representatives = np.unique(labels, return_index=True)[1]
+            join_distance = (w.max() if w.size else 0.0) + 1.0
+            u = np.concatenate([u, representatives[:-1]])
+            v = np.concatenate([v, representatives[1:]])
+            w = np.concatenate([w, np.full(n_components - 1, join_distance)])
+
+        order = np.argsort(w, kind="stable")
+        parent = np.arange(2 * n - 1)
+        sizes = np.ones(2 * n - 1, dtype=np.int64)
+
+        def find(x):
+            root = x
+            while parent[root] != root:
+                root = parent[root]
+            while parent[x] != root:
+                parent[x], x = root, parent[x]
+            return root
+
+        Z = np.empty((n - 1, 4), dtype=np.float64)
+        for step, edge in enumerate(order.tolist()):
+            a, b = find(int(u[edge])), find(int(v[edge]))
+            cluster = n + step
+            Z[step] = (min(a, b), max(a, b), w[edge], sizes[a] + sizes[b])
+            parent[a] = parent[b] = cluster
+            sizes[cluster] = sizes[a] + sizes[b]
+
+        Z[:, 2][Z[:, 2] <= _MIN_EDGE] = 0.0
+        return Z
@@ -1,9 +1,16 @@
+from typing import Optional, List, Tuple
+
+import numpy as np
+from rapidfuzz import process
 from rapidfuzz.distance import Levenshtein
 
+from .tiles import is_dense_pair_set, gather_upper_tiles
 from ...config.loggers import get_and_set_logger
 
 logger = get_and_set_logger(__name__)
 
+LEVENSHTEIN_TILE_SIZE = 1024
+
 def calculate_levenshtein_distance(args):
     """Calculate Levenshtein distance between two strings."""
     string1, string2 = args
@@ -21,4 +28,96 @@ def calculate_levenshtein_distance(args):
             "levenshtein": normalized_dist,
             "levenshtein_raw": raw_dist
         }
-    }
\ No newline at end of file
+    }
+
+def _raw_from_normalized(normalized: np.ndarray, lengths1: np.ndarray, lengths2: np.ndarray) -> np.ndarray:
+    """Recover raw edit distances from normalized ones (normalized = raw / max length)."""
+    return np.rint(normalized * np.maximum(lengths1, lengths2)).astype(np.int32)
+
+def calculate_levenshtein_matrices(
+        strings1: List[str],
+        strings2: Optional[List[str]] = None,
+        workers: int = -1
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate Levenshtein distances between every string of two lists.
+
+    Uses rapidfuzz's `process.cdist`, which runs the normalized scorer on
+    `workers` threads (-1 uses all cores) without any per-pair Python work.
+
+    Args:
+        strings1: Row strings
+        strings2: Column strings; defaults to `strings1` for all-pairs mode
+        workers: Number of threads for rapidfuzz (-1 for all cores)
+
+    Returns:
+        Tuple of (normalized float64 matrix, raw int32 matrix), shape (len(strings1), len(strings2))
+    """
+    if strings2 is None:
+        strings2 = strings1
+
+    normalized = process.cdist(
+        strings1,
+        strings2,
+        scorer=Levenshtein.normalized_distance,
+        dtype=np.float64,
+        workers=workers
+    )
+    lengths1 = np.fromiter((len(s) for s in strings1), dtype=np.int32, count=len(strings1))
+    lengths2 = np.fromiter((len(s) for s in strings2), dtype=np.int32, count=len(strings2))
+    raw = _raw_from_normalized(normalized, lengths1[:, None], lengths2[None, :])
+
+    return normalized, raw
+
+def calculate_levenshtein_pairs(
+        strings1: List[str],
+        strings2: List[str],
+        workers: int = -1
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Calculate element-wise Levenshtein distances between two equally long lists with `process.cpdist`."""
+    normalized = process.cpdist(
+        strings1,
+        strings2,
+        scorer=Levenshtein.normalized_distance,
+        dtype=np.float64,
+        workers=workers
+    )
+    lengths1 = np.fromiter((len(s) for s in strings1), dtype=np.int32, count=len(strings1))
+    lengths2 = np.fromiter((len(s) for s in strings2), dtype=np.int32, count=len(strings2))
+
+    return normalized, _raw_from_normalized(normalized, lengths1, lengths2)
+
+def calculate_levenshtein_for_indices(
+        texts: List[str],
+        idx1: np.ndarray,
+        idx2: np.ndarray,
+        tile_size: int = LEVENSHTEIN_TILE_SIZE,
+        workers: int = -1
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate Levenshtein distances for index pairs into `texts`.
+
+    Dense pair sets (e.g. all pairs of a block) are computed with `cdist`
+    over row tiles of the upper triangle and gathered, so peak memory is
+    bounded by tile_size * n. Sparse pair sets (e.g. consecutive rows) go
+    through `cpdist` on just the requested pairs.
+
+    Returns:
+        Tuple of (normalized float64 array, raw int32 array) aligned with the indices
+    """
+    n = len(texts)
+
+    if not is_dense_pair_set(n, idx1, idx2):
+        strings1 = [texts[i] for i in idx1.tolist()]
+        strings2 = [texts[j] for j in idx2.tolist()]
+        return calculate_levenshtein_pairs(strings1, strings2, workers)
+
+    normalized, raw = gather_upper_tiles(
+        n, idx1, idx2,
+        lambda start, stop: calculate_levenshtein_matrices(texts[start:stop], texts[start:], workers),
+        tile_size,
+        (np.float64, np.int32)
+    )
+
+    logger.debug(f"Tiled Levenshtein computed for {len(idx1)} pairs over {n} strings")
+    return normalized, raw
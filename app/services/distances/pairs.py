@@ -0,0 +1,100 @@
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from .condensed import condensed_size
+
+# Pairs per tile streamed through the distance kernels (about 8 MB of int32 indices)
+PAIR_TILE_SIZE = 1 << 20
+
+PairTile = Tuple[np.ndarray, np.ndarray]
+
+
+def count_pairs(n: int, compare_mode: str = "all_pairs") -> int:
+    """Number of pairs `iter_pair_tiles` yields for n strings."""
+    if compare_mode == "all_pairs":
+        return condensed_size(n)
+    return max(n - 1, 0)
+
+
+def upper_triangle_pairs(start_row: int, stop_row: int, n: int) -> PairTile:
+    """All pairs (i, j), i < j, of rows start_row:stop_row, in condensed (`pdist`) order."""
+    rows = np.arange(start_row, stop_row, dtype=np.int64)
+    counts = n - 1 - rows
+    offsets = np.cumsum(counts) - counts
+
+    idx1 = np.repeat(rows, counts)
+    idx2 = np.arange(int(counts.sum()), dtype=np.int64) - np.repeat(offsets, counts) + idx1 + 1
+    return idx1.astype(np.int32), idx2.astype(np.int32)
+
+
+def iter_pair_tiles(n: int, compare_mode: str = "all_pairs", tile_size: int = PAIR_TILE_SIZE) -> Iterator[PairTile]:
+    """
+    Enumerate the pairs of n strings lazily, as int32 index tiles.
+
+    All-pairs tiles hold whole rows of the upper triangle (at least one row,
+    otherwise at most `tile_size` pairs), so the kernels can still compute
+    each tile as a dense block. Consecutive tiles are runs of (i, i + 1).
+    Nothing is materialized beyond the tile being consumed.
+
+    Args:
+        n: Number of strings
+        compare_mode: "all_pairs" or "consecutive"
+        tile_size: Target number of pairs per tile
+
+    Yields:
+        Tuples of (idx1, idx2) int32 arrays
+    """
+    if compare_mode == "consecutive":
+        for start in range(0, n - 1, tile_size):
+            idx1 = np.arange(start, min(start + tile_size, n - 1), dtype=np.int32)
+            yield idx1, idx1 + 1
+        return
+
+    if compare_mode != "all_pairs":
+        raise ValueError(f"Unsupported compare mode for pair tiles: {compare_mode}")
+
+    for start_row, stop_row in iter_row_ranges(0, n - 1, n, tile_size):
+        yield upper_triangle_pairs(start_row, stop_row, n)
+
+
+def row_offset(row: int, n: int) -> int:
+    """Condensed position of the first pair of `row`."""
+    return row * n - row * (row + 1) // 2
+
+
+def iter_row_ranges(start_row: int, stop_row: int, n: int, tile_size: int) -> Iterator[Tuple[int, int]]:
+    """Split rows start_row:stop_row of the upper triangle into ranges of at most `tile_size` pairs (at least one row each)."""
+    rows = np.arange(n, dtype=np.int64)
+    row_offsets = rows * n - rows * (rows + 1) // 2
+
+    while start_row < stop_row:
+        stop = int(np.searchsorted(row_offsets, row_offsets[start_row] + tile_size, side="right")) - 1
+        stop = min(max(stop, start_row + 1), stop_row)
+        yield start_row, stop
+        start_row = stop
+
+
+def upper_triangle_rows(n: int, idx1: np.ndarray, idx2: np.ndarray) -> Optional[Tuple[int, int]]:
+    """
+    Row range of a pair tile made of whole upper-triangle rows in condensed order.
+
+    That is the shape of every all-pairs tile of `iter_pair_tiles`, which can
+    then be computed from its row range alone. Returns None for any other pair set.
+    """
+    if len(idx1) == 0:
+        return None
+    start_row, stop_row = int(idx1[0]), int(idx1[-1]) + 1
+    if not 0 <= start_row < stop_row < n or len(idx1) != row_offset(stop_row, n) - row_offset(start_row, n):
+        return None
+
+    expected1, expected2 = upper_triangle_pairs(start_row, stop_row, n)
+    if np.array_equal(idx1, expected1) and np.array_equal(idx2, expected2):
+        return start_row, stop_row
+    return None
+
+
+def iter_index_tiles(idx1: np.ndarray, idx2: np.ndarray, tile_size: int = PAIR_TILE_SIZE) -> Iterator[PairTile]:
+    """Split explicit pair index arrays (e.g. kNN candidates) into tiles."""
+    for start in range(0, len(idx1), tile_size):
+        yield idx1[start:start + tile_size], idx2[start:start + tile_size]
@@ -0,0 +1,199 @@
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from scipy import sparse
+
+from .pairs import iter_row_ranges, row_offset
+from .tokens import TokenMatrix
+from ..executors import WorkerPool, worker_pool
+from ..shared_arrays import SharedArray
+from ...models.embedding_precision import QuantizedEmbeddings
+
+# Task functions run in the worker processes. They are module-level so they pickle
+# by reference, and this module only imports NumPy-level code so workers start fast.
+
+
+def cosine_chunk(
+        values: np.ndarray,
+        scales: Optional[np.ndarray],
+        idx1: np.ndarray,
+        idx2: np.ndarray,
+        out: np.ndarray,
+        start: int,
+        stop: int
+) -> None:
+    """Cosine distances of sparse pairs start:stop (consecutive, kNN), from normalized embeddings held at storage precision."""
+    embeddings = QuantizedEmbeddings(values, scales)
+    similarities = np.einsum("ij,ij->i", embeddings.take(idx1[start:stop]), embeddings.take(idx2[start:stop]))
+    out[start:stop] = np.maximum(1 - similarities, 0)
+
+
+def cosine_rows_chunk(
+        values: np.ndarray,
+        scales: Optional[np.ndarray],
+        out: np.ndarray,
+        start: int,
+        stop: int,
+        first_row: int
+) -> None:
+    """Cosine distances of the upper-triangle pairs of rows start:stop, as one matrix product.
+
+    They are written at their condensed position in a tile of whole rows
+    beginning at `first_row`, so only row numbers are sent to the worker.
+    """
+    embeddings = QuantizedEmbeddings(values, scales)
+    n = len(embeddings)
+    similarities = embeddings.rows(start, stop) @ embeddings.rows(start, n).T
+
+    # Row-major order of the strict upper triangle matches pdist
+    tile = similarities[np.triu(np.ones(similarities.shape, dtype=bool), k=1)]
+    offset = row_offset(start, n) - row_offset(first_row, n)
+    out[offset:offset + tile.size] = np.maximum(1 - tile, 0)
+
+
+# Token matrices a worker process has rebuilt, by shared memory name (a few, since concurrent
+# blocks interleave their chunks)
+WORKER_TOKEN_MATRICES = 4
+_token_matrices: "OrderedDict[str, TokenMatrix]" = OrderedDict()
+
+
+def _worker_token_matrix(
+        key: str,
+        data: np.ndarray,
+        indices: np.ndarray,
+        indptr: np.ndarray,
+        row_stats: np.ndarray,
+        n_tokens: int,
+        distance_type: str
+) -> TokenMatrix:
+    """The block's TokenMatrix in this worker, rebuilt from the shared arrays on its first chunk only."""
+    token_matrix = _token_matrices.get(key)
+    if token_matrix is None:
+        # Copied out of shared memory: the segments are detached after every task
+        matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, n_tokens), copy=True)
+        token_matrix = _token_matrices[key] = TokenMatrix(matrix, row_stats.copy(), distance_type)
+        while len(_token_matrices) > WORKER_TOKEN_MATRICES:
+            _token_matrices.popitem(last=False)
+    else:
+        _token_matrices.move_to_end(key)
+    return token_matrix
+
+
+def token_chunk(
+        data: np.ndarray,
+        indices: np.ndarray,
+        indptr: np.ndarray,
+        row_stats: np.ndarray,
+        idx1: np.ndarray,
+        idx2: np.ndarray,
+        out: np.ndarray,
+        start: int,
+        stop: int,
+        key: str,
+        n_tokens: int,
+        distance_type: str
+) -> None:
+    """Token distances of pairs start:stop, from the block's shared CSR token matrix.
+
+    The matrix (and the transpose its tiled path builds) is kept per worker
+    under `key`, so later chunks of the block reuse it. A chunk of a
+    streamed row tile is itself dense in its bounding box, so it takes the
+    same tiled sparse-product path as the sequential kernel.
+    """
+    token_matrix = _worker_token_matrix(key, data, indices, indptr, row_stats, n_tokens, distance_type)
+    out[start:stop] = token_matrix.distances(idx1[start:stop], idx2[start:stop])
+
+
+class SharedEmbeddings:
+    """Normalized embeddings of a block copied once into shared memory for the worker pool."""
+
+    def __init__(self, embeddings: QuantizedEmbeddings):
+        self.values = SharedArray.from_array(embeddings.values)
+        self.scales = SharedArray.from_array(embeddings.scales) if embeddings.scales is not None else None
+        self.n = len(embeddings)
+
+    @property
+    def handles(self):
+        return self.values.handle, self.scales.handle if self.scales is not None else None
+
+    def close(self) -> None:
+        self.values.close()
+        if self.scales is not None:
+            self.scales.close()
+
+
+def parallel_cosine_distances(
+        embeddings: SharedEmbeddings,
+        idx1: np.ndarray,
+        idx2: np.ndarray,
+        pool: WorkerPool = worker_pool
+) -> np.ndarray:
+    """Cosine distances of sparse index pairs computed in chunks of pair ranges on the worker pool."""
+    with SharedArray.from_array(idx1) as shared1, \
+            SharedArray.from_array(idx2) as shared2, \
+            SharedArray((len(idx1),), np.float32) as out:
+        pool.run_ranges(cosine_chunk, (*embeddings.handles, shared1.handle, shared2.handle, out.handle), len(idx1))
+        return out.array.copy()
+
+
+def parallel_cosine_rows(
+        embeddings: SharedEmbeddings,
+        start_row: int,
+        stop_row: int,
+        pool: WorkerPool = worker_pool
+) -> np.ndarray:
+    """Cosine distances of all upper-triangle pairs of rows start_row:stop_row, in condensed order,
+    computed as row-tile matrix products on the worker pool."""
+    n = embeddings.n
+    num_pairs = row_offset(stop_row, n) - row_offset(start_row, n)
+    ranges = list(iter_row_ranges(start_row, stop_row, n, pool.chunk_length(num_pairs)))
+    with SharedArray((num_pairs,), np.float32) as out:
+        pool.run_chunks(cosine_rows_chunk, (*embeddings.handles, out.handle), ranges, start_row)
+        return out.array.copy()
+
+
+class SharedTokenMatrix:
+    """A block's token matrix copied once into shared memory for the worker pool."""
+
+    def __init__(self, token_matrix: TokenMatrix):
+        matrix = token_matrix.matrix
+        self.arrays = [
+            SharedArray.from_array(matrix.data),
+            SharedArray.from_array(matrix.indices),
+            SharedArray.from_array(matrix.indptr),
+            SharedArray.from_array(token_matrix.row_stats)
+        ]
+        self.n_tokens = matrix.shape[1]
+        self.distance_type = token_matrix.distance_type
+        # Unique per block, so workers can cache the matrix they rebuild from it
+        self.key = self.arrays[0].handle[0]
+
+    @property
+    def handles(self):
+        return tuple(array.handle for array in self.arrays)
+
+    def close(self) -> None:
+        for array in self.arrays:
+            array.close()
+
+
+def parallel_token_distances(
+        token_matrix: SharedTokenMatrix,
+        idx1: np.ndarray,
+        idx2: np.ndarray,
+        pool: WorkerPool = worker_pool
+) -> np.ndarray:
+    """Token distances of index pairs computed in chunks of pair ranges on the worker pool."""
+    with SharedArray.from_array(idx1) as shared1, \
+            SharedArray.from_array(idx2) as shared2, \
+            SharedArray((len(idx1),), np.float64) as out:
+        pool.run_ranges(
+            token_chunk,
+            (*token_matrix.handles, shared1.handle, shared2.handle, out.handle),
+            len(idx1),
+            token_matrix.key,
+            token_matrix.n_tokens,
+            token_matrix.distance_type
+        )
+        return out.array.copy()
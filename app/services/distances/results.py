@@ -0,0 +1,163 @@
+from typing import Optional, List, Dict, Iterable, Tuple
+
+import numpy as np
+import polars as pl
+
+from ...models.distances import StringPair
+
+
+class DistanceResults:
+    """Columnar store for pairwise distance results.
+
+    Pairs are kept as int32 index arrays into `texts`, and every distance metric
+    is an array aligned with them: float64, so the API returns the same values
+    as the per-pair functions, or integers for counts like `levenshtein_raw`,
+    which stay integers in the response. Per-pair dictionaries are only built
+    by `to_dicts` when the response is serialized. Preserved `fields` are
+    a Polars frame with one row per string of `texts`, so pairs reference
+    their rows by index instead of carrying copies of the field values.
+    """
+
+    def __init__(
+            self,
+            texts: List[str],
+            idx1: Iterable[int],
+            idx2: Iterable[int],
+            distances: Optional[Dict[str, np.ndarray]] = None
+    ):
+        self.texts = texts
+        self.idx1 = np.asarray(idx1, dtype=np.int32)
+        self.idx2 = np.asarray(idx2, dtype=np.int32)
+        self.distances: Dict[str, np.ndarray] = {}
+        self.block: Optional[Dict] = None
+        self.fields: Optional[pl.DataFrame] = None
+
+        for prefix, values in (distances or {}).items():
+            self.add(prefix, values)
+
+    @classmethod
+    def from_strings(
+            cls,
+            strings1: List[str],
+            strings2: List[str],
+            texts: Optional[List[str]] = None
+    ) -> 'DistanceResults':
+        """Build an empty result set for element-wise string pairs, indexing into `texts` when given."""
+        if texts is None:
+            texts = list(dict.fromkeys(strings1 + strings2))
+        string_to_idx = {s: i for i, s in enumerate(texts)}
+
+        idx1 = np.fromiter((string_to_idx[s] for s in strings1), dtype=np.int32, count=len(strings1))
+        idx2 = np.fromiter((string_to_idx[s] for s in strings2), dtype=np.int32, count=len(strings2))
+        return cls(texts, idx1, idx2)
+
+    @classmethod
+    def from_pairs(cls, pairs: List[StringPair], texts: Optional[List[str]] = None) -> 'DistanceResults':
+        """Build an empty result set for API `pairs`; only the HTTP boundary deals in StringPair models."""
+        return cls.from_strings([pair.string1 for pair in pairs], [pair.string2 for pair in pairs], texts)
+
+    @classmethod
+    def allocate(cls, texts: List[str], num_pairs: int) -> 'DistanceResults':
+        """Result set of `num_pairs` pairs over `texts`, to be filled tile by tile with `write`."""
+        return cls(texts, np.zeros(num_pairs, dtype=np.int32), np.zeros(num_pairs, dtype=np.int32))
+
+    def __len__(self) -> int:
+        return len(self.idx1)
+
+    @staticmethod
+    def _column(values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values)
+        if not np.issubdtype(values.dtype, np.integer):
+            values = values.astype(np.float64, copy=False)
+        return values
+
+    def add(self, prefix: str, values: np.ndarray) -> None:
+        """Add (or replace) the distance column for a metric prefix."""
+        values = self._column(values)
+        if values.shape != self.idx1.shape:
+            raise ValueError(f"Distance column {prefix} has {values.size} values for {len(self)} pairs")
+        self.distances[prefix] = values
+
+    def update(self, columns: Dict[str, np.ndarray]) -> None:
+        """Add several distance columns at once."""
+        for prefix, values in columns.items():
+            self.add(prefix, values)
+
+    def write(self, start: int, idx1: np.ndarray, idx2: np.ndarray, columns: Dict[str, np.ndarray]) -> int:
+        """
+        Write a tile of pairs and its distance columns at position `start` of an allocated result set.
+
+        Each column is allocated at its full length on its first tile, so a
+        streamed block never holds more than its final columns plus one tile.
+
+        Returns:
+            The position following the tile
+        """
+        stop = start + len(idx1)
+        if stop > len(self):
+            raise ValueError(f"Tile ending at pair {stop} overflows a result set of {len(self)} pairs")
+
+        self.idx1[start:stop] = idx1
+        self.idx2[start:stop] = idx2
+        for prefix, values in columns.items():
+            values = self._column(values)
+            if prefix not in self.distances:
+                self.distances[prefix] = np.zeros(len(self), dtype=values.dtype)
+            self.distances[prefix][start:stop] = values
+        return stop
+
+    def to_dicts(self, row_offset: int = 0) -> List[Dict]:
+        """
+        Materialize the results as the per-pair dictionaries returned by the API.
+
+        When fields are attached, each record gets `row1` / `row2`, the rows of its
+        strings in the response's field table, shifted by `row_offset`.
+        """
+        texts = self.texts
+        idx1 = self.idx1.tolist()
+        idx2 = self.idx2.tolist()
+        prefixes = list(self.distances)
+        columns = [self.distances[prefix].tolist() for prefix in prefixes]
+
+        records = []
+        for k, (i, j) in enumerate(zip(idx1, idx2)):
+            record = {
+                "string1": texts[i],
+                "string2": texts[j],
+                "distances": {prefix: column[k] for prefix, column in zip(prefixes, columns)}
+            }
+            if self.block is not None:
+                record["block"] = self.block
+            if self.fields is not None:
+                record["row1"] = i + row_offset
+                record["row2"] = j + row_offset
+            records.append(record)
+
+        return records
+
+
+def build_field_table(all_results: List[DistanceResults]) -> Tuple[Dict[str, List], List[int]]:
+    """
+    Concatenate the preserved fields of several result sets into one columnar table.
+
+    The frames are concatenated in Polars and converted to Python lists once,
+    for the response.
+
+    Returns:
+        Tuple of (field name -> values, one row per string of every result set with
+        fields, and the row offset of each result set for `to_dicts`)
+    """
+    frames = []
+    offsets = []
+    rows = 0
+    for results in all_results:
+        offsets.append(rows)
+        if results.fields is None:
+            continue
+        frames.append(results.fields)
+        rows += len(results.texts)
+
+    if not frames:
+        return {}, offsets
+    # Fields missing from some result sets are filled with nulls so columns stay aligned
+    return pl.concat(frames, how="diagonal_relaxed").to_dict(as_series=False), offsets
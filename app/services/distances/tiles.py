@@ -0,0 +1,69 @@
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+def is_dense_pair_set(n: int, idx1: np.ndarray, idx2: np.ndarray) -> bool:
+    """Whether a pair set covers enough of its upper-triangle bounding box to compute it in row tiles.
+
+    The box spans the pairs' rows and every column from the first row on, so
+    both a whole block and one row tile of it (as streamed by
+    `pairs.iter_pair_tiles`) count as dense.
+    """
+    if len(idx1) == 0:
+        return False
+    rows = np.minimum(idx1, idx2)
+    first, last = int(rows.min()), int(rows.max())
+    return len(idx1) * 4 >= (last - first + 1) * (n - first)
+
+def gather_upper_tiles(
+        n: int,
+        idx1: np.ndarray,
+        idx2: np.ndarray,
+        compute_tile: Callable[[int, int], Tuple[np.ndarray, ...]],
+        tile_size: int,
+        dtypes: Tuple[type, ...]
+) -> List[np.ndarray]:
+    """
+    Gather symmetric pair distances from row tiles of the upper triangle.
+
+    `compute_tile(start, stop)` must return one array per output, each shaped
+    (stop - start, n - start) with the distances of rows start:stop against
+    columns start:n. Only tiles that hold at least one requested pair are
+    computed, and peak memory stays at tile_size * n per output.
+
+    Args:
+        n: Number of strings
+        idx1: First index of every pair
+        idx2: Second index of every pair
+        compute_tile: Callable producing the distance tiles
+        tile_size: Number of rows per tile
+        dtypes: Output dtype for each array returned by `compute_tile`
+
+    Returns:
+        One array per output, aligned with the pair indices
+    """
+    # Distances are symmetric, so every pair can be read from the upper triangle
+    rows = np.minimum(idx1, idx2)
+    cols = np.maximum(idx1, idx2)
+    order = np.argsort(rows, kind="stable")
+    sorted_rows = rows[order]
+
+    outputs = [np.empty(len(idx1), dtype=dtype) for dtype in dtypes]
+    if len(idx1) == 0:
+        return outputs
+
+    # Tiles cover only the requested rows, so a row range of a block is not padded with other rows
+    last = int(sorted_rows[-1]) + 1
+    for start in range(int(sorted_rows[0]), last, tile_size):
+        stop = min(start + tile_size, last)
+        lo, hi = np.searchsorted(sorted_rows, [start, stop])
+        if lo == hi:
+            continue
+
+        positions = order[lo:hi]
+        tile_rows = rows[positions] - start
+        tile_cols = cols[positions] - start
+        for output, tile in zip(outputs, compute_tile(start, stop)):
+            output[positions] = tile[tile_rows, tile_cols]
+
+    return outputs
@@ -1,6 +1,16 @@
-from typing import List, Set
+from typing import List, Optional, Set, Tuple
 from collections import Counter
 
+import numpy as np
+from scipy import sparse
+
+from .tiles import is_dense_pair_set, gather_upper_tiles
+from ...config.loggers import get_and_set_logger
+
+logger = get_and_set_logger(__name__)
+
+TOKEN_TILE_SIZE = 1024
+
 def tokenize(text: str, method: str = "words") -> List[str]:
     """
     Tokenize text using different methods.
@@ -107,4 +117,168 @@ def calculate_token_distance(
         "string2": text2,
         "distance": distance,
         "distance_type": f"{distance_type}_{tokenization}"
-    }
\ No newline at end of file
+    }
+
+def parse_token_distance_type(distance_type: str) -> Tuple[str, str]:
+    """
+    Split a token distance type into its metric and tokenization.
+
+    Args:
+        distance_type: Distance type such as "jaccard_words" or "cosine_token_ngrams"
+
+    Returns:
+        Tuple of (metric, tokenization), e.g. ("cosine_token", "ngrams")
+    """
+    metric, _, tokenization = distance_type.rpartition("_")
+    if metric not in ("jaccard", "cosine_token"):
+        raise ValueError(f"Unknown distance type: {distance_type}")
+    return metric, tokenization
+
+def check_tokenization(distance_types: List[str], tokenization: Optional[str]) -> None:
+    """
+    Log a deprecation warning when `tokenization` contradicts a token distance type.
+
+    The tokenization is read from the distance type (e.g. jaccard_ngrams), so the
+    separate option is ignored. The default "words" is treated as not given.
+    """
+    if tokenization is None or tokenization == "words":
+        return
+    for distance_type in distance_types:
+        if distance_type.startswith(("jaccard_", "cosine_token_")):
+            metric, suffix = parse_token_distance_type(distance_type)
+            if suffix != tokenization:
+                logger.warning(
+                    f"The tokenization option is deprecated and ignored: {distance_type} uses "
+                    f"{suffix} tokenization, use {metric}_{tokenization} for {tokenization}"
+                )
+
+def build_token_matrix(texts: List[str], tokenization: str = "words", binary: bool = False) -> sparse.csr_matrix:
+    """
+    Tokenize every text once into a sparse document-token matrix.
+
+    Args:
+        texts: Texts to tokenize, one row each
+        tokenization: Tokenization method to use
+        binary: Store token presence (for Jaccard) instead of token counts
+
+    Returns:
+        CSR matrix of shape (len(texts), vocabulary size), float32
+    """
+    vocabulary = {}
+    indptr = [0]
+    indices = []
+    data = []
+
+    for text in texts:
+        counts = Counter(tokenize(text, tokenization))
+        for token, count in counts.items():
+            indices.append(vocabulary.setdefault(token, len(vocabulary)))
+            data.append(1 if binary else count)
+        indptr.append(len(indices))
+
+    return sparse.csr_matrix(
+        (
+            np.asarray(data, dtype=np.float32),
+            np.asarray(indices, dtype=np.int32),
+            np.asarray(indptr, dtype=np.int64)
+        ),
+        shape=(len(texts), len(vocabulary))
+    )
+
+def _jaccard_from_intersections(intersections: np.ndarray, sizes1: np.ndarray, sizes2: np.ndarray) -> np.ndarray:
+    union = sizes1 + sizes2 - intersections
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distances = 1 - intersections / union
+    # Two empty token sets are identical
+    return np.where(union == 0, 0.0, distances)
+
+def _cosine_from_dots(dots: np.ndarray, norms1: np.ndarray, norms2: np.ndarray) -> np.ndarray:
+    magnitudes = norms1 * norms2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distances = 1 - dots / magnitudes
+    # Both empty -> identical, one empty -> maximally distant
+    distances = np.where((norms1 == 0) | (norms2 == 0), 1.0, distances)
+    return np.where((norms1 == 0) & (norms2 == 0), 0.0, distances)
+
+class TokenMatrix:
+    """Texts tokenized once for one token metric, reused for any number of pair tiles.
+
+    Holds the CSR document-token matrix (binary for Jaccard, counts for
+    cosine_token) and the per-row statistics the metric needs, so streaming
+    the pairs of a block tile by tile does not tokenize the texts again.
+    """
+
+    def __init__(self, matrix: sparse.csr_matrix, row_stats: np.ndarray, distance_type: str = "jaccard"):
+        if distance_type == "jaccard":
+            self._finalize = _jaccard_from_intersections
+        elif distance_type == "cosine_token":
+            self._finalize = _cosine_from_dots
+        else:
+            raise ValueError(f"Unknown distance type: {distance_type}")
+
+        self.matrix = matrix
+        self.row_stats = row_stats
+        self.distance_type = distance_type
+        self._matrix_t: Optional[sparse.csc_matrix] = None
+
+    @classmethod
+    def build(cls, texts: List[str], distance_type: str = "jaccard", tokenization: str = "words") -> 'TokenMatrix':
+        """Tokenize `texts` for `distance_type` ("jaccard" or "cosine_token")."""
+        if distance_type == "jaccard":
+            matrix = build_token_matrix(texts, tokenization, binary=True)
+            row_stats = np.asarray(matrix.sum(axis=1), dtype=np.float64).ravel()
+        elif distance_type == "cosine_token":
+            matrix = build_token_matrix(texts, tokenization)
+            row_stats = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1), dtype=np.float64).ravel())
+        else:
+            raise ValueError(f"Unknown distance type: {distance_type}")
+        return cls(matrix, row_stats, distance_type)
+
+    def distances(self, idx1: np.ndarray, idx2: np.ndarray, tile_size: int = TOKEN_TILE_SIZE) -> np.ndarray:
+        """Float64 distances of the index pairs, dense pair sets in row tiles of the upper triangle."""
+        matrix, row_stats = self.matrix, self.row_stats
+        n = matrix.shape[0]
+
+        if not is_dense_pair_set(n, idx1, idx2):
+            products = np.asarray(matrix[idx1].multiply(matrix[idx2]).sum(axis=1), dtype=np.float64).ravel()
+            return self._finalize(products, row_stats[idx1], row_stats[idx2])
+
+        if self._matrix_t is None:
+            self._matrix_t = matrix.T.tocsc()
+        matrix_t = self._matrix_t
+
+        def compute_tile(start, stop):
+            products = (matrix[start:stop] @ matrix_t[:, start:]).toarray()
+            return (self._finalize(products, row_stats[start:stop, None], row_stats[None, start:]),)
+
+        (distances,) = gather_upper_tiles(n, idx1, idx2, compute_tile, tile_size, (np.float64,))
+        return distances
+
+def calculate_token_distances_for_indices(
+        texts: List[str],
+        idx1: np.ndarray,
+        idx2: np.ndarray,
+        distance_type: str = "jaccard",
+        tokenization: str = "words",
+        tile_size: int = TOKEN_TILE_SIZE
+) -> np.ndarray:
+    """
+    Calculate token-based distances for index pairs into `texts`.
+
+    Each text is tokenized once into a CSR matrix (binary for Jaccard, counts
+    for cosine_token). Dense pair sets are computed with sparse matrix products
+    over row tiles of the upper triangle; sparse pair sets use row-wise
+    element products of just the requested pairs.
+
+    Args:
+        texts: Unique texts the indices point into
+        idx1: First index of every pair
+        idx2: Second index of every pair
+        distance_type: Type of distance ("jaccard" or "cosine_token")
+        tokenization: Tokenization method to use
+        tile_size: Number of rows per tile
+
+    Returns:
+        Float64 distances aligned with the indices
+    """
+    return TokenMatrix.build(texts, distance_type, tokenization).distances(idx1, idx2, tile_size)
@@ -0,0 +1,151 @@
+import asyncio
+import functools
+import multiprocessing
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Optional, Sequence, Tuple
+
+from .shared_arrays import ArrayHandle, run_attached
+from ..config.constants import (
+    EMBEDDING_EXECUTOR_WORKERS,
+    DISTANCE_EXECUTOR_WORKERS,
+    EXECUTOR_QUEUE_SIZE,
+    WORKER_POOL_PROCESSES,
+    WORKER_CHUNK_PAIRS
+)
+from ..config.loggers import get_and_set_logger
+
+logger = get_and_set_logger(__name__)
+
+
+class BoundedExecutor:
+    """Thread pool awaited from asyncio with a bounded number of pending jobs.
+
+    At most `max_workers + max_queue` jobs are submitted at once; further
+    callers wait on an asyncio semaphore, so a burst of uploads applies
+    backpressure instead of piling work onto the pool, and the event loop
+    stays free for other requests. NumPy, rapidfuzz and torch release the
+    GIL in their kernels, so threads run them in parallel.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int = EXECUTOR_QUEUE_SIZE):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_workers + max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        # asyncio primitives belong to one event loop, so keep one semaphore per loop
+        self._slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run `func(*args, **kwargs)` on the pool and await its result."""
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots[loop] = asyncio.Semaphore(self.max_pending)
+
+        async with slots:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def shutdown(self) -> None:
+        logger.info(f"Shutting down {self.name} executor")
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class WorkerPool:
+    """Process pool created once per application worker and shared by every request.
+
+    Replaces a `multiprocessing.Pool` per call, so process start-up is paid at
+    application start instead of on each `use_worker` request. Tasks receive
+    `SharedArray` handles and index ranges rather than pickled arrays, and
+    write their results into a shared output array. Processes are spawned,
+    not forked, since the parent runs threads (executors, torch).
+    """
+
+    def __init__(self, processes: int = WORKER_POOL_PROCESSES, chunk_size: int = WORKER_CHUNK_PAIRS):
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return self.processes > 0
+
+    def start(self) -> None:
+        """Start the processes (done at application startup; later calls are no-ops)."""
+        if not self.available:
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                logger.info(f"Started worker pool with {self.processes} processes")
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a picklable `func(*args, **kwargs)` in one worker process and await its result."""
+        self.start()
+        if self._executor is None:
+            raise RuntimeError("Worker pool is disabled (WORKER_POOL_PROCESSES=0)")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def chunk_length(self, total: int) -> int:
+        """
+        Items per chunk when `total` items are split across the pool.
+
+        Chunks hold at least `chunk_size` items, and there are up to four per
+        process so uneven chunks still balance across processes.
+        """
+        return max(self.chunk_size, -(-total // (self.processes * 4)))
+
+    def run_ranges(self, func: Callable, handles: Sequence[Optional[ArrayHandle]], total: int, *args) -> None:
+        """Run `func(*arrays, start, stop, *args)` over chunks of range(total) on the pool (blocking)."""
+        chunk = self.chunk_length(total)
+        self.run_chunks(func, handles, [(start, min(start + chunk, total)) for start in range(0, total, chunk)], *args)
+
+    def run_chunks(
+            self,
+            func: Callable,
+            handles: Sequence[Optional[ArrayHandle]],
+            ranges: Sequence[Tuple[int, int]],
+            *args
+    ) -> None:
+        """Run `func(*arrays, start, stop, *args)` for every (start, stop) of `ranges` on the pool (blocking)."""
+        self.start()
+        if self._executor is None:
+            raise RuntimeError("Worker pool is disabled (WORKER_POOL_PROCESSES=0)")
+
+        futures = [
+            self._executor.submit(run_attached, func, handles, start, stop, *args)
+            for start, stop in ranges
+        ]
+        for future in futures:
+            future.result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                logger.info("Shutting down worker pool")
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+# Embedding inference (model loading and encode calls)
+embedding_executor = BoundedExecutor("embedding", EMBEDDING_EXECUTOR_WORKERS)
+
+# Distance kernels, clustering and dimensionality reduction
+distance_executor = BoundedExecutor("distance", DISTANCE_EXECUTOR_WORKERS)
+
+
+# CPU-bound pair chunks and block clustering of use_worker requests, in separate processes
+worker_pool = WorkerPool()
+
+
+def shutdown_executors() -> None:
+    """Stop the executors and the worker pool at application shutdown."""
+    embedding_executor.shutdown()
+    distance_executor.shutdown()
+    worker_pool.shutdown()
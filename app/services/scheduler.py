@@ -0,0 +1,71 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Sequence, TypeVar
+
+from .distances.pairs import count_pairs
+from ..config.constants import BLOCK_CONCURRENCY, BLOCK_COST_BUDGET
+from ..config.loggers import get_and_set_logger
+
+logger = get_and_set_logger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def estimate_block_cost(num_rows: int, compare_mode: str = "all_pairs", knn_neighbors: int = 0) -> int:
+    """Estimated number of pairs of a block of `num_rows` rows (an upper bound before deduplication)."""
+    if compare_mode == "knn":
+        return num_rows * max(knn_neighbors, 1)
+    return count_pairs(num_rows, compare_mode)
+
+
+class BlockScheduler:
+    """Runs the blocks of a blocked CSV run concurrently, largest first.
+
+    Blocks are started in decreasing order of estimated cost, so the long
+    ones are not left for the end while every other slot sits idle. At most
+    `concurrency` blocks run at once, and together they may hold at most
+    `cost_budget` estimated pairs, which bounds the distance columns and
+    condensed vectors in memory; a block above the budget runs alone.
+    Results come back in the original block order.
+    """
+
+    def __init__(self, concurrency: int = BLOCK_CONCURRENCY, cost_budget: int = BLOCK_COST_BUDGET):
+        self.concurrency = max(concurrency, 1)
+        self.cost_budget = max(cost_budget, 1)
+
+    async def run(
+            self,
+            process: Callable[[T], Awaitable[R]],
+            items: Sequence[T],
+            costs: Sequence[int]
+    ) -> List[Optional[R]]:
+        """Await `process(item)` for every item and return the results in item order."""
+        results: List[Optional[R]] = [None] * len(items)
+        order = sorted(range(len(items)), key=lambda i: costs[i], reverse=True)
+        weights = {i: min(max(costs[i], 1), self.cost_budget) for i in order}
+
+        async def run_one(index: int) -> int:
+            results[index] = await process(items[index])
+            return index
+
+        running = set()
+        in_flight = 0
+        try:
+            for index in order:
+                # Wait until the next block fits next to the running ones
+                while running and (len(running) >= self.concurrency or in_flight + weights[index] > self.cost_budget):
+                    done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        in_flight -= weights[task.result()]
+
+                running.add(asyncio.create_task(run_one(index)))
+                in_flight += weights[index]
+
+            if running:
+                await asyncio.gather(*running)
+        finally:
+            for task in running:
+                task.cancel()
+
+        logger.info(f"Processed {len(items)} blocks with up to {self.concurrency} at once")
+        return results
@@ -0,0 +1,89 @@
+import weakref
+from multiprocessing import shared_memory
+from typing import Any, Callable, Optional, Sequence, Tuple
+
+import numpy as np
+
+# (shared memory name, shape, dtype string): what a worker needs to attach to a SharedArray
+ArrayHandle = Tuple[str, Tuple[int, ...], str]
+
+
+def _release(segment: shared_memory.SharedMemory) -> None:
+    try:
+        segment.close()
+    except BufferError:
+        # A view is still alive in this process; the mapping goes away with it
+        pass
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class SharedArray:
+    """NumPy array in a named shared memory block, for the worker pool.
+
+    Workers attach to it through `handle`, a small picklable tuple, so large
+    arrays (embeddings, pair indices, outputs) reach them without being
+    pickled. The block is unlinked by `close`, or when the SharedArray is
+    garbage collected.
+    """
+
+    def __init__(self, shape: Sequence[int], dtype=np.float32):
+        dtype = np.dtype(dtype)
+        shape = tuple(int(size) for size in shape)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+
+        self._segment = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self._segment.buf)
+        self.handle: ArrayHandle = (self._segment.name, shape, dtype.str)
+        self._finalizer = weakref.finalize(self, _release, self._segment)
+
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> 'SharedArray':
+        """Copy `array` into a new shared block."""
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    def close(self) -> None:
+        self.array = None
+        self._finalizer()
+
+    def __enter__(self) -> 'SharedArray':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def run_attached(func: Callable, handles: Sequence[Optional[ArrayHandle]], *args) -> Any:
+    """
+    Worker-side entry point: attach to shared arrays, call `func(*arrays, *args)`, detach.
+
+    None handles are passed through as None. `func` writes large results into
+    one of the shared arrays; what it returns is pickled back to the caller and
+    must not hold views of them, since every segment is closed before this
+    returns.
+    """
+    segments = []
+    arrays = []
+    try:
+        for handle in handles:
+            if handle is None:
+                arrays.append(None)
+                continue
+            name, shape, dtype = handle
+            segment = shared_memory.SharedMemory(name=name)
+            segments.append(segment)
+            arrays.append(np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf))
+        return func(*arrays, *args)
+    finally:
+        # Views must be dropped before their segments can be closed
+        arrays = None
+        for segment in segments:
+            try:
+                segment.close()
+            except BufferError:
+                # A view outlived the task; the mapping goes away with it
+                pass
@@ -1,18 +1,24 @@
 import json
 import traceback
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 
 import numpy as np
+import polars as pl
 from sklearn.manifold import TSNE
 from umap import UMAP
 
-from .utils import make_distance_matrix, calculate_bounds, sanitize_filename
+from .utils import calculate_bounds, sanitize_filename
+from ..distances.block import BlockDistances
+from ..distances.knn import KNNGraph, find_cosine_neighbors
 from ...config.constants import OUTPUT_DEEPSCOPES
 from ...config.loggers import get_and_set_logger
 
 logger = get_and_set_logger(__name__)
 
+# Larger blocks are reduced from their nearest neighbours only, never from a dense n x n matrix
+DENSE_REDUCTION_MAX_POINTS = 5000
+
 def save_visualization(
         data: Dict,
         filename: str
@@ -27,34 +33,156 @@ def save_visualization(
     logger.info(f"Saved visualization to {filepath}")
     return filepath.name
 
+def reduce_knn_graph(
+        knn_graph: KNNGraph,
+        method: str = 'tsne',
+        perplexity: Optional[int] = None,
+        n_neighbors: Optional[int] = None,
+        min_dist: Optional[float] = None
+) -> np.ndarray:
+    """
+    Compute 2D coordinates from a sparse kNN distance graph.
+
+    UMAP receives the graph's neighbour table as `precomputed_knn`, and t-SNE
+    the sparse graph itself with its perplexity capped to what the stored
+    neighbours support (sklearn reads 3 * perplexity + 2 per point).
+    """
+    n_points = knn_graph.n
+    min_degree = int(knn_graph.degrees().min())
+
+    if method == 'tsne':
+        perplexity = min(perplexity or 30, n_points - 1, max((min_degree - 2) / 3, 1))
+        reducer = TSNE(
+            n_components=2,
+            metric='precomputed',
+            init='random',
+            random_state=42,
+            perplexity=perplexity
+        )
+        return reducer.fit_transform(knn_graph.graph)
+
+    elif method == 'umap':
+        # UMAP's neighbour lists include the point itself
+        n_neighbors = max(min(n_neighbors or 15, min_degree + 1), 2)
+        knn_indices, knn_dists = knn_graph.neighbor_table(n_neighbors, include_self=True)
+
+        reducer = UMAP(
+            n_components=2,
+            metric='precomputed',
+            n_neighbors=n_neighbors,
+            min_dist=min_dist or 0.1,
+            precomputed_knn=(knn_indices, knn_dists, None),
+            random_state=42
+        )
+        return reducer.fit_transform(knn_graph.symmetric())
+
+    raise ValueError(f"Unsupported dimensionality reduction method: {method}")
+
+def reduction_neighbors(method: str, perplexity: Optional[int] = None, n_neighbors: Optional[int] = None) -> int:
+    """Neighbours per point a reduction reads: 3 * perplexity + 2 for t-SNE, n_neighbors for UMAP."""
+    if method == 'tsne':
+        return int(3 * (perplexity or 30)) + 2
+    return n_neighbors or 15
+
+def reduce_embeddings(
+        embeddings: np.ndarray,
+        method: str = 'tsne',
+        metric: str = 'cosine',
+        perplexity: Optional[int] = None,
+        n_neighbors: Optional[int] = None,
+        min_dist: Optional[float] = None
+) -> np.ndarray:
+    """
+    Compute 2D coordinates straight from embeddings and a metric.
+
+    UMAP runs its own approximate neighbour search over the vectors. t-SNE with
+    the cosine metric gets its neighbours from `find_cosine_neighbors`
+    (pynndescent on large blocks) through `reduce_knn_graph`; other metrics are
+    passed to sklearn as is.
+    """
+    n_points = len(embeddings)
+
+    if method == 'tsne':
+        if metric == 'cosine':
+            neighbors, distances = find_cosine_neighbors(embeddings, reduction_neighbors(method, perplexity))
+            return reduce_knn_graph(KNNGraph.from_neighbors(neighbors, distances), method, perplexity)
+
+        reducer = TSNE(
+            n_components=2,
+            metric=metric,
+            init='random',
+            random_state=42,
+            perplexity=min(perplexity or 30, n_points - 1)
+        )
+        return reducer.fit_transform(embeddings)
+
+    elif method == 'umap':
+        reducer = UMAP(
+            n_components=2,
+            metric=metric,
+            n_neighbors=min(n_neighbors or 15, n_points - 1),
+            min_dist=min_dist or 0.1,
+            random_state=42
+        )
+        return reducer.fit_transform(embeddings)
+
+    raise ValueError(f"Unsupported dimensionality reduction method: {method}")
+
 def compute_dimensionality_reduction(
-        distances: np.ndarray,
+        distances: Union[np.ndarray, BlockDistances, None],
         n_points: int,
         method: str = 'tsne',
         perplexity: Optional[int] = None,
         n_neighbors: Optional[int] = None,
-        min_dist: Optional[float] = None
+        min_dist: Optional[float] = None,
+        knn_graph: Optional[KNNGraph] = None,
+        embeddings: Optional[np.ndarray] = None,
+        metric: str = 'cosine',
+        square: Optional[np.ndarray] = None
 ) -> np.ndarray:
     """
     Compute dimensionality reduction using either t-SNE or UMAP.
 
+    Blocks of up to `DENSE_REDUCTION_MAX_POINTS` points given as a condensed
+    vector use the dense precomputed matrix. Larger ones are reduced from
+    `embeddings` when available, and otherwise from the exact kNN graph read
+    out of the condensed vector, so memory stays O(n * k).
+
     Args:
-        distances: Condensed distance matrix
+        distances: Condensed distance matrix, or the block's `BlockDistances` (which then
+            supplies the kNN graph and square matrix)
         n_points: Number of points
         method: Reduction method ('tsne' or 'umap')
         perplexity: Perplexity for t-SNE
         n_neighbors: Number of neighbors for UMAP
         min_dist: Minimum distance for UMAP
+        knn_graph: Sparse kNN distance graph, used instead of the dense matrix
+        embeddings: Raw vectors of the points, for large blocks
+        metric: Metric of `embeddings`
+        square: Square form of `distances` already built for the block, reused as is
 
     Returns:
         Numpy array of 2D coordinates
     """
+    block = BlockDistances.wrap(distances, n_points, knn_graph, square)
+    knn_graph = block.knn_graph
+
+    if knn_graph is None and n_points > DENSE_REDUCTION_MAX_POINTS:
+        if embeddings is not None:
+            return reduce_embeddings(embeddings, method, metric, perplexity, n_neighbors, min_dist)
+
+        # Both methods only read each point's nearest neighbours
+        knn_graph = KNNGraph.from_condensed(block.condensed, n_points, reduction_neighbors(method, perplexity, n_neighbors))
+
+    if knn_graph is not None:
+        return reduce_knn_graph(knn_graph, method, perplexity, n_neighbors, min_dist)
+
     # Determine perplexity for t-SNE
     if perplexity is None:
         perplexity = min(30, n_points - 1)
 
-    # Create full distance matrix from condensed form
-    dist_matrix = make_distance_matrix(distances.tolist(), n_points)
+    # Full distance matrix, shared with the other consumers of the block
+    dist_matrix = block.square
 
     # Choose reduction method
     if method == 'tsne':
@@ -85,17 +213,20 @@ def compute_dimensionality_reduction(
 
 def process_block_dimred(
         strings: List[str],
-        distances: np.ndarray,
+        distances: Union[np.ndarray, BlockDistances, None],
         block_id: str,
-        string_counts: Dict[str, int],
-        preserved_fields: Dict[str, List],
+        string_counts: np.ndarray,
+        preserved_fields: pl.DataFrame,
         outlier_results: Optional[Dict] = None,
         unified_map: bool = False,
         unified_blocks: Optional[List[Dict]] = None,
         dimensionality_reduction: str = 'tsne',
         reduction_perplexity: Optional[int] = None,
         reduction_n_neighbors: Optional[int] = None,
-        reduction_min_dist: Optional[float] = None
+        reduction_min_dist: Optional[float] = None,
+        knn_graph: Optional[KNNGraph] = None,
+        embeddings: Optional[np.ndarray] = None,
+        square: Optional[np.ndarray] = None
 ) -> Dict:
     """
     Process dimensionality reduction visualization for a block with enhanced compatibility.
@@ -119,24 +250,27 @@ def process_block_dimred(
             method=dimensionality_reduction,
             perplexity=reduction_perplexity,
             n_neighbors=reduction_n_neighbors,
-            min_dist=reduction_min_dist
+            min_dist=reduction_min_dist,
+            knn_graph=knn_graph,
+            embeddings=embeddings,
+            square=square
         )
         bounds = calculate_bounds(coords)
 
         # Rest of the function remains the same as in the original implementation
         points = []
+        field_rows = preserved_fields.to_dicts()
         for i in range(n_points):
             point = {
                 "lat": float(coords[i, 0]),
                 "lng": float(coords[i, 1]),
                 "labelstr": strings[i],
-                "total_count": string_counts.get(strings[i], 1),
+                "total_count": int(string_counts[i]),
                 "block_id": str(block_id)
             }
 
             # Add preserved field values
-            for field, values in preserved_fields.items():
-                point[field] = values[i]
+            point.update(field_rows[i])
 
             # Add outlier information
             if outlier_results and 'outliers' in outlier_results:
@@ -165,10 +299,10 @@ def process_block_dimred(
             "point_count": n_points,
             "block_id": block_id,
             "metadata": {
-                "total_points": sum(string_counts.values()),
+                "total_points": int(np.sum(string_counts)),
                 "unique_points": len(points),
-                "available_fields": list(preserved_fields.keys()),
-                "embedded_fields": sorted(preserved_fields.keys()),
+                "available_fields": preserved_fields.columns,
+                "embedded_fields": sorted(preserved_fields.columns),
                 "reduction_method": dimensionality_reduction
             }
         }
@@ -180,7 +314,7 @@ def process_block_dimred(
         else:
             # Existing saving logic...
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            field_names = "_".join(sorted(preserved_fields.keys()))
+            field_names = "_".join(sorted(preserved_fields.columns))
             filename = f"{dimensionality_reduction}_{field_names}_{block_id}_{timestamp}.json"
 
             # Prepare data for saving
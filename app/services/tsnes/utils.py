@@ -1,17 +1,11 @@
 import numpy as np
 from typing import List, Dict, Tuple
 
+from ..distances.condensed import condensed_to_square
+
 def make_distance_matrix(distances: List[float], size: int) -> np.ndarray:
-    """Create a distance matrix from pairwise distances."""
-    matrix = np.zeros((size, size))
-    idx = 0
-    for i in range(size):
-        for j in range(i + 1, size):
-            if idx < len(distances):
-                matrix[i][j] = distances[idx]
-                matrix[j][i] = distances[idx]
-                idx += 1
-    return matrix
+    """Create a distance matrix from pairwise distances (condensed, `pdist` order)."""
+    return condensed_to_square(distances, size, dtype=np.float64)
 
 def calculate_bounds(coords: np.ndarray, padding: float = 0.1) -> Dict[str, float]:
     """Calculate bounds with padding for visualization."""
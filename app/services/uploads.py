@@ -0,0 +1,73 @@
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+import polars as pl
+from fastapi import UploadFile
+
+from ..config.constants import UPLOAD_SPOOL_DIR, UPLOAD_CHUNK_BYTES
+from ..config.loggers import get_and_set_logger
+from ..models.distances import CSVDistanceInput
+
+logger = get_and_set_logger(__name__)
+
+
+async def spool_upload(
+        file: UploadFile,
+        directory: Path = UPLOAD_SPOOL_DIR,
+        chunk_size: int = UPLOAD_CHUNK_BYTES
+) -> Path:
+    """
+    Copy an upload to a temporary file on disk, `chunk_size` bytes at a time.
+
+    Only one chunk is held in memory, whatever the size of the upload. The
+    caller owns the returned file and removes it once it has been read.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=".csv", dir=directory)
+    total = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while chunk := await file.read(chunk_size):
+                f.write(chunk)
+                total += len(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    logger.info(f"Spooled upload {file.filename} ({total} bytes) to {path}")
+    return Path(path)
+
+
+def csv_columns(input_data: CSVDistanceInput) -> Optional[List[str]]:
+    """
+    Columns a CSV request reads, or None for all of them.
+
+    Every column is read (and carried with the results) unless the request
+    lists both its `fields` and its `preserved_columns`; only then is the
+    scan restricted to the fields, blocking keys and preserved columns.
+    """
+    if input_data.fields is None or input_data.preserved_columns is None:
+        return None
+    extra = (input_data.blocking_keys or []) + (input_data.preserved_columns or [])
+    return list(dict.fromkeys(input_data.fields + extra))
+
+
+def scan_csv_columns(path: Path, columns: Optional[List[str]] = None) -> pl.DataFrame:
+    """
+    Read a CSV lazily, materializing only `columns` (all of them when None).
+
+    The projection is pushed down into the scan, so columns that are not
+    compared are never parsed into memory. Raises ValueError when one of
+    `columns` is not in the file.
+    """
+    lazy = pl.scan_csv(path)
+    if columns is not None:
+        available = lazy.collect_schema().names()
+        missing = [column for column in columns if column not in available]
+        if missing:
+            raise ValueError(f"Columns not found in CSV: {', '.join(missing)}")
+        lazy = lazy.select(columns)
+
+    return lazy.collect()
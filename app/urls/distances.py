@@ -1,7 +1,7 @@
-import io
 import json
-from itertools import combinations
 from typing import Optional, List, Literal
+
+import numpy as np
 import os
 import glob
 import traceback
@@ -18,12 +18,16 @@ from ..models.distances import (
     SingleListInput,
     TwoListsInput,
     CSVDistanceInput,
-    StringPair,
     DistanceType,
     ModelConfig
 )
-from ..services.distances.base import calculate_distances
+from ..models.embeddings import model_registry
+from ..services.distances.base import calculate_distances, calculate_result_distances
+from ..services.distances.pairs import upper_triangle_pairs
+from ..services.distances.results import DistanceResults
 from ..services.csvs import process_csv_distances
+from ..services.executors import distance_executor
+from ..services.uploads import spool_upload, csv_columns, scan_csv_columns
 
 logger = get_and_set_logger(__name__)
 
@@ -35,55 +39,43 @@ async def calculate_distances_pairs(input_data: DistanceInput):
     return await calculate_distances(
         input_data.pairs,
         input_data.distance_type,
-        input_data.model_name,
-        input_data.use_worker,
-        input_data.batch_size
+        model_id=input_data.model_id,
+        tokenization=input_data.tokenization,
+        use_worker=input_data.use_worker,
+        batch_size=input_data.batch_size
     )
 
 @distances_router.post("/calculate-distances/single-list")
 async def calculate_distances_single_list(input_data: SingleListInput):
     """Endpoint for calculating distances between all pairs in a single list."""
-    pairs = [
-        StringPair(string1=s1, string2=s2)
-        for s1, s2 in combinations(input_data.strings, 2)
-    ]
-    return await calculate_distances(
-        pairs,
+    # Every pair i < j of the list, as index arrays instead of StringPair models
+    n = len(input_data.strings)
+    return await calculate_result_distances(
+        DistanceResults(input_data.strings, *upper_triangle_pairs(0, n, n)),
         input_data.distance_type,
-        input_data.model_name,
-        input_data.use_worker,
-        input_data.batch_size
+        model_id=input_data.model_name,
+        use_worker=input_data.use_worker,
+        batch_size=input_data.batch_size
     )
 
 @distances_router.post("/calculate-distances/two-lists")
 async def calculate_distances_two_lists(input_data: TwoListsInput):
     """Endpoint for calculating distances between pairs from two lists."""
-    pairs = [
-        StringPair(string1=s1, string2=s2)
-        for s1, s2 in zip(input_data.list1, input_data.list2)
-    ]
-    return await calculate_distances(
-        pairs,
+    # Element-wise pairs, as index arrays into the concatenated lists
+    n = min(len(input_data.list1), len(input_data.list2))
+    idx = np.arange(n, dtype=np.int32)
+    return await calculate_result_distances(
+        DistanceResults(input_data.list1[:n] + input_data.list2[:n], idx, idx + n),
         input_data.distance_type,
-        input_data.model_name,
-        input_data.use_worker,
-        input_data.batch_size
+        model_id=input_data.model_name,
+        use_worker=input_data.use_worker,
+        batch_size=input_data.batch_size
     )
 
-@distances_router.post("/calculate-distances/two-lists")
-async def calculate_distances_two_lists(input_data: TwoListsInput):
-    """Endpoint for calculating distances between pairs from two lists."""
-    pairs = [
-        StringPair(string1=s1, string2=s2)
-        for s1, s2 in zip(input_data.list1, input_data.list2)
-    ]
-    return await calculate_distances(
-        pairs,
-        input_data.distance_type,
-        input_data.model_name,
-        input_data.use_worker,
-        input_data.batch_size
-    )
+@distances_router.get("/embedding-cache/stats")
+async def embedding_cache_stats():
+    """Memory cache metrics (hits, misses, evictions, resident bytes) of this worker's embedding models."""
+    return model_registry.cache_stats()
 
 @distances_router.post("/calculate-distances/from-csv")
 async def calculate_distances_from_csv(
@@ -118,17 +110,22 @@ async def calculate_distances_from_csv(
         config_model = CSVDistanceInput(**config_dict)
 
         logger.info(f"Received CSV upload with config: {config_model}")
-        content = await file.read()
+        # Spool the upload to disk, then scan only the columns the request uses
+        csv_path = await spool_upload(file)
 
         try:
-            df = pl.read_csv(io.BytesIO(content))
+            df = await distance_executor.run(scan_csv_columns, csv_path, csv_columns(config_model))
             logger.info(f"Successfully read CSV with shape: {df.shape}")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as csv_error:
             logger.error(f"CSV reading error: {str(csv_error)}")
             raise HTTPException(
                 status_code=400,
                 detail=f"Failed to read CSV: {str(csv_error)}"
             )
+        finally:
+            os.remove(csv_path)
 
         # Process distances with the full model configs
         result = await process_csv_distances(df, config_model)
@@ -148,6 +145,8 @@ async def calculate_distances_from_csv(
     except json.JSONDecodeError as e:
         logger.error(f"Error parsing config JSON: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Invalid config JSON: {str(e)}")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in calculate_distances_from_csv: {str(e)}")
         logger.error(traceback.format_exc())
@@ -1,4 +1,5 @@
 import os
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
@@ -10,8 +11,16 @@ from ..config.loggers import get_and_set_logger
 from ..urls.viz import viz_router
 from ..urls.distances import distances_router
 from ..urls.browser import browser_router
+from ..services.executors import shutdown_executors, worker_pool
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Spawn the worker processes once, instead of a pool per use_worker request
+    worker_pool.start()
+    yield
+    shutdown_executors()
+
+app = FastAPI(lifespan=lifespan)
 
 # Mount static directories dynamically from config
 for dir_name, config in DIRECTORY_CONFIG.items():
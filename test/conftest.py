@@ -0,0 +1,12 @@
+import pytest
+
+from app.services.executors import WorkerPool
+
+
+@pytest.fixture(scope="session")
+def pool():
+    """Two-process worker pool with small chunks, so every parallel path splits its work"""
+    pool = WorkerPool(processes=2, chunk_size=7)
+    pool.start()
+    yield pool
+    pool.shutdown()
@@ -6,21 +6,27 @@ import time
 from itertools import combinations
 from typing import List, Optional, Dict
 
+import numpy as np
 import polars as pl
 from app.models.distances import StringPair, CSVDistanceInput, ModelConfig
-from app.models.embeddings import model_registry, get_model
-from app.services.csvs import process_csv_for_distances, process_csv_distances
+from app.models.embeddings import BaseEmbeddingModel, model_registry, get_model
+from app.services.csvs import process_csv_for_distances, process_csv_distances, process_block, setup_blocks
+from app.services.distances.pairs import count_pairs, iter_pair_tiles
+from app.services.distances.parallel import SharedTokenMatrix, parallel_token_distances
+from app.services.distances.tokens import TokenMatrix, parse_token_distance_type
+from app.services.distances.results import DistanceResults
+from app.services.executors import WorkerPool, worker_pool, shutdown_executors
+from app.services.scheduler import BlockScheduler, estimate_block_cost
 
 
 
 def clear_embedding_caches():
-    """Clear the cache of all registered embedding models."""
+    """Clear the cache of all registered embedding models and detach their persistent stores."""
     print("Clearing embedding caches...")
-    for model_id in model_registry.list_models():
-        model = get_model(model_id)
-        if hasattr(model, 'cache') and isinstance(model.cache, dict):
-            model.cache.clear()
-            print(f"Cleared cache for model: {model_id}")
+    # The on-disk store would turn every run after the first into a warm run. Models
+    # that are not loaded yet stay unloaded.
+    model_registry.clear_caches(detach_stores=True)
+    print(f"Cleared caches and detached stores of models: {model_registry.list_models()}")
 
 async def benchmark_distances(
         df: pl.DataFrame,
@@ -60,10 +66,7 @@ async def benchmark_distances(
         separator=" "
     )
 
-    pairs = [
-        StringPair(string1=s1, string2=s2)
-        for s1, s2 in combinations(texts, 2)
-    ]
+    num_pairs = count_pairs(len(texts))
 
     for model_name in embedding_models:
         results[f"model_{model_name}"] = {}
@@ -90,13 +93,344 @@ async def benchmark_distances(
 
                 results[f"model_{model_name}"][f"worker_{use_worker}"][batch_size] = {
                     "total_time": end_time - start_time,
-                    "num_pairs": len(pairs),
-                    "avg_time_per_pair": (end_time - start_time) / len(pairs),
+                    "num_pairs": num_pairs,
+                    "avg_time_per_pair": (end_time - start_time) / max(num_pairs, 1),
                     "total_pairs_processed": distances.get("total_pairs", 0)
                 }
 
     return results
 
+class SyntheticEmbeddingModel(BaseEmbeddingModel):
+    """Embedding model returning random vectors, to time the cache paths without inference."""
+
+    def __init__(self, dim: int = 384):
+        super().__init__("synthetic")
+        self.dim = dim
+
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        return np.random.rand(len(texts), self.dim).astype(np.float32)
+
+def benchmark_cache_merge(
+        sizes: List[int] = [5000, 10000, 20000, 40000],
+        dim: int = 384
+) -> Dict:
+    """
+    Time the cache lookup and merge path of get_embeddings.
+
+    For each size, half of the texts are cached first so the call has to merge
+    cached and newly encoded rows, then the same call is repeated fully warm.
+    Linear scaling shows up as a flat time per text across sizes.
+
+    Args:
+        sizes (List[int]): Numbers of distinct texts to request
+        dim (int): Embedding dimension of the synthetic model
+
+    Returns:
+        Dict with timings per size
+    """
+    results = {}
+
+    for size in sizes:
+        model = SyntheticEmbeddingModel(dim)
+        texts = [f"text {i}" for i in range(size)]
+        model.get_embeddings(texts[::2], 32)
+
+        start_time = time.time()
+        model.get_embeddings(texts, 32)
+        half_warm_time = time.time() - start_time
+
+        start_time = time.time()
+        model.get_embeddings(texts, 32)
+        warm_time = time.time() - start_time
+
+        results[size] = {
+            "half_warm_time": half_warm_time,
+            "warm_time": warm_time,
+            "us_per_text_half_warm": half_warm_time / size * 1e6,
+            "us_per_text_warm": warm_time / size * 1e6
+        }
+
+    return results
+
+def benchmark_onnx_backend(
+        num_texts: int = 2000,
+        torch_model_id: str = "minilm",
+        onnx_model_id: str = "minilm-onnx",
+        batch_size: int = 64
+) -> Dict:
+    """
+    Compare the ONNX Runtime backend of a model with its torch counterpart.
+
+    Both models encode the same cold texts; the report gives the encode speedup
+    and how far the ONNX cosine distances drift from the torch ones over all
+    pairs of the first 500 texts.
+
+    Args:
+        num_texts (int): Number of texts to encode
+        torch_model_id (str): Registered id of the reference torch model
+        onnx_model_id (str): Registered id of the ONNX model
+        batch_size (int): Batch size passed to get_embeddings
+
+    Returns:
+        Dict with encode times, speedup and distance drift
+    """
+    from app.services.distances.embeddings import normalize_embeddings, calculate_cosine_for_indices
+
+    df = generate_test_dataframe(num_texts, num_fields=1)
+    texts = list(dict.fromkeys(df["field_0"].to_list()))
+
+    timings = {}
+    embeddings = {}
+    for model_id in (torch_model_id, onnx_model_id):
+        model = get_model(model_id)
+        model.cache.clear()
+        model.store = None
+        model.get_embeddings(texts[:8], batch_size)  # warm up the runtime
+
+        model.cache.clear()
+        start_time = time.time()
+        embeddings[model_id] = model.get_embeddings(texts, batch_size)
+        timings[model_id] = time.time() - start_time
+
+    sample = min(len(texts), 500)
+    idx1, idx2 = np.triu_indices(sample, k=1)
+    reference = calculate_cosine_for_indices(normalize_embeddings(embeddings[torch_model_id][:sample]), idx1, idx2)
+    candidate = calculate_cosine_for_indices(normalize_embeddings(embeddings[onnx_model_id][:sample]), idx1, idx2)
+    drift = np.abs(candidate - reference)
+
+    return {
+        "num_texts": len(texts),
+        "torch_time": timings[torch_model_id],
+        "onnx_time": timings[onnx_model_id],
+        "speedup": timings[torch_model_id] / timings[onnx_model_id],
+        "mean_drift": float(drift.mean()),
+        "max_drift": float(drift.max()),
+        "rank_correlation": float(np.corrcoef(np.argsort(np.argsort(reference)), np.argsort(np.argsort(candidate)))[0, 1])
+    }
+
+def benchmark_precision(
+        num_texts: int = 3000,
+        dim: int = 384,
+        model_id: Optional[str] = None,
+        precisions: List[str] = ["float32", "float16", "int8"]
+) -> Dict:
+    """
+    Accuracy and cost of each embedding storage precision.
+
+    Embeddings come from `model_id` when given, otherwise from a synthetic
+    low-rank Gaussian that spreads the distances like real sentence embeddings.
+    For every precision the report gives the cache bytes per embedding, the
+    all-pairs cosine time of the production kernel (pair tiles streamed
+    through `calculate_cosine_for_indices`, as `calculate_all_distances`
+    does) and the distance error against float32.
+
+    Args:
+        num_texts (int): Number of embeddings
+        dim (int): Dimension of the synthetic embeddings
+        model_id (Optional[str]): Registered model to embed synthetic texts with
+        precisions (List[str]): Precisions to compare
+
+    Returns:
+        Dict with metrics per precision
+    """
+    from scipy.stats import spearmanr
+    from app.models.embedding_cache import EmbeddingCache
+    from app.services.distances.embeddings import prepare_cosine_embeddings, calculate_cosine_for_indices
+
+    if model_id is not None:
+        df = generate_test_dataframe(num_texts, num_fields=1)
+        embeddings = get_model(model_id).get_embeddings(df["field_0"].to_list(), 64)
+    else:
+        rng = np.random.default_rng(0)
+        embeddings = (rng.standard_normal((num_texts, 32)) @ rng.standard_normal((32, dim))
+                      + 0.5 * rng.standard_normal((num_texts, dim))).astype(np.float32)
+
+    results = {}
+    reference = None
+    for precision in precisions:
+        cache = EmbeddingCache(precision=precision)
+        for i, embedding in enumerate(embeddings):
+            cache.put(str(i), embedding)
+
+        start_time = time.time()
+        prepared = prepare_cosine_embeddings(embeddings, precision)
+        condensed = np.concatenate([
+            calculate_cosine_for_indices(prepared, idx1, idx2)
+            for idx1, idx2 in iter_pair_tiles(len(embeddings))
+        ])
+        elapsed = time.time() - start_time
+
+        if reference is None:
+            reference = condensed
+        error = np.abs(condensed - reference)
+        sample = np.random.default_rng(1).choice(condensed.size, min(condensed.size, 200000), replace=False)
+
+        results[precision] = {
+            "bytes_per_embedding": cache.resident_bytes / len(cache),
+            "all_pairs_time": elapsed,
+            "mean_abs_error": float(error.mean()),
+            "max_abs_error": float(error.max()),
+            "rank_correlation": float(spearmanr(reference[sample], condensed[sample])[0])
+        }
+
+    return results
+
+def benchmark_pair_representation(sizes: List[int] = [500, 1000, 2000]) -> Dict:
+    """
+    Compare the cost of enumerating all pairs as StringPair models and as index tiles.
+
+    Args:
+        sizes (List[int]): Numbers of unique strings
+
+    Returns:
+        Dict mapping each size to the per-pair cost of both representations
+    """
+    results = {}
+    for size in sizes:
+        texts = [f"string {i}" for i in range(size)]
+        num_pairs = count_pairs(size)
+
+        start_time = time.time()
+        pairs = [StringPair(string1=s1, string2=s2) for s1, s2 in combinations(texts, 2)]
+        DistanceResults.from_pairs(pairs, texts)
+        model_time = time.time() - start_time
+        del pairs
+
+        start_time = time.time()
+        for idx1, idx2 in iter_pair_tiles(size):
+            DistanceResults(texts, idx1, idx2)
+        tile_time = time.time() - start_time
+
+        results[size] = {
+            "num_pairs": num_pairs,
+            "us_per_pair_models": model_time / num_pairs * 1e6,
+            "us_per_pair_tiles": tile_time / num_pairs * 1e6,
+            "speedup": model_time / tile_time if tile_time > 0 else float("inf")
+        }
+
+    return results
+
+def benchmark_csv_preprocessing(row_counts: List[int] = [10000, 100000]) -> Dict:
+    """
+    Time deduplication and counting of CSV rows in process_csv_for_distances.
+
+    Args:
+        row_counts (List[int]): Numbers of rows to preprocess
+
+    Returns:
+        Dict mapping each row count to its timing and number of unique strings
+    """
+    results = {}
+    for num_rows in row_counts:
+        df = generate_test_dataframe(num_rows, num_fields=2)
+
+        start_time = time.time()
+        texts, _, _ = process_csv_for_distances(df, fields=["field_0"], separator=" ")
+        results[num_rows] = {
+            "time": time.time() - start_time,
+            "unique_strings": len(texts)
+        }
+
+    return results
+
+def benchmark_token_workers(
+        num_texts: int = 3000,
+        worker_counts: List[int] = [1, 2, 4, 8],
+        distance_type: str = "jaccard_words"
+) -> Dict:
+    """
+    Time all-pairs token distances on worker pools of increasing size against the sequential kernel.
+
+    Args:
+        num_texts (int): Number of unique strings
+        worker_counts (List[int]): Worker pool sizes to compare
+        distance_type (str): Token distance type
+
+    Returns:
+        Dict mapping "sequential" and each worker count to its timing
+    """
+    df = generate_test_dataframe(num_texts * 2, num_fields=1)
+    texts = list(dict.fromkeys(df["field_0"].to_list()))[:num_texts]
+    token_matrix = TokenMatrix.build(texts, *parse_token_distance_type(distance_type))
+    num_pairs = count_pairs(len(texts))
+
+    start_time = time.time()
+    expected = [token_matrix.distances(idx1, idx2) for idx1, idx2 in iter_pair_tiles(len(texts))]
+    sequential_time = time.time() - start_time
+    results = {"sequential": {"time": sequential_time, "num_pairs": num_pairs, "speedup": 1.0}}
+
+    shared_tokens = SharedTokenMatrix(token_matrix)
+    try:
+        for workers in worker_counts:
+            pool = WorkerPool(processes=workers)
+            pool.start()
+            try:
+                # Warm up so process start-up and imports are not timed
+                parallel_token_distances(shared_tokens, *next(iter_pair_tiles(len(texts))), pool)
+
+                start_time = time.time()
+                distances = [
+                    parallel_token_distances(shared_tokens, idx1, idx2, pool)
+                    for idx1, idx2 in iter_pair_tiles(len(texts))
+                ]
+                worker_time = time.time() - start_time
+            finally:
+                pool.shutdown()
+
+            results[workers] = {
+                "time": worker_time,
+                "num_pairs": num_pairs,
+                "speedup": sequential_time / worker_time if worker_time > 0 else float("inf"),
+                "matches": all(np.allclose(a, b) for a, b in zip(expected, distances))
+            }
+    finally:
+        shared_tokens.close()
+
+    return results
+
+async def benchmark_block_scheduler(
+        num_rows: int = 2000,
+        concurrencies: List[int] = [1, 4],
+        use_worker: bool = False
+) -> Dict:
+    """
+    Time a blocked CSV run with distances and clustering at several block concurrencies.
+
+    Args:
+        num_rows (int): Number of rows, split into blocks by the first word of field_0
+        concurrencies (List[int]): Numbers of blocks processed at once (1 is the sequential loop)
+        use_worker (bool): Cluster the blocks in the worker pool
+
+    Returns:
+        Dict mapping each concurrency to its timing
+    """
+    df = generate_test_dataframe(num_rows, num_fields=1)
+    df = df.with_columns(pl.col("field_0").str.split(" ").list.get(0).alias("subject"))
+    input_data = CSVDistanceInput(
+        fields=["field_0"],
+        blocking_keys=["subject"],
+        distance_types=["levenshtein", "jaccard_words"],
+        clustering=True,
+        use_worker=use_worker
+    )
+    blocks = list(enumerate(setup_blocks(df, input_data.blocking_keys)))
+    costs = [estimate_block_cost(block_df.height) for _, block_df in blocks]
+
+    results = {}
+    for concurrency in concurrencies:
+        start_time = time.time()
+        outcomes = await BlockScheduler(concurrency=concurrency).run(
+            lambda block: process_block(block[0], block[1], input_data),
+            blocks,
+            costs
+        )
+        results[concurrency] = {
+            "time": time.time() - start_time,
+            "blocks": sum(outcome is not None for outcome in outcomes)
+        }
+
+    return results
+
 def generate_test_dataframe(num_rows: int, num_fields: int = 3) -> pl.DataFrame:
     """
     Generate a synthetic DataFrame with diverse text data for testing
@@ -134,6 +468,51 @@ async def run_benchmarks():
     row_sizes = [10, 100, 1000]  # Adjusted sizes for quicker testing
     embedding_models = ["minilm"]  # Using available model
 
+    print("\n--- Benchmarking embedding cache merge ---")
+    for size, metrics in benchmark_cache_merge().items():
+        print(f"  {size} texts: half warm {metrics['half_warm_time']:.4f}s "
+              f"({metrics['us_per_text_half_warm']:.2f} us/text), "
+              f"warm {metrics['warm_time']:.4f}s ({metrics['us_per_text_warm']:.2f} us/text)")
+
+    print("\n--- Benchmarking pair representation ---")
+    for size, metrics in benchmark_pair_representation().items():
+        print(f"  {size} strings ({metrics['num_pairs']} pairs): StringPair {metrics['us_per_pair_models']:.3f} us/pair, "
+              f"index tiles {metrics['us_per_pair_tiles']:.4f} us/pair, speedup {metrics['speedup']:.0f}x")
+
+    print("\n--- Benchmarking CSV preprocessing ---")
+    for num_rows, metrics in benchmark_csv_preprocessing().items():
+        print(f"  {num_rows} rows: {metrics['time']:.4f}s, {metrics['unique_strings']} unique strings")
+
+    print("\n--- Benchmarking token distance workers ---")
+    for workers, metrics in benchmark_token_workers().items():
+        label = workers if workers == "sequential" else f"{workers} workers"
+        matches = "" if "matches" not in metrics else f", matches sequential: {metrics['matches']}"
+        print(f"  {label}: {metrics['time']:.4f}s for {metrics['num_pairs']} pairs, "
+              f"speedup {metrics['speedup']:.2f}x{matches}")
+
+    print("\n--- Benchmarking block scheduler ---")
+    for use_worker in [False, True]:
+        for concurrency, metrics in (await benchmark_block_scheduler(use_worker=use_worker)).items():
+            print(f"  use_worker={use_worker}, {concurrency} blocks at once: {metrics['time']:.4f}s "
+                  f"for {metrics['blocks']} blocks")
+
+    print("\n--- Embedding precision accuracy report ---")
+    for precision, metrics in benchmark_precision().items():
+        print(f"  {precision}: {metrics['bytes_per_embedding']:.0f} bytes/embedding, "
+              f"all-pairs {metrics['all_pairs_time']:.4f}s, "
+              f"error mean {metrics['mean_abs_error']:.6f} max {metrics['max_abs_error']:.6f}, "
+              f"rank correlation {metrics['rank_correlation']:.6f}")
+
+    print("\n--- Benchmarking ONNX Runtime backend ---")
+    try:
+        metrics = benchmark_onnx_backend()
+        print(f"  {metrics['num_texts']} texts: torch {metrics['torch_time']:.4f}s, "
+              f"onnx {metrics['onnx_time']:.4f}s, speedup {metrics['speedup']:.2f}x")
+        print(f"  Cosine distance drift: mean {metrics['mean_drift']:.6f}, max {metrics['max_drift']:.6f}, "
+              f"rank correlation {metrics['rank_correlation']:.6f}")
+    except ImportError as e:
+        print(f"  Skipped: {e}")
+
     for rows in row_sizes:
         # Clear embedding caches before each test
         clear_embedding_caches()
@@ -159,5 +538,13 @@ async def run_benchmarks():
                     print(f"    Pairs Processed: {metrics['total_pairs_processed']}")
                     print(f"    Avg Time per Pair: {metrics['avg_time_per_pair']:.6f} seconds")
 
+        print("\nEmbedding cache stats:")
+        for model_id, stats in model_registry.cache_stats().items():
+            print(f"  {model_id}: {stats}")
+
 if __name__ == "__main__":
-    asyncio.run(run_benchmarks())
\ No newline at end of file
+    worker_pool.start()
+    try:
+        asyncio.run(run_benchmarks())
+    finally:
+        shutdown_executors()
\ No newline at end of file
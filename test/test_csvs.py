@@ -0,0 +1,61 @@
+import random
+from collections import Counter
+
+import polars as pl
+
+from app.models.distances import CSVDistanceInput
+from app.services.csvs import process_csv_for_distances
+from app.services.uploads import csv_columns, scan_csv_columns
+
+
+def make_dataframe(num_rows: int = 2000) -> pl.DataFrame:
+    rng = random.Random(0)
+    return pl.DataFrame({
+        "brand": [rng.choice(["ford", "audi", "kia", None]) for _ in range(num_rows)],
+        "model": [rng.choice(["a", "b", "c"]) for _ in range(num_rows)],
+        "year": [rng.randint(2000, 2004) for _ in range(num_rows)]
+    })
+
+
+def test_csv_rows_are_deduplicated_and_counted_in_first_appearance_order():
+    """Test the grouped strings, counts and preserved fields against a row-by-row reference"""
+    df = make_dataframe()
+    rows = [
+        (f"{brand} {model}", index)
+        for index, (brand, model) in enumerate(zip(df["brand"].to_list(), df["model"].to_list()))
+        if brand is not None
+    ]
+    counts = Counter(text for text, _ in rows)
+    first_rows = {}
+    for text, index in rows:
+        first_rows.setdefault(text, index)
+
+    texts, preserved_fields, string_counts = process_csv_for_distances(df, ["brand", "model"])
+
+    assert texts == list(first_rows)
+    assert string_counts.tolist() == [counts[text] for text in texts]
+    assert preserved_fields.columns == df.columns
+    for field in df.columns:
+        assert preserved_fields[field].to_list() == [df[field][first_rows[text]] for text in texts]
+
+
+def test_csv_separator_joins_fields():
+    """Test that the separator is used between field values"""
+    df = pl.DataFrame({"a": ["x", "x", "y"], "b": ["1", "1", "2"]})
+
+    texts, _, string_counts = process_csv_for_distances(df, ["a", "b"], separator="|")
+
+    assert texts == ["x|1", "y|2"]
+    assert string_counts.tolist() == [2, 1]
+
+
+def test_csv_columns_are_projected_only_on_request(tmp_path):
+    """Test that every column is read by default, and only the listed ones when preserved_columns is given"""
+    path = tmp_path / "cars.csv"
+    make_dataframe(20).write_csv(path)
+
+    default = CSVDistanceInput(fields=["brand", "model"])
+    projected = CSVDistanceInput(fields=["brand", "model"], blocking_keys=["model"], preserved_columns=[])
+
+    assert scan_csv_columns(path, csv_columns(default)).columns == ["brand", "model", "year"]
+    assert scan_csv_columns(path, csv_columns(projected)).columns == ["brand", "model"]
@@ -0,0 +1,112 @@
+import random
+from itertools import combinations
+
+import numpy as np
+import pytest
+from rapidfuzz.distance import Levenshtein
+from scipy.spatial.distance import squareform
+
+from app.services.distances.condensed import condensed_positions, condensed_size, condensed_to_square
+from app.services.distances.levenshtein import calculate_levenshtein_distance, calculate_levenshtein_for_indices
+from app.services.distances.pairs import count_pairs, iter_pair_tiles, upper_triangle_rows
+from app.services.distances.results import DistanceResults
+
+
+def random_texts(n: int = 60):
+    rng = random.Random(0)
+    texts = ["", "a", "straße", "strasse"]
+    while len(texts) < n:
+        texts.append("".join(rng.choice("abcde ") for _ in range(rng.randint(1, 25))))
+    return texts
+
+
+def test_levenshtein_kernel_matches_per_pair_function():
+    """Test the cdist (dense) and cpdist (sparse) paths against rapidfuzz's per-pair distance"""
+    texts = random_texts()
+    dense = np.triu_indices(len(texts), k=1)
+    sparse_pairs = (np.arange(len(texts) - 1), np.arange(1, len(texts)))
+
+    for idx1, idx2 in [dense, sparse_pairs]:
+        normalized, raw = calculate_levenshtein_for_indices(texts, idx1, idx2, tile_size=16)
+        expected = [calculate_levenshtein_distance((texts[i], texts[j]))["distances"] for i, j in zip(idx1, idx2)]
+
+        assert raw.dtype == np.int32
+        assert raw.tolist() == [Levenshtein.distance(texts[i], texts[j]) for i, j in zip(idx1, idx2)]
+        assert raw.tolist() == [distances["levenshtein_raw"] for distances in expected]
+        np.testing.assert_allclose(normalized, [distances["levenshtein"] for distances in expected])
+
+
+def test_condensed_to_square_matches_squareform():
+    """Test the condensed expansion and condensed positions against scipy"""
+    for n in [2, 3, 17]:
+        condensed = np.random.default_rng(n).random(condensed_size(n))
+        square = condensed_to_square(condensed, dtype=np.float64)
+
+        np.testing.assert_array_equal(square, squareform(condensed))
+        assert condensed_to_square(condensed, n).dtype == np.float32
+
+        idx1, idx2 = np.triu_indices(n, k=1)
+        np.testing.assert_array_equal(condensed_positions(idx1, idx2, n), np.arange(condensed_size(n)))
+
+
+def test_condensed_to_square_rejects_a_wrong_length():
+    """Test that a vector that does not match n points raises ValueError"""
+    with pytest.raises(ValueError):
+        condensed_to_square(np.zeros(5), 4)
+
+
+def test_pair_tiles_enumerate_combinations_in_condensed_order():
+    """Test that all-pairs tiles concatenate to itertools.combinations and consecutive tiles to (i, i + 1)"""
+    for n, tile_size in [(2, 1), (13, 5), (13, 1000), (40, 64)]:
+        tiles = list(iter_pair_tiles(n, tile_size=tile_size))
+        idx1 = np.concatenate([tile[0] for tile in tiles])
+        idx2 = np.concatenate([tile[1] for tile in tiles])
+
+        assert list(zip(idx1.tolist(), idx2.tolist())) == list(combinations(range(n), 2))
+        assert len(idx1) == count_pairs(n)
+        assert all(tile[0].dtype == np.int32 for tile in tiles)
+
+        consecutive = list(iter_pair_tiles(n, "consecutive", tile_size))
+        idx1 = np.concatenate([tile[0] for tile in consecutive])
+        idx2 = np.concatenate([tile[1] for tile in consecutive])
+        assert idx1.tolist() == list(range(n - 1))
+        np.testing.assert_array_equal(idx2, idx1 + 1)
+        assert len(idx1) == count_pairs(n, "consecutive")
+
+
+def test_upper_triangle_rows_recognizes_all_pairs_tiles_only():
+    """Test that all-pairs tiles map to their row range and any other pair set to None"""
+    n = 13
+    for idx1, idx2 in iter_pair_tiles(n, tile_size=20):
+        start_row, stop_row = upper_triangle_rows(n, idx1, idx2)
+        assert (start_row, stop_row) == (int(idx1[0]), int(idx1[-1]) + 1)
+
+    idx1, idx2 = next(iter_pair_tiles(n, tile_size=20))
+    assert upper_triangle_rows(n, idx1[:-1], idx2[:-1]) is None
+    assert upper_triangle_rows(n, idx1[::-1], idx2[::-1]) is None
+    assert upper_triangle_rows(n, idx1, idx2[::-1]) is None
+    consecutive = next(iter_pair_tiles(n, "consecutive"))
+    assert upper_triangle_rows(n, *consecutive) is None
+    assert upper_triangle_rows(n, idx1[:0], idx2[:0]) is None
+
+def test_streamed_tiles_fill_the_allocated_results():
+    """Test that tiles written into an allocated result set equal the columns computed in one go"""
+    texts = random_texts(30)
+    results = DistanceResults.allocate(texts, count_pairs(len(texts)))
+
+    position = 0
+    for idx1, idx2 in iter_pair_tiles(len(texts), tile_size=50):
+        normalized, raw = calculate_levenshtein_for_indices(texts, idx1, idx2)
+        position = results.write(position, idx1, idx2, {"levenshtein": normalized, "levenshtein_raw": raw})
+
+    idx1, idx2 = np.triu_indices(len(texts), k=1)
+    normalized, raw = calculate_levenshtein_for_indices(texts, idx1, idx2)
+    assert position == len(results)
+    np.testing.assert_array_equal(results.idx1, idx1)
+    np.testing.assert_array_equal(results.idx2, idx2)
+    np.testing.assert_array_equal(results.distances["levenshtein"], normalized)
+    np.testing.assert_array_equal(results.distances["levenshtein_raw"], raw)
+    assert results.distances["levenshtein_raw"].dtype == np.int32
+
+    with pytest.raises(ValueError):
+        results.write(position, idx1[:1], idx2[:1], {})
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from scipy.spatial.distance import pdist
+
+from app.models.embedding_cache import EmbeddingCache
+from app.models.embedding_precision import PRECISIONS, QuantizedEmbeddings, check_precision
+from app.services.distances.embeddings import calculate_cosine_for_indices, prepare_cosine_embeddings
+from app.services.distances.pairs import iter_pair_tiles, upper_triangle_rows
+from app.services.distances.parallel import SharedEmbeddings, parallel_cosine_distances, parallel_cosine_rows
+
+# Largest cosine distance error tolerated at each storage precision
+TOLERANCES = {"float32": 1e-5, "float16": 2e-3, "int8": 2e-2}
+
+
+def random_embeddings(n: int = 120, dim: int = 64) -> np.ndarray:
+    return np.random.default_rng(0).standard_normal((n, dim)).astype(np.float32)
+
+
+@pytest.mark.parametrize("precision", PRECISIONS)
+def test_quantized_rows_round_trip(precision):
+    """Test that rows decoded from every storage precision stay close to the float32 originals"""
+    embeddings = random_embeddings()
+    quantized = QuantizedEmbeddings.quantize(embeddings, precision)
+
+    assert quantized.precision == precision
+    assert quantized.shape == embeddings.shape
+    np.testing.assert_allclose(quantized.decode(), embeddings, atol=np.abs(embeddings).max() / 100)
+    np.testing.assert_array_equal(quantized.rows(10, 20), quantized.decode()[10:20])
+    np.testing.assert_array_equal(quantized.take([3, 1, 3]), quantized.decode()[[3, 1, 3]])
+
+
+def test_reduced_precisions_shrink_storage():
+    """Test that float16 halves and int8 roughly quarters the resident bytes"""
+    embeddings = random_embeddings()
+    nbytes = {precision: QuantizedEmbeddings.quantize(embeddings, precision).nbytes for precision in PRECISIONS}
+
+    assert nbytes["float16"] * 2 == nbytes["float32"]
+    assert nbytes["int8"] < nbytes["float32"] / 3
+
+
+@pytest.mark.parametrize("precision", PRECISIONS)
+def test_cosine_kernel_matches_scipy_at_every_precision(precision):
+    """Test the tiled (dense) and row-wise (sparse) cosine paths against scipy's pdist"""
+    embeddings = random_embeddings()
+    expected = pdist(embeddings, "cosine")
+    prepared = prepare_cosine_embeddings(embeddings, precision)
+
+    # All-pairs tiles as calculate_all_distances streams them
+    tiles = [
+        calculate_cosine_for_indices(prepared, idx1, idx2, tile_size=32)
+        for idx1, idx2 in iter_pair_tiles(len(embeddings), tile_size=1000)
+    ]
+    np.testing.assert_allclose(np.concatenate(tiles), expected, atol=TOLERANCES[precision])
+
+    idx1, idx2 = np.triu_indices(len(embeddings), k=1)
+    sparse_pairs = np.arange(0, len(idx1), 97)
+    np.testing.assert_allclose(
+        calculate_cosine_for_indices(prepared, idx1[sparse_pairs], idx2[sparse_pairs]),
+        expected[sparse_pairs],
+        atol=TOLERANCES[precision]
+    )
+
+
+@pytest.mark.parametrize("precision", PRECISIONS)
+def test_cache_returns_float32_at_every_precision(precision):
+    """Test that the memory cache decodes entries kept at reduced precision back to float32"""
+    embedding = random_embeddings(1)[0]
+    cache = EmbeddingCache(precision=precision)
+    cache.put("text", embedding)
+
+    cached = cache.get("text")
+    assert cached.dtype == np.float32
+    np.testing.assert_allclose(cached, embedding, atol=np.abs(embedding).max() / 100)
+    assert cache.stats()["precision"] == precision
+
+
+def test_unknown_precision_is_rejected():
+    """Test that an unsupported precision raises ValueError"""
+    with pytest.raises(ValueError):
+        check_precision("bfloat16")
+
+
+@pytest.mark.parametrize("precision", PRECISIONS)
+def test_parallel_cosine_matches_sequential(pool, precision):
+    """Test the worker-pool cosine paths (row ranges for all-pairs tiles, pair ranges for sparse ones)"""
+    prepared = prepare_cosine_embeddings(random_embeddings(), precision)
+    shared_embeddings = SharedEmbeddings(prepared)
+    try:
+        for idx1, idx2 in iter_pair_tiles(len(prepared), tile_size=1000):
+            row_range = upper_triangle_rows(len(prepared), idx1, idx2)
+            np.testing.assert_allclose(
+                parallel_cosine_rows(shared_embeddings, *row_range, pool),
+                calculate_cosine_for_indices(prepared, idx1, idx2),
+                atol=1e-6
+            )
+
+        idx1, idx2 = np.arange(len(prepared) - 1), np.arange(1, len(prepared))
+        np.testing.assert_allclose(
+            parallel_cosine_distances(shared_embeddings, idx1, idx2, pool),
+            calculate_cosine_for_indices(prepared, idx1, idx2),
+            atol=1e-6
+        )
+    finally:
+        shared_embeddings.close()
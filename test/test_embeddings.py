@@ -0,0 +1,176 @@
+import zlib
+from typing import List
+
+import numpy as np
+import pytest
+
+from app.models.embedding_store import EmbeddingStore
+from app.models.embeddings import (
+    BaseEmbeddingModel,
+    EmbeddingModelRegistry,
+    build_token_budget_batches,
+    encode_in_token_budget_batches
+)
+
+
+class RecordingEmbeddingModel(BaseEmbeddingModel):
+    """Deterministic model (one seeded vector per text) that records what it encodes"""
+
+    def __init__(self, dim: int = 8):
+        super().__init__("recording")
+        self.dim = dim
+        self.encoded: List[str] = []
+
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        self.encoded.extend(texts)
+        return np.stack([expected_embedding(text, self.dim) for text in texts])
+
+
+def expected_embedding(text: str, dim: int = 8) -> np.ndarray:
+    return np.random.default_rng(zlib.crc32(text.encode())).random(dim).astype(np.float32)
+
+
+def test_get_embeddings_merges_cached_and_new_rows_in_input_order():
+    """Test that a half-cached call returns every row in input order and encodes only the misses"""
+    model = RecordingEmbeddingModel()
+    texts = [f"text {i}" for i in range(200)]
+    model.get_embeddings(texts[::2], 32)
+    model.encoded.clear()
+
+    embeddings = model.get_embeddings(texts, 32)
+
+    assert model.encoded == texts[1::2]
+    np.testing.assert_array_equal(embeddings, np.stack([expected_embedding(text) for text in texts]))
+
+
+def test_get_embeddings_encodes_duplicates_once():
+    """Test that repeated texts are encoded once and returned at every position"""
+    model = RecordingEmbeddingModel()
+    texts = ["b", "a", "b", "c", "a", "b"]
+
+    embeddings = model.get_embeddings(texts, 32)
+
+    assert model.encoded == ["b", "a", "c"]
+    assert embeddings.shape == (len(texts), model.dim)
+    np.testing.assert_array_equal(embeddings, np.stack([expected_embedding(text) for text in texts]))
+
+
+def test_get_embeddings_fully_cached():
+    """Test that a warm call encodes nothing and returns the same rows"""
+    model = RecordingEmbeddingModel()
+    texts = [f"text {i}" for i in range(50)]
+    first = model.get_embeddings(texts, 32)
+    model.encoded.clear()
+
+    second = model.get_embeddings(texts[::-1], 32)
+
+    assert model.encoded == []
+    np.testing.assert_array_equal(second, first[::-1])
+
+
+def test_token_budget_batches_cover_every_text_under_budget():
+    """Test that length-sorted batches hold every position once and stay under the padded-token budget"""
+    lengths = np.random.default_rng(0).integers(1, 60, size=500)
+    budget = 256
+
+    batches = build_token_budget_batches(lengths, budget)
+
+    assert sorted(np.concatenate(batches).tolist()) == list(range(len(lengths)))
+    for batch in batches:
+        assert len(batch) * lengths[batch].max() <= budget
+        # Members are in decreasing length order
+        assert (np.diff(lengths[batch]) <= 0).all()
+
+
+def test_token_budget_batches_isolate_long_texts():
+    """Test that a text longer than the budget gets a batch of its own"""
+    batches = build_token_budget_batches(np.array([5, 100, 5, 5]), 20)
+
+    assert [batch.tolist() for batch in batches] == [[1], [0, 2, 3]]
+
+
+class FakeTokenizer:
+    """Word tokenizer with the `__call__` / `pad` interface of a HuggingFace tokenizer"""
+
+    def __call__(self, texts, truncation=True, max_length=512):
+        return {"input_ids": [list(range(1, len(text.split()) + 1))[:max_length] for text in texts]}
+
+    def pad(self, features, return_tensors=None):
+        width = max(len(feature["input_ids"]) for feature in features)
+        return np.array([feature["input_ids"] + [0] * (width - len(feature["input_ids"])) for feature in features])
+
+
+def test_encode_in_token_budget_batches_restores_input_order():
+    """Test that rows pooled in length-sorted batches come back in input order"""
+    texts = [" ".join(["w"] * length) for length in [3, 9, 1, 7, 3, 12, 2]]
+    widths = []
+
+    def forward(inputs):
+        widths.append(inputs.shape[1])
+        # One row per text holding its unpadded length (padding ids are 0)
+        return (inputs > 0).sum(axis=1, keepdims=True).astype(np.float32)
+
+    embeddings = encode_in_token_budget_batches(FakeTokenizer(), texts, forward, max_batch_tokens=16, max_length=512)
+
+    np.testing.assert_array_equal(embeddings[:, 0], [len(text.split()) for text in texts])
+    assert widths == sorted(widths, reverse=True)
+
+
+def test_store_round_trip_across_instances(tmp_path):
+    """Test that a second store instance reads back what the first wrote, in input order"""
+    texts = [f"text {i}" for i in range(20)]
+    embeddings = np.stack([expected_embedding(text) for text in texts])
+    EmbeddingStore("recording", root=tmp_path, shard_rows=8).put_many(texts[:15], embeddings[:15])
+
+    found, stored = EmbeddingStore("recording", root=tmp_path).get_many(texts[::-1])
+
+    assert found.tolist() == [False] * 5 + [True] * 15
+    np.testing.assert_array_equal(stored, embeddings[:15][::-1])
+
+
+def test_store_rejects_a_different_dimension(tmp_path):
+    """Test that rows of another dimension cannot be added to a store"""
+    store = EmbeddingStore("recording", root=tmp_path)
+    store.put_many(["a"], np.zeros((1, 8), dtype=np.float32))
+
+    with pytest.raises(ValueError):
+        store.put_many(["b"], np.zeros((1, 4), dtype=np.float32))
+
+
+def test_get_embeddings_reads_the_store_before_encoding(tmp_path):
+    """Test that a model with a fresh memory cache encodes only texts missing from the store"""
+    texts = [f"text {i}" for i in range(10)]
+    first = RecordingEmbeddingModel()
+    first.store = EmbeddingStore("recording", root=tmp_path)
+    first.get_embeddings(texts[:6], 32)
+
+    second = RecordingEmbeddingModel()
+    second.store = EmbeddingStore("recording", root=tmp_path)
+    embeddings = second.get_embeddings(texts, 32)
+
+    assert second.encoded == texts[6:]
+    np.testing.assert_array_equal(embeddings, np.stack([expected_embedding(text) for text in texts]))
+
+
+def test_clear_caches_loads_no_model(tmp_path):
+    """Test that clearing the caches empties loaded and unloaded models' caches without building a model"""
+    registry = EmbeddingModelRegistry()
+    built = []
+
+    def factory():
+        built.append(RecordingEmbeddingModel())
+        return built[-1]
+
+    registry.register_factory("loaded", factory, persist=False, idle_ttl=None)
+    registry.register_factory("unloaded", factory, idle_ttl=None)
+    loaded = registry.get_model("loaded")
+    loaded.store = EmbeddingStore("recording", root=tmp_path)
+    loaded.get_embeddings(["a", "b"], 32)
+
+    registry.clear_caches(detach_stores=True)
+
+    assert len(built) == 1
+    assert loaded.store is None
+    assert registry.cache_stats()["loaded"]["entries"] == 0
+    # Built after the stores were detached, so without one
+    assert registry.get_model("unloaded").store is None
@@ -0,0 +1,62 @@
+import numpy as np
+import polars as pl
+
+from app.services.distances.results import DistanceResults, build_field_table
+
+
+def make_results(texts, pairs, fields=None) -> DistanceResults:
+    idx1, idx2 = zip(*pairs)
+    results = DistanceResults(texts, idx1, idx2, {"levenshtein": np.linspace(0, 1, len(pairs))})
+    results.fields = pl.DataFrame(fields) if fields is not None else None
+    return results
+
+
+def test_field_table_rows_point_at_each_pairs_strings():
+    """Test that row1 / row2 of every record index the preserved fields of its own strings"""
+    first = make_results(
+        ["a x", "b y", "c z"],
+        [(0, 1), (0, 2), (1, 2)],
+        {"name": ["a", "b", "c"], "code": ["x", "y", "z"]}
+    )
+    second = make_results(
+        ["d w", "e v"],
+        [(0, 1)],
+        {"name": ["d", "e"], "code": ["w", "v"]}
+    )
+
+    table, offsets = build_field_table([first, second])
+
+    assert offsets == [0, 3]
+    assert table == {"name": ["a", "b", "c", "d", "e"], "code": ["x", "y", "z", "w", "v"]}
+    for results, offset in zip([first, second], offsets):
+        for record in results.to_dicts(offset):
+            assert f"{table['name'][record['row1']]} {table['code'][record['row1']]}" == record["string1"]
+            assert f"{table['name'][record['row2']]} {table['code'][record['row2']]}" == record["string2"]
+
+
+def test_field_table_pads_missing_fields_and_skips_results_without_fields():
+    """Test that columns stay aligned when result sets carry different or no fields"""
+    first = make_results(["a", "b"], [(0, 1)], {"name": ["a", "b"]})
+    bare = make_results(["q", "r"], [(0, 1)])
+    second = make_results(["c", "d"], [(0, 1)], {"name": ["c", "d"], "extra": [1, 2]})
+
+    table, offsets = build_field_table([first, bare, second])
+
+    assert offsets == [0, 2, 2]
+    assert table == {"name": ["a", "b", "c", "d"], "extra": [None, None, 1, 2]}
+    assert "row1" not in bare.to_dicts(offsets[1])[0]
+
+
+def test_to_dicts_keeps_integer_and_float_columns():
+    """Test that integer counts stay ints and other columns come back as float64 values"""
+    results = DistanceResults(["ab", "abc", "b"], [0, 0], [1, 2])
+    results.update({
+        "levenshtein_raw": np.array([1, 2], dtype=np.int32),
+        "cosine": np.array([0.25, 0.5], dtype=np.float32)
+    })
+
+    assert results.distances["levenshtein_raw"].dtype == np.int32
+    assert results.distances["cosine"].dtype == np.float64
+    records = results.to_dicts()
+    assert records[0] == {"string1": "ab", "string2": "abc", "distances": {"levenshtein_raw": 1, "cosine": 0.25}}
+    assert isinstance(records[1]["distances"]["levenshtein_raw"], int)
@@ -0,0 +1,106 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.services.distances.block import BlockDistances, SharedBlockDistances
+from app.services.distances.knn import KNNGraph
+from app.services.scheduler import BlockScheduler, estimate_block_cost
+from app.services.shared_arrays import run_attached
+
+
+class RecordingProcess:
+    """Block task that records its start order and the blocks running next to each one"""
+
+    def __init__(self):
+        self.started = []
+        self.running = []
+        self.snapshots = []
+
+    async def __call__(self, item):
+        self.started.append(item)
+        self.running.append(item)
+        self.snapshots.append(list(self.running))
+        # Let the other tasks start before this one finishes
+        await asyncio.sleep(0.001 * (1 + item % 3))
+        self.running.remove(item)
+        return item * 10
+
+
+def test_blocks_run_largest_first_and_return_in_item_order():
+    """Test the start order, the results order and the concurrency limit"""
+    costs = [5, 50, 1, 20, 50, 8]
+    process = RecordingProcess()
+
+    results = asyncio.run(BlockScheduler(concurrency=2, cost_budget=1000).run(process, list(range(len(costs))), costs))
+
+    assert results == [item * 10 for item in range(len(costs))]
+    assert process.started == [1, 4, 3, 5, 0, 2]
+    assert max(len(snapshot) for snapshot in process.snapshots) == 2
+
+
+def test_blocks_stay_under_the_cost_budget():
+    """Test that running blocks never exceed the budget, and a block above it runs alone"""
+    costs = [40, 30, 30, 200, 10, 20]
+    process = RecordingProcess()
+
+    asyncio.run(BlockScheduler(concurrency=4, cost_budget=60).run(process, list(range(len(costs))), costs))
+
+    assert process.started[0] == 3
+    assert sorted(process.started) == list(range(len(costs)))
+    for snapshot in process.snapshots:
+        if 3 in snapshot:
+            assert snapshot == [3]
+        else:
+            assert sum(costs[item] for item in snapshot) <= 60
+
+
+def test_failing_block_cancels_the_others():
+    """Test that an exception propagates and the still-running blocks are cancelled"""
+    cancelled = []
+
+    async def process(item):
+        if item == 0:
+            raise ValueError("block failed")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(item)
+            raise
+
+    with pytest.raises(ValueError):
+        asyncio.run(BlockScheduler(concurrency=3).run(process, [0, 1, 2], [3, 2, 1]))
+    assert sorted(cancelled) == [1, 2]
+
+
+def test_block_cost_estimates():
+    """Test the estimated pairs of all-pairs and knn blocks"""
+    assert estimate_block_cost(100) == 100 * 99 // 2
+    assert estimate_block_cost(100, "knn", 15) == 1500
+
+
+def attached_block(condensed, data, indices, indptr, n, k, source):
+    block_distances = SharedBlockDistances.attach(condensed, data, indices, indptr, n, k, source)
+    if block_distances.is_graph:
+        return block_distances.knn_graph.graph.toarray(), block_distances.knn_graph.k, block_distances.source
+    return block_distances.square.copy(), None, block_distances.source
+
+
+def test_shared_block_distances_round_trip():
+    """Test that a worker attaching to shared block distances sees the same condensed vector or kNN graph"""
+    n = 12
+    condensed = np.random.default_rng(0).random(n * (n - 1) // 2).astype(np.float32)
+    for block_distances in [
+        BlockDistances(n, condensed=condensed, source="levenshtein"),
+        BlockDistances(n, knn_graph=KNNGraph.from_condensed(condensed, n, 3), source="minilm_cosine")
+    ]:
+        shared = SharedBlockDistances(block_distances)
+        try:
+            matrix, k, source = run_attached(attached_block, shared.handles, *shared.args)
+        finally:
+            shared.close()
+
+        expected = block_distances.knn_graph.graph.toarray() if block_distances.is_graph else block_distances.square
+        np.testing.assert_array_equal(matrix, expected)
+        assert k == (3 if block_distances.is_graph else None)
+        assert source == block_distances.source
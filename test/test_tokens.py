@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from app.services.distances import parallel
+from app.services.distances.pairs import iter_pair_tiles
+from app.services.distances.parallel import SharedTokenMatrix, parallel_token_distances, token_chunk
+from app.services.distances.tokens import TokenMatrix, calculate_token_distance, check_tokenization, parse_token_distance_type
+
+DISTANCE_TYPES = ["jaccard_words", "cosine_token_words", "jaccard_ngrams", "cosine_token_ngrams"]
+
+TEXTS = [
+    "apple iphone 12 pro max",
+    "iphone 12 pro max",
+    "apple iphone 12",
+    "samsung galaxy s21",
+    "galaxy s21 ultra samsung",
+    "pixel 6",
+    "apple apple iphone",
+    "pixel 6 pro",
+    "",
+    "nokia 3310"
+]
+
+
+def reference_distances(distance_type, idx1, idx2):
+    metric, tokenization = parse_token_distance_type(distance_type)
+    return np.array([
+        calculate_token_distance(TEXTS[i], TEXTS[j], metric, tokenization)["distance"]
+        for i, j in zip(idx1.tolist(), idx2.tolist())
+    ])
+
+
+@pytest.mark.parametrize("distance_type", DISTANCE_TYPES)
+def test_token_matrix_matches_per_pair_functions(distance_type):
+    """Test the sparse token engine on dense (all pairs) and sparse pair sets against the per-pair functions"""
+    token_matrix = TokenMatrix.build(TEXTS, *parse_token_distance_type(distance_type))
+    dense = np.triu_indices(len(TEXTS), k=1)
+    sparse_pairs = (np.array([0, 3, 9, 2]), np.array([5, 1, 4, 2]))
+
+    for idx1, idx2 in [dense, sparse_pairs]:
+        np.testing.assert_allclose(token_matrix.distances(idx1, idx2, tile_size=3), reference_distances(distance_type, idx1, idx2))
+
+
+def test_token_chunk_builds_the_matrix_once_per_key():
+    """Test that chunks of one block reuse the matrix the worker rebuilt for its key"""
+    token_matrix = TokenMatrix.build(TEXTS, "jaccard", "words")
+    matrix = token_matrix.matrix
+    idx1, idx2 = np.triu_indices(len(TEXTS), k=1)
+    out = np.zeros(len(idx1))
+    arrays = (matrix.data, matrix.indices, matrix.indptr, token_matrix.row_stats, idx1, idx2, out)
+    parallel._token_matrices.clear()
+
+    token_chunk(*arrays, 0, 20, "block", matrix.shape[1], "jaccard")
+    cached = parallel._token_matrices["block"]
+    token_chunk(*arrays, 20, len(idx1), "block", matrix.shape[1], "jaccard")
+
+    assert parallel._token_matrices["block"] is cached
+    np.testing.assert_allclose(out, reference_distances("jaccard_words", idx1, idx2))
+
+    for key in range(parallel.WORKER_TOKEN_MATRICES + 1):
+        token_chunk(*arrays, 0, 1, str(key), matrix.shape[1], "jaccard")
+    assert len(parallel._token_matrices) == parallel.WORKER_TOKEN_MATRICES
+    assert "block" not in parallel._token_matrices
+
+
+@pytest.mark.parametrize("distance_type", ["jaccard_words", "cosine_token_ngrams"])
+def test_parallel_token_distances_match_sequential(pool, distance_type):
+    """Test that token distances computed in chunks on the worker pool equal the sequential kernel"""
+    token_matrix = TokenMatrix.build(TEXTS, *parse_token_distance_type(distance_type))
+    shared_tokens = SharedTokenMatrix(token_matrix)
+    try:
+        for idx1, idx2 in iter_pair_tiles(len(TEXTS), tile_size=16):
+            np.testing.assert_array_equal(
+                parallel_token_distances(shared_tokens, idx1, idx2, pool),
+                token_matrix.distances(idx1, idx2)
+            )
+    finally:
+        shared_tokens.close()
+
+
+def test_mismatched_tokenization_is_only_logged(caplog):
+    """Test that the deprecated tokenization option is warned about, not rejected, and the default is silent"""
+    check_tokenization(["levenshtein", "jaccard_ngrams", "cosine_token_words"], "words")
+    assert not caplog.records
+
+    check_tokenization(["levenshtein", "jaccard_ngrams", "cosine_token_words"], "ngrams")
+    assert [record.levelname for record in caplog.records] == ["WARNING"]
+    assert "cosine_token_ngrams" in caplog.records[0].getMessage()